@@ -20,15 +20,19 @@ bind = os.environ.get("SS_GUNICORN_BIND", "127.0.0.1:8001")
 workers = os.environ.get("SS_GUNICORN_WORKERS", "1")
 
 # http://docs.gunicorn.org/en/stable/settings.html#worker-class
-# WARNING: if ``worker_class`` is set to ``'gevent'``, then
-# ``BAG_VALIDATION_NO_PROCESSES`` in settings/base.py *must* be set to 1.
-# Otherwise reingest will fail at bagit validate. See
-# https://github.com/artefactual/archivematica/issues/708
+# NOTE: if ``worker_class`` is set to ``'gevent'``, then bags are validated by
+# one process, whatever ``BAG_VALIDATION_NO_PROCESSES`` in settings/base.py
+# is. See https://github.com/artefactual/archivematica/issues/708
 worker_class = os.environ.get("SS_GUNICORN_WORKER_CLASS", "gevent")
 
 # http://docs.gunicorn.org/en/stable/settings.html#timeout
 timeout = os.environ.get("SS_GUNICORN_TIMEOUT", "172800")
 
+# http://docs.gunicorn.org/en/stable/settings.html#graceful-timeout
+# NOTE: must be more than ``SS_ASYNC_DRAIN_TIMEOUT`` so that the workers can
+# finish or cancel their asynchronous tasks before they are killed.
+graceful_timeout = os.environ.get("SS_GUNICORN_GRACEFUL_TIMEOUT", "90")
+
 # http://docs.gunicorn.org/en/stable/settings.html#reload
 reload = os.environ.get("SS_GUNICORN_RELOAD", "false")
 
@@ -53,6 +57,15 @@ proc_name = os.environ.get("SS_GUNICORN_PROC_NAME", "archivematica-storage-servi
 # http://docs.gunicorn.org/en/stable/settings.html#sendfile
 sendfile = os.environ.get("SS_GUNICORN_SENDFILE", "false")
 
+
+def worker_exit(server, worker):
+    # Finish or cancel the asynchronous tasks of the worker, which would
+    # otherwise be killed with it
+    from locations.models.async_manager import AsyncManager  # noqa
+
+    AsyncManager.drain()
+
+
 # If we're using more than one worker, collect stats in a tmpdir
 if os.environ.get("SS_PROMETHEUS_ENABLED") and workers != "1":
     prometheus_multiproc_dir = tempfile.mkdtemp(prefix="prometheus-stats")
@@ -0,0 +1,269 @@
+"""Kernel-assisted copies between local paths.
+
+Copying a package between two locally mounted spaces (or from a space into
+its staging area) does not need to stream every byte through ``rsync``. When
+both paths live on the same copy-on-write filesystem (XFS, Btrfs) the copy can
+be a ``FICLONE`` reflink, which completes in constant time, and on most other
+local filesystems ``copy_file_range`` or ``sendfile`` keep the data inside the
+kernel.
+
+``copy_path`` tries, in order, reflink, ``copy_file_range`` and ``sendfile``.
+The strategies that fail with an "unsupported" error for a given pair of
+devices are remembered so that later copies between the same pair of spaces go
+straight to the first strategy known to work. When no strategy is available
+``FastCopyUnsupported`` is raised and the caller is expected to fall back to
+rsync.
+"""
+
+from __future__ import absolute_import
+import errno
+import logging
+import os
+import stat
+import threading
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+import scandir
+
+from common import progress
+
+LOGGER = logging.getLogger(__name__)
+
+STRATEGY_REFLINK = "reflink"
+STRATEGY_COPY_FILE_RANGE = "copy_file_range"
+STRATEGY_SENDFILE = "sendfile"
+STRATEGIES = (STRATEGY_REFLINK, STRATEGY_COPY_FILE_RANGE, STRATEGY_SENDFILE)
+
+# From linux/fs.h: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+# Errors meaning "this strategy does not work between these devices", as
+# opposed to a genuine I/O failure (ENOSPC, EIO, ...) which is re-raised.
+UNSUPPORTED_ERRNOS = {
+    errno.EBADF,
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.ENOTTY,
+    errno.EOPNOTSUPP,
+    errno.EXDEV,
+}
+
+# Chunk size used by copy_file_range and sendfile.
+CHUNK_SIZE = 64 * 1024 * 1024
+
+# Same permissions rsync applies in Space.move_rsync with
+# --chmod=Fug+rw,o-rwx,Dug+rwx,o-rwx
+FILE_MODE_ADD = stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IWGRP
+DIR_MODE_ADD = stat.S_IRWXU | stat.S_IRWXG
+MODE_REMOVE = stat.S_IRWXO
+
+_unsupported = {}
+_preferred = {}
+_lock = threading.Lock()
+
+
+class FastCopyUnsupported(Exception):
+    """None of the kernel-assisted strategies can copy between two paths."""
+
+
+def _reflink(src_fd, dst_fd, size):
+    if fcntl is None:
+        raise OSError(errno.ENOSYS, "fcntl is not available")
+    fcntl.ioctl(dst_fd, FICLONE, src_fd)
+    progress.advance(size)
+
+
+def _copy_file_range(src_fd, dst_fd, size):
+    if not hasattr(os, "copy_file_range"):
+        raise OSError(errno.ENOSYS, "os.copy_file_range is not available")
+    copied = 0
+    while copied < size:
+        sent = os.copy_file_range(src_fd, dst_fd, min(CHUNK_SIZE, size - copied))
+        if sent == 0:
+            break
+        copied += sent
+        progress.advance(sent)
+
+
+def _sendfile(src_fd, dst_fd, size):
+    if not hasattr(os, "sendfile"):
+        raise OSError(errno.ENOSYS, "os.sendfile is not available")
+    copied = 0
+    while copied < size:
+        sent = os.sendfile(dst_fd, src_fd, copied, min(CHUNK_SIZE, size - copied))
+        if sent == 0:
+            break
+        copied += sent
+        progress.advance(sent)
+
+
+_IMPLEMENTATIONS = {
+    STRATEGY_REFLINK: _reflink,
+    STRATEGY_COPY_FILE_RANGE: _copy_file_range,
+    STRATEGY_SENDFILE: _sendfile,
+}
+
+
+def _candidate_strategies(device_pair):
+    with _lock:
+        unsupported = _unsupported.get(device_pair, set())
+        preferred = _preferred.get(device_pair)
+    candidates = [s for s in STRATEGIES if s not in unsupported]
+    if preferred in candidates:
+        candidates.remove(preferred)
+        candidates.insert(0, preferred)
+    return candidates
+
+
+def _mark(device_pair, strategy, supported):
+    with _lock:
+        if supported:
+            _preferred[device_pair] = strategy
+        else:
+            _unsupported.setdefault(device_pair, set()).add(strategy)
+
+
+def reset_detection():
+    """Forget which strategies work between which devices."""
+    with _lock:
+        _unsupported.clear()
+        _preferred.clear()
+
+
+def copy_file(source, destination):
+    """Copy the regular file ``source`` to ``destination``.
+
+    Modification time is preserved and permissions are adjusted the same way
+    rsync does it in ``Space.move_rsync``.
+
+    :returns: name of the strategy used.
+    :raises FastCopyUnsupported: if no strategy works for these paths.
+    """
+    src_stat = os.stat(source)
+    dest_dir = os.path.dirname(os.path.abspath(destination))
+    device_pair = (src_stat.st_dev, os.stat(dest_dir).st_dev)
+    candidates = _candidate_strategies(device_pair)
+    if not candidates:
+        raise FastCopyUnsupported(
+            "No copy strategy available from {} to {}".format(source, destination)
+        )
+    mode = (stat.S_IMODE(src_stat.st_mode) | FILE_MODE_ADD) & ~MODE_REMOVE
+    with open(source, "rb") as src_f:
+        for strategy in candidates:
+            with open(destination, "wb") as dst_f:
+                try:
+                    _IMPLEMENTATIONS[strategy](
+                        src_f.fileno(), dst_f.fileno(), src_stat.st_size
+                    )
+                except (IOError, OSError) as err:
+                    if err.errno not in UNSUPPORTED_ERRNOS:
+                        raise
+                    LOGGER.debug(
+                        "%s not supported for devices %s: %s",
+                        strategy,
+                        device_pair,
+                        err,
+                    )
+                    _mark(device_pair, strategy, False)
+                    continue
+                # E.g. the source was truncated while it was copied
+                copied = os.fstat(dst_f.fileno()).st_size
+                if copied != src_stat.st_size:
+                    raise IOError(
+                        errno.EIO,
+                        "Copied {} of the {} bytes of {} to {}".format(
+                            copied, src_stat.st_size, source, destination
+                        ),
+                    )
+            _mark(device_pair, strategy, True)
+            os.chmod(destination, mode)
+            os.utime(destination, (src_stat.st_atime, src_stat.st_mtime))
+            return strategy
+    try:
+        os.remove(destination)
+    except OSError:
+        pass
+    raise FastCopyUnsupported(
+        "No copy strategy available from {} to {}".format(source, destination)
+    )
+
+
+def _is_unchanged(source_stat, destination):
+    """Apply rsync's quick check: a destination file with the same size and
+    modification time as the source is not copied again. This lets an
+    interrupted copy resume with the files it had not finished."""
+    try:
+        dest_stat = os.stat(destination)
+    except OSError:
+        return False
+    return (
+        stat.S_ISREG(dest_stat.st_mode)
+        and dest_stat.st_size == source_stat.st_size
+        and int(dest_stat.st_mtime) == int(source_stat.st_mtime)
+    )
+
+
+def _copy_tree(source, destination):
+    src_stat = os.stat(source)
+    if not os.path.isdir(destination):
+        os.mkdir(destination)
+    strategies = set()
+    for entry in scandir.scandir(source):
+        dest_entry = os.path.join(destination, entry.name)
+        if entry.is_dir(follow_symlinks=False):
+            strategies.update(_copy_tree(entry.path, dest_entry))
+        elif entry.is_file(follow_symlinks=False):
+            entry_stat = entry.stat(follow_symlinks=False)
+            if _is_unchanged(entry_stat, dest_entry):
+                progress.advance(entry_stat.st_size)
+            else:
+                strategies.add(copy_file(entry.path, dest_entry))
+        else:
+            # rsync -r without -l/-D skips symlinks and special files too
+            LOGGER.debug("Skipping non-regular file %s", entry.path)
+    os.chmod(
+        destination, (stat.S_IMODE(src_stat.st_mode) | DIR_MODE_ADD) & ~MODE_REMOVE
+    )
+    os.utime(destination, (src_stat.st_atime, src_stat.st_mtime))
+    return strategies
+
+
+def copy_path(source, destination):
+    """Copy the file or directory ``source`` to ``destination``.
+
+    Trailing slashes are interpreted the way ``rsync -r`` does: a directory
+    source ending in a slash has its contents copied into ``destination``,
+    otherwise the directory itself is copied into ``destination`` if that is an
+    existing directory. A file is copied into ``destination`` if that ends in
+    a slash or is an existing directory.
+
+    Files already at the destination with the same size and modification
+    time are skipped, as rsync does.
+
+    :returns: set of the strategy names used.
+    :raises FastCopyUnsupported: if a file could not be copied using any of
+        the kernel-assisted strategies. Files copied before that remain at the
+        destination.
+    """
+    if os.path.isdir(source):
+        if not source.endswith(os.sep) and os.path.isdir(destination):
+            destination = os.path.join(
+                destination, os.path.basename(os.path.normpath(source))
+            )
+        return _copy_tree(os.path.normpath(source), os.path.normpath(destination))
+    source = source.rstrip(os.sep)
+    if destination.endswith(os.sep) or os.path.isdir(destination):
+        destination = os.path.join(destination, os.path.basename(source))
+    if _is_unchanged(os.stat(source), destination):
+        return set()
+    return {copy_file(source, destination)}
+
+
+def is_local_path(path):
+    """Return ``False`` if ``path`` is an rsync ``[user@]host:`` path."""
+    head = path.split(os.sep, 1)[0]
+    return ":" not in head
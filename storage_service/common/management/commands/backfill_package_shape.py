@@ -0,0 +1,51 @@
+"""Record the shape of the packages stored before it was recorded at store time.
+
+Whether a package is a single (compressed) file or a directory, its
+compression algorithm, its base directory and whether it is encrypted are
+recorded on the package when it is stored, so that they are known without
+fetching the package from its space. This command records them for the
+packages stored before that.
+
+Packages in local, unencrypted spaces are looked at where they are stored and
+packages with a pointer file are known to be compressed. Other packages (e.g.
+in S3, Swift, DuraCloud or GPG spaces) are only fetched with ``--fetch``::
+
+    $ ./manage.py backfill_package_shape
+    $ ./manage.py backfill_package_shape --fetch
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from locations.models import Package, StorageException
+
+
+class Command(BaseCommand):
+    help = "Record the shape of packages stored by previous versions."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fetch",
+            action="store_true",
+            default=False,
+            help="Fetch the packages that can't be looked at where they are stored.",
+        )
+
+    def handle(self, *args, **options):
+        packages = Package.objects.filter(compressed__isnull=True).exclude(
+            status__in=(Package.DELETED, Package.FAIL)
+        )
+        recorded = skipped = failed = 0
+        for package in packages.iterator():
+            try:
+                if package.backfill_shape(fetch=options["fetch"]):
+                    recorded += 1
+                else:
+                    skipped += 1
+            except (StorageException, EnvironmentError) as err:
+                failed += 1
+                self.stderr.write("{}: {}".format(package.uuid, err))
+        self.stdout.write(
+            "Recorded {} package(s), skipped {} that need --fetch,"
+            " {} failed.".format(recorded, skipped, failed)
+        )
@@ -0,0 +1,41 @@
+"""Copy the metadata of pointer files written before it was copied to packages.
+
+The compression, format, checksum, composition level and encryption recorded
+in the pointer file of a package are copied to its fields when the pointer
+file is written, so that they can be queried (e.g. all the AIPs compressed
+with 7-Zip bzip2 in a location) and read without parsing pointer files. This
+command copies them for the packages whose pointer file was written before
+that::
+
+    $ ./manage.py backfill_pointer_metadata
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+from django.core.management.base import BaseCommand
+from lxml import etree
+
+from locations.models import Package
+
+
+class Command(BaseCommand):
+    help = "Copy the metadata of pointer files written by previous versions."
+
+    def handle(self, *args, **options):
+        packages = (
+            Package.objects.filter(message_digest="", pointer_file_path__isnull=False)
+            .exclude(pointer_file_path="")
+            .exclude(status__in=(Package.DELETED, Package.FAIL))
+        )
+        recorded = failed = 0
+        for package in packages.iterator():
+            try:
+                package.record_pointer_metadata()
+            except (EnvironmentError, etree.LxmlError) as err:
+                failed += 1
+                self.stderr.write("{}: {}".format(package.uuid, err))
+            else:
+                recorded += 1
+        self.stdout.write(
+            "Recorded the pointer file metadata of {} package(s),"
+            " {} failed.".format(recorded, failed)
+        )
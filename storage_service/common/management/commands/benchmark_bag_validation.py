@@ -0,0 +1,138 @@
+"""Measure how fast bags are validated in a location by more processes.
+
+Bags are validated by ``SS_BAG_VALIDATION_NO_PROCESSES`` processes (one by
+default), unless another number is set for the space of the package: network
+storage may keep more processes than CPUs busy, while a single spinning disk
+is fastest with one. This writes a bag of random files in the
+location, or uses an existing one, validates it with increasing numbers of
+processes and reports the fastest::
+
+    $ ./manage.py benchmark_bag_validation <location UUID> --save
+
+Validation reads the bag through the page cache, so the bag should be larger
+than the memory of the host to measure the storage rather than the cache.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+import bagit
+from django.core.management.base import BaseCommand, CommandError
+
+from common import utils
+from locations.models import Location
+
+# Size of the writes of the random files
+CHUNK_SIZE = 1024 * 1024
+
+
+class Command(BaseCommand):
+    help = "Find the fastest number of processes validating bags in a location."
+
+    def add_arguments(self, parser):
+        parser.add_argument("location_uuid", help="UUID of the location to measure.")
+        parser.add_argument(
+            "--bag",
+            help="Path of an existing bag to validate, relative to the location, "
+            "instead of a bag of random files.",
+        )
+        parser.add_argument(
+            "--files",
+            type=int,
+            default=100,
+            help="Number of files in the bag of random files.",
+        )
+        parser.add_argument(
+            "--file-size",
+            type=int,
+            default=10,
+            help="Size of the files in the bag of random files, in MiB.",
+        )
+        parser.add_argument(
+            "--processes",
+            help="Comma-separated numbers of processes to try, by default powers "
+            "of two up to twice the number of CPUs.",
+        )
+        parser.add_argument(
+            "--save",
+            action="store_true",
+            default=False,
+            help="Validate the bags stored in the space of the location with the "
+            "fastest number of processes.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            location = Location.objects.get(uuid=options["location_uuid"])
+        except Location.DoesNotExist:
+            raise CommandError("No location {}".format(options["location_uuid"]))
+        if not os.path.isdir(location.full_path):
+            raise CommandError("{} is not a local directory".format(location.full_path))
+        candidates = self.get_candidates(options["processes"])
+
+        temp_dir = None
+        if options["bag"]:
+            bag_path = os.path.join(location.full_path, options["bag"])
+        else:
+            temp_dir = tempfile.mkdtemp(dir=location.full_path)
+            bag_path = os.path.join(temp_dir, "bag")
+            self.stdout.write("Writing a bag of random files in {}".format(bag_path))
+            make_random_bag(bag_path, options["files"], options["file_size"])
+        try:
+            size = utils.recalculate_size(bag_path)
+            results = []
+            for processes in candidates:
+                bag = bagit.Bag(bag_path)
+                start = time.time()
+                bag.validate(processes=processes)
+                elapsed = time.time() - start
+                results.append((elapsed, processes))
+                self.stdout.write(
+                    "{} process(es): {:.2f}s, {:.1f} MiB/s".format(
+                        processes, elapsed, size / 1024 / 1024 / max(elapsed, 1e-6)
+                    )
+                )
+        finally:
+            if temp_dir:
+                shutil.rmtree(temp_dir)
+
+        __, fastest = min(results)
+        self.stdout.write("Fastest: {} process(es)".format(fastest))
+        if options["save"]:
+            space = location.space
+            space.bag_validation_processes = fastest
+            space.save()
+            self.stdout.write(
+                "Bags in space {} are now validated by {} process(es)".format(
+                    space.uuid, fastest
+                )
+            )
+
+    def get_candidates(self, processes):
+        if processes:
+            try:
+                candidates = [int(number) for number in processes.split(",")]
+            except ValueError:
+                raise CommandError("Invalid numbers of processes: " + processes)
+            if any(number < 1 for number in candidates):
+                raise CommandError("Numbers of processes must be at least 1")
+            return candidates
+        candidates = [1]
+        while candidates[-1] < 2 * multiprocessing.cpu_count():
+            candidates.append(candidates[-1] * 2)
+        return candidates
+
+
+def make_random_bag(bag_path, files, file_size):
+    """Write a bag of ``files`` random files of ``file_size`` MiB at
+    ``bag_path``."""
+    os.makedirs(bag_path)
+    for index in range(files):
+        with open(os.path.join(bag_path, "file{}.bin".format(index)), "wb") as f:
+            for __ in range(file_size):
+                f.write(os.urandom(CHUNK_SIZE))
+    bagit.make_bag(bag_path, checksums=["sha256"])
@@ -0,0 +1,317 @@
+"""Time the operations on packages stored in one or more locations.
+
+This writes a synthetic bag of random files in the storage service internal
+location, then stores it as an AIP in each location, fetches it, extracts one
+of its files, compresses it, checks its fixity and deletes it, and writes the
+duration of each operation as JSON, so runs before and after a change of
+configuration or an upgrade can be compared::
+
+    $ ./manage.py benchmark_storage <location UUID> [<location UUID> ...] \\
+        --files 1000 --file-size 1024 --size-distribution lognormal \\
+        --rounds 3 --output results.json
+
+The locations are the AIP storage locations of any space: a local filesystem,
+a GPG encrypted space, or S3, Swift or DuraCloud spaces pointed at local
+stand-ins of those services (e.g. MinIO or a Swift all-in-one container) to
+measure the storage service rather than the network. Storing measures the
+moves of ``store_aip``; it does not create pointer files or replicas, or run
+the post-store callbacks.
+
+The file sizes are drawn from the chosen distribution around ``--file-size``
+KiB by a random generator seeded with ``--seed``, so runs with the same
+arguments store the same number of bytes. The content of the files is random
+and does not compress, like most of the payloads of AIPs.
+"""
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+import datetime
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+import uuid
+
+import bagit
+from django.core.management.base import BaseCommand, CommandError
+
+from common import utils
+from locations.models import Location, Package
+from storage_service import __version__ as ss_version
+
+# Size of the writes of the random files
+CHUNK_SIZE = 1024 * 1024
+
+SIZE_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+# Standard deviation of the logarithm of the lognormal file sizes
+LOGNORMAL_SIGMA = 1.0
+
+
+class Command(BaseCommand):
+    help = "Time the operations on packages stored in locations, as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "location_uuids",
+            nargs="+",
+            metavar="location_uuid",
+            help="UUID of an AIP storage location to measure.",
+        )
+        parser.add_argument(
+            "--files", type=int, default=100, help="Number of files in the bag."
+        )
+        parser.add_argument(
+            "--file-size",
+            type=int,
+            default=1024,
+            help="Mean size of the files in the bag, in KiB.",
+        )
+        parser.add_argument(
+            "--size-distribution",
+            choices=SIZE_DISTRIBUTIONS,
+            default="fixed",
+            help="Distribution of the sizes of the files around their mean.",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed of the file sizes."
+        )
+        parser.add_argument(
+            "--rounds",
+            type=int,
+            default=1,
+            help="Number of times the operations are run in each location.",
+        )
+        parser.add_argument(
+            "--compression",
+            choices=utils.COMPRESSION_ALGORITHMS,
+            default=utils.COMPRESSION_7Z_BZIP,
+            help="Algorithm compressing the package.",
+        )
+        parser.add_argument(
+            "--output", help="File to write the results to, instead of stdout."
+        )
+
+    def handle(self, *args, **options):
+        if options["files"] < 1 or options["rounds"] < 1:
+            raise CommandError("--files and --rounds must be at least 1")
+        if options["file_size"] < 0:
+            raise CommandError("--file-size must not be negative")
+        locations = []
+        for location_uuid in options["location_uuids"]:
+            try:
+                locations.append(
+                    Location.active.get(
+                        uuid=location_uuid, purpose=Location.AIP_STORAGE
+                    )
+                )
+            except Location.DoesNotExist:
+                raise CommandError(
+                    "No active AIP storage location {}".format(location_uuid)
+                )
+        try:
+            ss_internal = Location.active.get(purpose=Location.STORAGE_SERVICE_INTERNAL)
+        except Location.DoesNotExist:
+            raise CommandError("No storage service internal location")
+
+        started = datetime.datetime.utcnow().isoformat()
+        sizes = get_file_sizes(
+            options["files"],
+            options["file_size"] * 1024,
+            options["size_distribution"],
+            options["seed"],
+        )
+        temp_dir = tempfile.mkdtemp(dir=ss_internal.full_path)
+        try:
+            bag_path = os.path.join(temp_dir, "bag")
+            self.stderr.write(
+                "Writing a bag of {} files, {} bytes".format(len(sizes), sum(sizes))
+            )
+            make_synthetic_bag(bag_path, sizes)
+            runs = []
+            for location in locations:
+                for round_number in range(options["rounds"]):
+                    self.stderr.write(
+                        "Location {}, round {}".format(location.uuid, round_number + 1)
+                    )
+                    round_runs = self.run_round(
+                        location,
+                        ss_internal,
+                        bag_path,
+                        os.path.join(temp_dir, "round"),
+                        options["compression"],
+                    )
+                    for run in round_runs:
+                        run["round"] = round_number + 1
+                    runs.extend(round_runs)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+        results = {
+            "started": started,
+            "version": ss_version,
+            "host": platform.node(),
+            "parameters": {
+                "files": options["files"],
+                "file_size": options["file_size"] * 1024,
+                "size_distribution": options["size_distribution"],
+                "seed": options["seed"],
+                "bag_size": sum(sizes),
+                "rounds": options["rounds"],
+                "compression": options["compression"],
+            },
+            "runs": runs,
+            "summary": summarize(runs),
+        }
+        output = json.dumps(results, indent=2, separators=(",", ": "), sort_keys=True)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+    def run_round(self, location, ss_internal, bag_path, round_dir, compression):
+        """Run the operations on a copy of the bag at ``bag_path`` stored in
+        ``location`` and return the list of their runs. The operations after
+        a failed store are not run."""
+        package_uuid = str(uuid.uuid4())
+        name = "benchmark-" + package_uuid
+        origin_path = os.path.join(round_dir, name)
+        shutil.copytree(bag_path, origin_path)
+        package = Package(
+            uuid=package_uuid,
+            description="Storage benchmark",
+            package_type=Package.AIP,
+            current_location=location,
+            current_path=name,
+            size=utils.recalculate_size(origin_path),
+        )
+        package.save()
+        runs = []
+
+        def timed(operation, function):
+            run = {
+                "location": location.uuid,
+                "protocol": location.space.access_protocol,
+                "operation": operation,
+                "bytes": package.size,
+                "error": None,
+            }
+            start = time.time()
+            try:
+                function()
+            except Exception as err:
+                run["error"] = "{}: {}".format(type(err).__name__, err)
+            run["seconds"] = time.time() - start
+            runs.append(run)
+            return run["error"] is None
+
+        def store():
+            v = package._store_aip_to_pending(
+                ss_internal, os.path.relpath(origin_path, ss_internal.full_path)
+            )
+            package._store_aip_to_uploaded(v, None)
+
+        def fetch():
+            local_path = package.fetch_local_path()
+            if local_path != package.full_path:
+                package.remove_local_copy(local_path)
+
+        def extract_file():
+            first_file = sorted(os.listdir(os.path.join(bag_path, "data")))[0]
+            __, temp_dir = package.extract_file(os.path.join(name, "data", first_file))
+            shutil.rmtree(temp_dir)
+
+        def compress():
+            __, temp_dir = package.compress_package(compression)
+            shutil.rmtree(temp_dir)
+
+        def fixity():
+            success, __, message, __ = package.check_fixity(force_local=True)
+            if not success:
+                raise bagit.BagValidationError(message)
+
+        def delete():
+            success, error = package.delete_from_storage()
+            if not success:
+                raise error
+
+        try:
+            if timed("store", store):
+                timed("fetch", fetch)
+                timed("extract_file", extract_file)
+                timed("compress", compress)
+                timed("fixity", fixity)
+                if package.local_path and package.local_path != package.full_path:
+                    package.remove_local_copy(package.local_path)
+                if timed("delete", delete):
+                    utils.removedirs(
+                        os.path.dirname(package.current_path), base=location.full_path
+                    )
+        finally:
+            shutil.rmtree(round_dir, ignore_errors=True)
+            package.delete()
+        return runs
+
+
+def get_file_sizes(files, mean, distribution, seed):
+    """Return the sizes of ``files`` files, in bytes, drawn from
+    ``distribution`` (one of ``SIZE_DISTRIBUTIONS``) around ``mean`` bytes
+    with a random generator seeded with ``seed``."""
+    generator = random.Random(seed)
+    if distribution == "uniform":
+        return [generator.randint(0, 2 * mean) for __ in range(files)]
+    if distribution == "lognormal" and mean > 0:
+        mu = math.log(mean) - LOGNORMAL_SIGMA ** 2 / 2
+        return [
+            int(generator.lognormvariate(mu, LOGNORMAL_SIGMA)) for __ in range(files)
+        ]
+    return [mean] * files
+
+
+def make_synthetic_bag(bag_path, sizes):
+    """Write a bag at ``bag_path`` with a file of random bytes of each size
+    of ``sizes``."""
+    os.makedirs(bag_path)
+    for index, size in enumerate(sizes):
+        with open(os.path.join(bag_path, "file{:06d}.bin".format(index)), "wb") as f:
+            while size > 0:
+                f.write(os.urandom(min(size, CHUNK_SIZE)))
+                size -= CHUNK_SIZE
+    bagit.make_bag(bag_path, checksums=["sha256"])
+
+
+def summarize(runs):
+    """Return the number of runs, the errors and the minimum, median and
+    maximum durations of ``runs`` by location and operation."""
+    summary = {}
+    for run in runs:
+        operations = summary.setdefault(run["location"], {})
+        operations.setdefault(run["operation"], []).append(run)
+    for location, operations in summary.items():
+        for operation, operation_runs in operations.items():
+            seconds = sorted(
+                run["seconds"] for run in operation_runs if run["error"] is None
+            )
+            stats = {
+                "runs": len(operation_runs),
+                "errors": len(operation_runs) - len(seconds),
+            }
+            if seconds:
+                median = seconds[len(seconds) // 2]
+                stats.update(
+                    {
+                        "min": seconds[0],
+                        "median": median,
+                        "max": seconds[-1],
+                        "mib_per_second": operation_runs[0]["bytes"]
+                        / 1024
+                        / 1024
+                        / max(median, 1e-6),
+                    }
+                )
+            operations[operation] = stats
+    return summary
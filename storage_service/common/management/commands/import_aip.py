@@ -229,7 +229,7 @@ def confirm_aip_exists(aip_path):
         raise ImportAIPException("There is nothing at {}".format(aip_path))
 
 
-def validate(aip_path):
+def validate(aip_path, space=None):
     error_msg = "The AIP at {} is not a valid Bag; aborting.".format(aip_path)
     try:
         bag = bagit.Bag(aip_path)
@@ -237,9 +237,10 @@ def validate(aip_path):
         if is_compressed(aip_path):
             error_msg = "{} Try passing the --decompress-source flag.".format(error_msg)
         raise ImportAIPException(error_msg)
-    else:
-        if not bag.is_valid():
-            raise ImportAIPException(error_msg)
+    try:
+        bag.validate(processes=utils.get_bag_validation_processes(space))
+    except bagit.BagValidationError:
+        raise ImportAIPException(error_msg)
 
 
 def get_aip_mets_path(aip_path):
@@ -420,14 +421,14 @@ def import_aip(
     confirm_aip_exists(aip_path)
     temp_dir = tempfile.mkdtemp(dir=tmp_dir)
     aip_path = decompress(aip_path, decompress_source, temp_dir)
-    validate(aip_path)
+    local_as_location, final_as_location = get_aip_storage_locations(
+        aip_storage_location_uuid
+    )
+    validate(aip_path, local_as_location.space)
     aip_mets_path = get_aip_mets_path(aip_path)
     aip_uuid = get_aip_uuid(aip_mets_path)
     if not force:
         check_if_aip_already_exists(aip_uuid)
-    local_as_location, final_as_location = get_aip_storage_locations(
-        aip_storage_location_uuid
-    )
     aip_model_inst = models.Package(
         uuid=aip_uuid,
         package_type="AIP",
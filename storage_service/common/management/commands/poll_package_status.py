@@ -0,0 +1,94 @@
+"""Poll the status of the packages waiting to be confirmed by their space.
+
+Packages stored in LOCKSS-o-matic or Arkivum spaces stay staged until the
+space reports them as safely stored (LOCKSS servers in agreement, Arkivum
+replication state green). This checks them all, space by space, so that their
+status is updated without clicking "Update status" for each of them.
+
+Run it as a service::
+
+    $ ./manage.py poll_package_status
+
+or, e.g. from cron, check the packages once and exit::
+
+    $ ./manage.py poll_package_status --once
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+from collections import OrderedDict
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from locations.models import Package, Space
+
+LOGGER = logging.getLogger(__name__)
+
+# Spaces where packages wait to be confirmed
+POLLED_PROTOCOLS = (Space.ARKIVUM, Space.LOM)
+
+
+class Command(BaseCommand):
+    help = "Update the status of the packages waiting for their space."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            default=False,
+            help="Check the packages once and exit instead of checking them again "
+            "periodically.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=int,
+            default=10 * 60,
+            help="Seconds to wait before checking the packages again.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=8,
+            help="Maximum number of packages checked at once in a space.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            self.poll(options["workers"])
+            if options["once"]:
+                return
+            time.sleep(options["poll_interval"])
+
+    def poll(self, workers):
+        packages = Package.objects.filter(
+            status=Package.STAGING,
+            current_location__space__access_protocol__in=POLLED_PROTOCOLS,
+        ).select_related("current_location__space")
+        by_space = OrderedDict()
+        for package in packages:
+            by_space.setdefault(package.current_location.space_id, []).append(package)
+
+        for space_packages in by_space.values():
+            space = space_packages[0].current_location.space
+            try:
+                results = space.update_packages_status(
+                    space_packages, max_workers=workers
+                )
+            except Exception:
+                LOGGER.exception("Error updating the status of packages in %s", space)
+                self.stderr.write("{}: error, see the logs".format(space.uuid))
+                continue
+            uploaded = failed = 0
+            for status, error in results.values():
+                if status is None:
+                    failed += 1
+                elif status == Package.UPLOADED:
+                    uploaded += 1
+            self.stdout.write(
+                "{}: {} package(s) checked, {} uploaded, {} failed".format(
+                    space.uuid, len(results), uploaded, failed
+                )
+            )
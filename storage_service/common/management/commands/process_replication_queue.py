@@ -0,0 +1,67 @@
+"""Process the replication queue.
+
+Runs the replications queued when packages are stored with
+``SS_REPLICATION_QUEUE_ENABLED`` set (see ``locations.models.ReplicationTask``).
+Failed replications are retried with an exponential backoff until
+``SS_REPLICATION_MAX_ATTEMPTS`` is reached. Several instances of this command
+can run at the same time, on one or several hosts sharing the database and
+the replicator locations.
+
+Run it as a service::
+
+    $ ./manage.py process_replication_queue
+
+or, e.g. from cron, process the replications that are due and exit::
+
+    $ ./manage.py process_replication_queue --once
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from locations.models import ReplicationTask
+
+
+class Command(BaseCommand):
+    help = "Create the replicas of the packages queued for replication."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            default=False,
+            help="Exit when no queued replication is due instead of waiting for more.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=int,
+            default=30,
+            help="Seconds to wait before checking the queue again when it is empty.",
+        )
+        parser.add_argument(
+            "--stale-after",
+            type=int,
+            default=24 * 60 * 60,
+            help="Seconds after which a running replication is assumed to have "
+            "been interrupted and is queued again.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            requeued = ReplicationTask.requeue_stale(options["stale_after"])
+            if requeued:
+                self.stdout.write("Requeued {} stale replication(s)".format(requeued))
+            task = ReplicationTask.claim()
+            if task is None:
+                if options["once"]:
+                    return
+                time.sleep(options["poll_interval"])
+                continue
+            if task.run():
+                self.stdout.write("{}: done".format(task))
+            else:
+                self.stdout.write("{}: {}".format(task, task.last_error))
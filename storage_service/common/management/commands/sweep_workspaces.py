@@ -0,0 +1,58 @@
+"""Remove the abandoned temporary workspaces.
+
+The workers of the storage service sweep the temporary directories that
+failed or interrupted operations left behind every
+``SS_WORKSPACE_SWEEP_INTERVAL`` seconds (see ``locations.models.Workspace``).
+This command sweeps them now, e.g. when the internal location is full::
+
+    $ ./manage.py sweep_workspaces
+
+or lists them without removing them::
+
+    $ ./manage.py sweep_workspaces --dry-run
+
+Only the host running it can tell which of its processes are dead, so it
+only sweeps the workspaces of that host: run it on each host of the storage
+service.
+"""
+from __future__ import absolute_import, print_function, unicode_literals
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from locations.models import Workspace
+
+
+class Command(BaseCommand):
+    help = "Remove the temporary workspaces left by failed or interrupted operations."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-age",
+            type=int,
+            default=settings.WORKSPACE_MAX_AGE,
+            help="Seconds after which a workspace not used by an asynchronous "
+            "task is abandoned, if its process can't be checked.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            default=False,
+            help="List the abandoned workspaces without removing them.",
+        )
+
+    def handle(self, *args, **options):
+        abandoned = Workspace.sweep(options["max_age"], dry_run=options["dry_run"])
+        for workspace in abandoned:
+            self.stdout.write(
+                "{} ({} bytes, created {})".format(
+                    workspace, workspace.size, workspace.created_time.isoformat()
+                )
+            )
+        self.stdout.write(
+            "{} {} abandoned workspace(s), {} bytes".format(
+                "Found" if options["dry_run"] else "Removed",
+                len(abandoned),
+                sum(workspace.size or 0 for workspace in abandoned),
+            )
+        )
@@ -0,0 +1,113 @@
+"""Prometheus metrics of the storage operations.
+
+The metrics are exposed at ``/metrics`` if ``settings.PROMETHEUS_ENABLED``.
+With several gunicorn workers, prometheus_client's multiprocess mode collects
+them from every worker (see ``install/storage-service.gunicorn-config.py``):
+the counters and histograms are added up, and so is the gauge of the tasks
+running in the live workers.
+"""
+from __future__ import absolute_import
+from contextlib import contextmanager
+import time
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# Operations on packages take from seconds to days
+DURATION_BUCKETS = (
+    1,
+    5,
+    15,
+    30,
+    60,
+    5 * 60,
+    15 * 60,
+    30 * 60,
+    60 * 60,
+    3 * 60 * 60,
+    6 * 60 * 60,
+    12 * 60 * 60,
+    24 * 60 * 60,
+    float("inf"),
+)
+
+space_move_duration = Histogram(
+    "ss_space_move_duration_seconds",
+    "Duration of the moves to and from the storage service",
+    ["protocol", "operation"],
+    buckets=DURATION_BUCKETS,
+)
+space_move_errors = Counter(
+    "ss_space_move_errors_total",
+    "Failed moves to and from the storage service",
+    ["protocol", "operation"],
+)
+space_move_bytes = Counter(
+    "ss_space_move_bytes_total",
+    "Bytes moved to and from the storage service",
+    ["protocol", "operation"],
+)
+
+package_operation_duration = Histogram(
+    "ss_package_operation_duration_seconds",
+    "Duration of the operations on packages",
+    ["protocol", "operation"],
+    buckets=DURATION_BUCKETS,
+)
+package_operation_errors = Counter(
+    "ss_package_operation_errors_total",
+    "Failed operations on packages",
+    ["protocol", "operation"],
+)
+package_operation_bytes = Counter(
+    "ss_package_operation_bytes_total",
+    "Size of the packages of the successful operations",
+    ["protocol", "operation"],
+)
+
+callback_duration = Histogram(
+    "ss_callback_duration_seconds", "Duration of the callbacks", ["event"]
+)
+callback_errors = Counter("ss_callback_errors_total", "Failed callbacks", ["event"])
+
+async_tasks_running = Gauge(
+    "ss_async_tasks_running", "Asynchronous tasks running", multiprocess_mode="livesum"
+)
+async_task_duration = Histogram(
+    "ss_async_task_duration_seconds",
+    "Duration of the asynchronous tasks",
+    ["task"],
+    buckets=DURATION_BUCKETS,
+)
+async_task_errors = Counter(
+    "ss_async_task_errors_total", "Failed asynchronous tasks", ["task"]
+)
+
+workspaces_reclaimed = Counter(
+    "ss_workspaces_reclaimed_total",
+    "Abandoned temporary workspaces removed",
+    ["purpose"],
+)
+workspace_reclaimed_bytes = Counter(
+    "ss_workspace_reclaimed_bytes_total",
+    "Bytes reclaimed by removing abandoned temporary workspaces",
+    ["purpose"],
+)
+workspace_bytes = Gauge(
+    "ss_workspace_bytes",
+    "Bytes in the temporary workspaces in use, at the last sweep",
+    multiprocess_mode="liveall",
+)
+
+
+@contextmanager
+def measure(duration, errors, **labels):
+    """Observe the duration of the block in the ``duration`` histogram and
+    count it in ``errors`` if it raises an exception."""
+    start = time.time()
+    try:
+        yield
+    except Exception:
+        errors.labels(**labels).inc()
+        raise
+    finally:
+        duration.labels(**labels).observe(time.time() - start)
@@ -0,0 +1,209 @@
+"""Bounded on-disk cache of the local copies of packages.
+
+Packages that are not locally accessible (e.g. stored in S3, Swift or
+DuraCloud, or encrypted) have to be copied to the Storage Service internal
+location before they can be read. ``PackageCache`` keeps those copies so that,
+for instance, repeated file extractions from the same AIP copy it once.
+
+Each entry is a directory named after its key (the package UUID and checksum)
+next to a lock file of the same name, shared by every process using the cache:
+
+* a process copying a package holds an exclusive lock, so that concurrent
+  requests for the same package wait for that copy instead of making their own;
+* a process using a copy holds a shared lock (the entry is "pinned"), and
+  only takes the exclusive lock if the copy is not complete;
+* entries are evicted, least recently used first, when the total size of the
+  cache would exceed its maximum, but only if nobody holds their lock.
+
+Locks are ``flock`` locks, released when the process holding them exits.
+"""
+from __future__ import absolute_import
+import errno
+import logging
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from prometheus_client import Counter
+import scandir
+
+from common import utils
+
+
+LOGGER = logging.getLogger(__name__)
+
+COMPLETE_MARKER = ".complete"
+LOCK_SUFFIX = ".lock"
+CACHE_LOCK = ".cache.lock"
+
+hits = Counter("ss_package_cache_hits_total", "Package cache hits")
+misses = Counter("ss_package_cache_misses_total", "Package cache misses")
+evictions = Counter("ss_package_cache_evictions_total", "Package cache evictions")
+evicted_bytes = Counter(
+    "ss_package_cache_evicted_bytes_total", "Bytes evicted from the package cache"
+)
+
+
+class Pin(object):
+    """Shared lock on a cache entry, preventing its eviction until released."""
+
+    def __init__(self, lock_file):
+        self._lock_file = lock_file
+
+    def release(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+class PackageCache(object):
+    """Cache of package copies in the directory ``root``, holding up to
+    ``max_bytes`` bytes."""
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def get(self, key, relative_path, fetch, size=0):
+        """Return the cached copy of the package identified by ``key``,
+        calling ``fetch`` to copy it into the cache first if needed.
+
+        :param key: identifier of the package content.
+        :param relative_path: path of the package in its cache entry.
+        :param fetch: callable copying the package to the path it is given.
+        :param size: expected size of the package, room is made for it before
+            it is fetched.
+        :returns: 2-tuple of the path to the copy and the ``Pin`` that must be
+            released once the copy is no longer used.
+        """
+        if not os.path.isdir(self.root):
+            try:
+                os.makedirs(self.root)
+            except OSError as err:
+                if err.errno != errno.EEXIST:
+                    raise
+        entry = os.path.join(self.root, key)
+        path = os.path.join(entry, relative_path)
+        # Most requests are hits: use the entry with a shared lock if it is
+        # complete, so that readers don't wait for each other
+        lock_file = self._lock(key, fcntl.LOCK_SH)
+        if self._is_complete(entry, path):
+            hits.inc()
+            LOGGER.debug("Package cache hit: %s", key)
+            os.utime(lock_file.name, None)
+            return path, Pin(lock_file)
+        lock_file.close()
+
+        lock_file = self._lock(key)
+        try:
+            # Another process may have copied the package in the meantime
+            if self._is_complete(entry, path):
+                hits.inc()
+                LOGGER.debug("Package cache hit: %s", key)
+            else:
+                misses.inc()
+                LOGGER.debug("Package cache miss: %s", key)
+                shutil.rmtree(entry, ignore_errors=True)
+                self._evict(size, keep=key)
+                os.makedirs(os.path.dirname(path))
+                fetch(path)
+                with open(os.path.join(entry, COMPLETE_MARKER), "w") as marker:
+                    marker.write(str(utils.recalculate_size(path)))
+                self._evict(0, keep=key)
+            # Record the use of the entry, for LRU eviction
+            os.utime(lock_file.name, None)
+            # Downgrade to a shared lock: let others use it, but not evict it
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+        except BaseException:
+            lock_file.close()
+            raise
+        return path, Pin(lock_file)
+
+    @staticmethod
+    def _is_complete(entry, path):
+        """Return True if the package copy at ``path`` in the cache entry
+        ``entry`` was copied completely."""
+        return os.path.exists(os.path.join(entry, COMPLETE_MARKER)) and (
+            os.path.exists(path)
+        )
+
+    def _lock(self, key, operation=None, blocking=True):
+        """Open and lock the lock file of ``key``, exclusively unless
+        ``operation`` is ``fcntl.LOCK_SH``.
+
+        :returns: the open lock file, or None if not ``blocking`` and the lock
+            is held by someone else.
+        """
+        lock_path = os.path.join(self.root, key + LOCK_SUFFIX)
+        flags = fcntl.LOCK_EX if operation is None else operation
+        if not blocking:
+            flags |= fcntl.LOCK_NB
+        while True:
+            lock_file = open(lock_path, "a")
+            try:
+                fcntl.flock(lock_file, flags)
+            except IOError as err:
+                lock_file.close()
+                if err.errno in (errno.EAGAIN, errno.EACCES):
+                    return None
+                raise
+            # The lock file may have been deleted by an eviction while we
+            # were waiting for it, in which case the lock is worthless.
+            try:
+                if os.fstat(lock_file.fileno()).st_ino == os.stat(lock_path).st_ino:
+                    return lock_file
+            except OSError:
+                pass
+            lock_file.close()
+
+    def _entries(self):
+        """Return a list of (last use time, key, size) of the complete
+        entries."""
+        entries = []
+        for dir_entry in scandir.scandir(self.root):
+            if not dir_entry.name.endswith(LOCK_SUFFIX):
+                continue
+            key = dir_entry.name[: -len(LOCK_SUFFIX)]
+            marker = os.path.join(self.root, key, COMPLETE_MARKER)
+            try:
+                with open(marker) as marker_file:
+                    size = int(marker_file.read() or 0)
+                last_used = dir_entry.stat().st_mtime
+            except (EnvironmentError, ValueError):
+                continue
+            entries.append((last_used, key, size))
+        return sorted(entries)
+
+    def _evict(self, needed, keep):
+        """Evict the least recently used entries that are not in use until
+        ``needed`` more bytes fit in the cache."""
+        with open(os.path.join(self.root, CACHE_LOCK), "a") as cache_lock:
+            fcntl.flock(cache_lock, fcntl.LOCK_EX)
+            entries = self._entries()
+            total = sum(size for __, __, size in entries)
+            for __, key, size in entries:
+                if total + needed <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                lock_file = self._lock(key, blocking=False)
+                if lock_file is None:
+                    continue  # In use
+                try:
+                    LOGGER.info("Evicting %s (%s bytes) from package cache", key, size)
+                    shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+                    os.remove(lock_file.name)
+                finally:
+                    lock_file.close()
+                total -= size
+                evictions.inc()
+                evicted_bytes.inc(size)
+
+    def contains(self, path):
+        """Return True if ``path`` is in this cache."""
+        root = os.path.join(os.path.realpath(self.root), "")
+        return os.path.realpath(path).startswith(root)
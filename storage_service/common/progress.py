@@ -0,0 +1,192 @@
+"""Progress and cancellation of the asynchronous tasks.
+
+The code moving, storing, replicating or extracting packages reports the
+stage it is at and the bytes it has copied with ``stage`` and ``advance``.
+In an asynchronous task (see ``locations.models.async_manager``) the
+progress is written to its ``Async`` row, at most every
+``Progress.interval`` seconds so that reporting every chunk copied stays
+cheap; elsewhere the calls do nothing. Other threads copying for the task
+(see ``callback``) only count the bytes: the task thread, or the watchdog
+of the asynchronous tasks while it is blocked, writes them.
+
+The same calls are the points where a task can be cancelled: once its
+``cancelled`` event is set, the next ``stage``, ``advance`` or
+``checkpoint`` raises ``TaskCancelled``, and ``wait`` terminates the
+external command the task is waiting for. The code cleans up what it was
+doing (e.g. staging copies) on its way out.
+"""
+from __future__ import absolute_import
+from contextlib import contextmanager
+import threading
+import time
+
+# Interval between two checks of the cancellation of a task waiting for an
+# external command
+WAIT_POLL_SECONDS = 1
+
+# Time given to a terminated external command to exit before it is killed
+TERMINATE_SECONDS = 10
+
+# Progress of the task running in the current thread (or greenlet)
+_local = threading.local()
+
+
+class TaskCancelled(Exception):
+    """Raised in a task that was cancelled."""
+
+
+class Progress(object):
+    """Progress of a task, written by ``write(fields)`` where ``fields`` is a
+    dict of ``stage``, ``bytes_done``, ``bytes_total``, ``bytes_per_second``
+    and ``stage_started`` (a timestamp), and cancelled by setting the
+    ``cancelled`` event. ``task_id`` identifies the task (e.g. the ID of its
+    ``Async`` model).
+
+    Only the thread that created it writes the progress as it advances;
+    ``flush`` can also be called from another thread that may write, e.g.
+    to report the bytes counted by the threads of a transfer."""
+
+    def __init__(self, write, interval=5, cancelled=None, task_id=None):
+        self.task_id = task_id
+        self.write = write
+        self.interval = interval
+        self.cancelled = cancelled or threading.Event()
+        self.shielded = 0
+        self.stage = ""
+        self.bytes_done = 0
+        self.bytes_total = None
+        self.stage_started = time.time()
+        self.last_write = 0
+        self.thread = threading.current_thread()
+        # Guards the counters, and the writes so they stay in order
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+
+    def checkpoint(self):
+        if self.cancelled.is_set() and not self.shielded:
+            raise TaskCancelled(
+                "Task cancelled during stage {}".format(self.stage or "start")
+            )
+
+    def start_stage(self, stage, bytes_total=None):
+        self.checkpoint()
+        with self.lock:
+            self.stage = stage
+            self.bytes_done = 0
+            self.bytes_total = bytes_total
+            self.stage_started = time.time()
+        self.flush(force=True)
+
+    def advance(self, nbytes):
+        with self.lock:
+            self.bytes_done += nbytes
+        if threading.current_thread() is self.thread:
+            self.flush()
+        self.checkpoint()
+
+    def flush(self, force=False):
+        with self.write_lock:
+            with self.lock:
+                now = time.time()
+                if not force and now - self.last_write < self.interval:
+                    return
+                self.last_write = now
+                elapsed = now - self.stage_started
+                fields = {
+                    "stage": self.stage,
+                    "bytes_done": self.bytes_done,
+                    "bytes_total": self.bytes_total,
+                    "bytes_per_second": self.bytes_done / elapsed if elapsed else None,
+                    "stage_started": self.stage_started,
+                }
+            self.write(fields)
+
+
+@contextmanager
+def tracking(write, interval=5, cancelled=None, task_id=None):
+    """Report the progress of the block, run in this thread, to ``write``
+    (see ``Progress``), and cancel it when the ``cancelled`` event is set."""
+    previous = getattr(_local, "progress", None)
+    _local.progress = Progress(write, interval, cancelled, task_id)
+    try:
+        yield _local.progress
+    finally:
+        _local.progress.flush(force=True)
+        _local.progress = previous
+
+
+def current_task():
+    """Return the ``task_id`` of the current task, or None outside tasks."""
+    current = getattr(_local, "progress", None)
+    return current.task_id if current is not None else None
+
+
+def stage(name, bytes_total=None):
+    """Report the start of the stage ``name`` of the current task, expected
+    to copy ``bytes_total`` bytes if known. ``bytes_total`` can be a function
+    returning it, called only in a task (e.g. to walk a directory)."""
+    current = getattr(_local, "progress", None)
+    if current is not None:
+        if callable(bytes_total):
+            bytes_total = bytes_total()
+        current.start_stage(name, bytes_total)
+
+
+def advance(nbytes):
+    """Report ``nbytes`` more bytes copied in the current stage."""
+    current = getattr(_local, "progress", None)
+    if current is not None:
+        current.advance(nbytes)
+
+
+def callback():
+    """Return a function reporting bytes copied in the current stage, that
+    can be called from other threads (e.g. the transfer threads of boto3):
+    they count the bytes, which are written by the task thread or by the
+    watchdog (see ``Progress``)."""
+    current = getattr(_local, "progress", None)
+    if current is None:
+        return lambda nbytes: None
+    return current.advance
+
+
+def checkpoint():
+    """Raise ``TaskCancelled`` if the current task was cancelled."""
+    current = getattr(_local, "progress", None)
+    if current is not None:
+        current.checkpoint()
+
+
+@contextmanager
+def shielded():
+    """Run the block without checkpoints, e.g. the steps of an operation
+    that must not be left half done."""
+    current = getattr(_local, "progress", None)
+    if current is None:
+        yield
+        return
+    current.shielded += 1
+    try:
+        yield
+    finally:
+        current.shielded -= 1
+
+
+def wait(process):
+    """Wait for the ``subprocess.Popen`` ``process`` to exit and return its
+    return code. If the current task is cancelled meanwhile, terminate the
+    process and raise ``TaskCancelled``."""
+    current = getattr(_local, "progress", None)
+    if current is None or current.shielded:
+        return process.wait()
+    while process.poll() is None:
+        if current.cancelled.wait(WAIT_POLL_SECONDS):
+            process.terminate()
+            deadline = time.time() + TERMINATE_SECONDS
+            while process.poll() is None and time.time() < deadline:
+                time.sleep(0.1)
+            if process.returncode is None:
+                process.kill()
+                process.wait()
+            current.checkpoint()
+    return process.returncode
@@ -0,0 +1,261 @@
+"""Split a file into the volumes of a GNU tar multi-volume archive.
+
+The volumes are the same as the ones written by::
+
+    $ tar --create --multi-volume --tape-length ... -f <prefix>-1 <file>
+
+and can be extracted with ``tar --extract --multi-volume``, but each volume is
+written, and its checksum and size computed, in one pass. A file whose name
+does not fit in a tar header is written in the POSIX (pax) format instead,
+like ``tar --format=posix`` does, since the GNU multi-volume headers cannot
+continue it under its full name. Since the layout of
+the volumes only depends on the size of the file, volumes can be written
+independently of each other: concurrently, and only the missing ones when a
+split is resumed after being interrupted.
+"""
+from __future__ import absolute_import
+from collections import namedtuple
+import grp
+import hashlib
+import json
+import logging
+import os
+import pwd
+import stat
+import tarfile
+import threading
+
+from common import utils
+
+
+LOGGER = logging.getLogger(__name__)
+
+BLOCK_SIZE = tarfile.BLOCKSIZE
+RECORD_SIZE = tarfile.RECORDSIZE
+# Size of the reads from the file
+READ_SIZE = 1024 * 1024
+# Suffix of the file recording the volumes written, to resume a split
+STATE_SUFFIX = ".split.json"
+
+Volume = namedtuple("Volume", ["path", "size", "checksum"])
+
+
+def split(file_path, prefix, volume_size, algorithm="md5", max_workers=1):
+    """Write ``file_path`` as a multi-volume tar archive in volumes named
+    ``<prefix>-1``, ``<prefix>-2``...
+
+    :param volume_size: maximum size of a volume in bytes, rounded down to a
+        multiple of the tar record size (10240 bytes).
+    :param algorithm: hashlib algorithm of the checksums of the volumes.
+    :param max_workers: maximum number of volumes written at once.
+    :returns: list of ``Volume`` tuples (path, size and hex digest).
+    """
+    volume_size -= volume_size % RECORD_SIZE
+    if volume_size < 2 * RECORD_SIZE:
+        raise ValueError("Volume size must be at least %s bytes" % (2 * RECORD_SIZE))
+    st = os.stat(file_path)
+    header = _header(file_path, st)
+    arcname = file_path.lstrip("/")
+    plan = _plan(
+        st.st_size,
+        len(header),
+        lambda offset: len(_multivolume_header(arcname, st.st_size, offset)),
+        volume_size,
+    )
+    state_path = prefix + STATE_SUFFIX
+    state = _load_state(
+        state_path,
+        {
+            "size": st.st_size,
+            "mtime": st.st_mtime,
+            "volume_size": volume_size,
+            "algorithm": algorithm,
+        },
+    )
+    state_lock = threading.Lock()
+
+    def write(index):
+        path = "{}-{}".format(prefix, index + 1)
+        done = state["volumes"].get(str(index))
+        if done and _has_size(path, done[0]):
+            LOGGER.debug("Volume %s already written", path)
+            return Volume(path, done[0], done[1])
+        offset, length = plan[index]
+        if index == 0:
+            volume_header = header
+        elif length:
+            volume_header = _multivolume_header(arcname, st.st_size, offset)
+        else:
+            volume_header = b""
+        volume = _write_volume(
+            file_path,
+            path,
+            volume_header,
+            offset,
+            length,
+            volume_size if index < len(plan) - 1 else None,
+            algorithm,
+        )
+        with state_lock:
+            state["volumes"][str(index)] = [volume.size, volume.checksum]
+            _save_state(state_path, state)
+        return volume
+
+    volumes = utils.map_concurrently(write, range(len(plan)), max_workers)
+    os.remove(state_path)
+    return volumes
+
+
+def _plan(size, header_size, continuation_size, volume_size):
+    """Return the (offset, length) in the file of the data of each volume,
+    given the size of the header of the first volume and the function
+    returning the size of the header continuing the file at an offset."""
+    plan = []
+    offset = 0
+    capacity = volume_size - header_size
+    while True:
+        length = min(capacity, size - offset)
+        plan.append((offset, length))
+        offset += length
+        if offset >= size:
+            break
+        # The following volumes start with a multi-volume header
+        capacity = volume_size - continuation_size(offset)
+    # The end of archive (two zero blocks) goes in a volume of its own if it
+    # does not fit after the data
+    last_offset, last_length = plan[-1]
+    if len(plan) == 1:
+        used = header_size + _padded(last_length)
+    else:
+        used = continuation_size(last_offset) + _padded(last_length)
+    if volume_size - used < 2 * BLOCK_SIZE:
+        plan.append((size, 0))
+    return plan
+
+
+def _padded(size):
+    return -(-size // BLOCK_SIZE) * BLOCK_SIZE
+
+
+def _header(file_path, st):
+    """Return the tar header of ``file_path``, as written by GNU tar."""
+    info = tarfile.TarInfo(file_path.lstrip("/"))
+    info.size = st.st_size
+    info.mtime = int(st.st_mtime)
+    info.mode = stat.S_IMODE(st.st_mode)
+    info.uid = st.st_uid
+    info.gid = st.st_gid
+    try:
+        info.uname = pwd.getpwuid(st.st_uid).pw_name
+    except KeyError:
+        pass
+    try:
+        info.gname = grp.getgrgid(st.st_gid).gr_name
+    except KeyError:
+        pass
+    buf = bytearray(info.tobuf(_format(info.name), "utf-8"))
+    # Unlike tarfile, GNU tar leaves the device numbers of files empty. The
+    # header of the file is the last block, after the pax ones if any.
+    header = buf[-BLOCK_SIZE:]
+    header[329:345] = b"\0" * 16
+    _set_checksum(header)
+    buf[-BLOCK_SIZE:] = header
+    return bytes(buf)
+
+
+def _format(arcname):
+    """Return the tarfile format of the volumes of the file ``arcname``."""
+    if len(arcname.encode("utf-8")) > tarfile.LENGTH_NAME:
+        return tarfile.PAX_FORMAT
+    return tarfile.GNU_FORMAT
+
+
+def _multivolume_header(arcname, size, offset):
+    """Return the GNU tar header continuing the file in a new volume at
+    ``offset``: a multi-volume header or, in the pax format, the global
+    header naming the file continued followed by the header of the part."""
+    if _format(arcname) == tarfile.PAX_FORMAT:
+        volume_info = tarfile.TarInfo.create_pax_global_header(
+            {
+                u"GNU.volume.filename": arcname,
+                u"GNU.volume.size": u"%d" % (size - offset),
+                u"GNU.volume.offset": u"%d" % offset,
+            }
+        )
+        part = tarfile.TarInfo(arcname)
+        part.size = size - offset
+        return volume_info + part.tobuf(tarfile.PAX_FORMAT, "utf-8")
+    header = bytearray(BLOCK_SIZE)
+    name = arcname.encode("utf-8")[:100]
+    header[: len(name)] = name
+    header[124:136] = tarfile.itn(size - offset, 12, tarfile.GNU_FORMAT)
+    header[156:157] = b"M"
+    header[369:381] = tarfile.itn(offset, 12, tarfile.GNU_FORMAT)
+    _set_checksum(header)
+    return bytes(header)
+
+
+def _set_checksum(header):
+    """Set the checksum of the tar ``header`` bytearray."""
+    header[148:156] = b" " * 8
+    header[148:155] = ("%06o\0" % sum(header)).encode("ascii")
+
+
+def _write_volume(file_path, path, header, offset, length, pad_to, algorithm):
+    """Write a volume with ``header`` followed by ``length`` bytes of the file
+    from ``offset``, padded with zeros to ``pad_to`` bytes or, for the last
+    volume, ended by two zero blocks and padded to a multiple of the record
+    size, and return its ``Volume``."""
+    checksum = hashlib.new(algorithm)
+    written = [0]
+
+    def out(data):
+        dest.write(data)
+        checksum.update(data)
+        written[0] += len(data)
+
+    with open(file_path, "rb") as src, open(path, "wb") as dest:
+        out(header)
+        src.seek(offset)
+        remaining = length
+        while remaining:
+            data = src.read(min(READ_SIZE, remaining))
+            if not data:
+                raise IOError("%s is shorter than expected" % file_path)
+            out(data)
+            remaining -= len(data)
+        out(b"\0" * (_padded(written[0]) - written[0]))
+        if pad_to is None:
+            out(b"\0" * 2 * BLOCK_SIZE)
+            pad_to = -(-written[0] // RECORD_SIZE) * RECORD_SIZE
+        out(b"\0" * (pad_to - written[0]))
+    return Volume(path, written[0], checksum.hexdigest())
+
+
+def _has_size(path, size):
+    try:
+        return os.path.getsize(path) == size
+    except OSError:
+        return False
+
+
+def _load_state(state_path, params):
+    """Return the volumes written by an interrupted split with the same
+    parameters, if any."""
+    try:
+        with open(state_path) as f:
+            state = json.load(f)
+    except (IOError, ValueError):
+        state = {}
+    if any(state.get(key) != value for key, value in params.items()):
+        state = dict(params, volumes={})
+    elif state["volumes"]:
+        LOGGER.info("Resuming split into %s", state_path[: -len(STATE_SUFFIX)])
+    return state
+
+
+def _save_state(state_path, state):
+    temp_path = state_path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(state, f)
+    os.rename(temp_path, state_path)
@@ -0,0 +1,30 @@
+from __future__ import absolute_import
+
+import os
+
+import bagit
+import pytest
+
+from common.management.commands import benchmark_storage
+
+
+@pytest.mark.parametrize("distribution", benchmark_storage.SIZE_DISTRIBUTIONS)
+def test_get_file_sizes(distribution):
+    sizes = benchmark_storage.get_file_sizes(1000, 1024, distribution, seed=1)
+    assert len(sizes) == 1000
+    assert all(size >= 0 for size in sizes)
+    assert 900 < sum(sizes) / len(sizes) < 1150
+    assert sizes == benchmark_storage.get_file_sizes(1000, 1024, distribution, 1)
+
+
+def test_make_synthetic_bag(tmpdir):
+    bag_path = str(tmpdir.join("bag"))
+    sizes = [0, 10, benchmark_storage.CHUNK_SIZE + 1]
+    benchmark_storage.make_synthetic_bag(bag_path, sizes)
+
+    bag = bagit.Bag(bag_path)
+    assert bag.validate()
+    payload = sorted(os.listdir(os.path.join(bag_path, "data")))
+    assert [
+        os.path.getsize(os.path.join(bag_path, "data", name)) for name in payload
+    ] == sizes
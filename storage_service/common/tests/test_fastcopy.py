@@ -0,0 +1,163 @@
+from __future__ import absolute_import
+import errno
+import os
+import stat
+
+import pytest
+
+from common import fastcopy
+
+
+def _copy_via_fds(src_fd, dst_fd, size):
+    os.write(dst_fd, os.read(src_fd, size))
+
+
+def _unsupported(src_fd, dst_fd, size):
+    raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+
+@pytest.fixture(autouse=True)
+def reset_detection():
+    fastcopy.reset_detection()
+    yield
+    fastcopy.reset_detection()
+
+
+@pytest.fixture
+def working_strategies(monkeypatch):
+    calls = []
+
+    def tracked(strategy, impl):
+        def _impl(src_fd, dst_fd, size):
+            calls.append(strategy)
+            return impl(src_fd, dst_fd, size)
+
+        return _impl
+
+    monkeypatch.setattr(
+        fastcopy,
+        "_IMPLEMENTATIONS",
+        {
+            fastcopy.STRATEGY_REFLINK: tracked(fastcopy.STRATEGY_REFLINK, _unsupported),
+            fastcopy.STRATEGY_COPY_FILE_RANGE: tracked(
+                fastcopy.STRATEGY_COPY_FILE_RANGE, _copy_via_fds
+            ),
+            fastcopy.STRATEGY_SENDFILE: tracked(
+                fastcopy.STRATEGY_SENDFILE, _copy_via_fds
+            ),
+        },
+    )
+    return calls
+
+
+def _make_tree(root):
+    src = root.mkdir("src")
+    src.join("a.txt").write("aaa")
+    src.mkdir("sub").join("b.txt").write("bbbb")
+    return src
+
+
+def test_copy_path_directory_contents(tmpdir, working_strategies):
+    src = _make_tree(tmpdir)
+    os.utime(str(src.join("a.txt")), (1000000000, 1000000000))
+    dest = tmpdir.mkdir("dest")
+
+    strategies = fastcopy.copy_path(str(src) + os.sep, str(dest))
+
+    assert strategies == {fastcopy.STRATEGY_COPY_FILE_RANGE}
+    assert dest.join("a.txt").read() == "aaa"
+    assert dest.join("sub", "b.txt").read() == "bbbb"
+    assert os.stat(str(dest.join("a.txt"))).st_mtime == 1000000000
+    mode = stat.S_IMODE(os.stat(str(dest.join("a.txt"))).st_mode)
+    assert mode & fastcopy.FILE_MODE_ADD == fastcopy.FILE_MODE_ADD
+    assert not mode & stat.S_IRWXO
+
+
+def test_copy_path_directory_into_existing_directory(tmpdir, working_strategies):
+    src = _make_tree(tmpdir)
+    dest = tmpdir.mkdir("dest")
+
+    fastcopy.copy_path(str(src), str(dest))
+
+    assert dest.join("src", "sub", "b.txt").read() == "bbbb"
+
+
+def test_copy_path_file_into_directory(tmpdir, working_strategies):
+    src = _make_tree(tmpdir)
+    dest = tmpdir.mkdir("dest")
+
+    fastcopy.copy_path(str(src.join("a.txt")), str(dest) + os.sep)
+
+    assert dest.join("a.txt").read() == "aaa"
+
+
+def test_unsupported_strategy_is_remembered(tmpdir, working_strategies):
+    src = _make_tree(tmpdir)
+
+    fastcopy.copy_path(str(src.join("a.txt")), str(tmpdir.join("one.txt")))
+    fastcopy.copy_path(str(src.join("a.txt")), str(tmpdir.join("two.txt")))
+
+    assert working_strategies == [
+        fastcopy.STRATEGY_REFLINK,
+        fastcopy.STRATEGY_COPY_FILE_RANGE,
+        fastcopy.STRATEGY_COPY_FILE_RANGE,
+    ]
+
+
+def test_no_strategy_available(tmpdir, monkeypatch):
+    monkeypatch.setattr(
+        fastcopy,
+        "_IMPLEMENTATIONS",
+        {strategy: _unsupported for strategy in fastcopy.STRATEGIES},
+    )
+    src = _make_tree(tmpdir)
+    dest = str(tmpdir.join("dest.txt"))
+
+    with pytest.raises(fastcopy.FastCopyUnsupported):
+        fastcopy.copy_path(str(src.join("a.txt")), dest)
+    assert not os.path.exists(dest)
+
+
+def test_io_errors_are_raised(tmpdir, monkeypatch):
+    def _no_space(src_fd, dst_fd, size):
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    monkeypatch.setattr(
+        fastcopy,
+        "_IMPLEMENTATIONS",
+        {strategy: _no_space for strategy in fastcopy.STRATEGIES},
+    )
+    src = _make_tree(tmpdir)
+
+    with pytest.raises(OSError) as excinfo:
+        fastcopy.copy_path(str(src.join("a.txt")), str(tmpdir.join("dest.txt")))
+    assert excinfo.value.errno == errno.ENOSPC
+
+
+def test_short_copies_are_errors(tmpdir, monkeypatch):
+    def _short_copy(src_fd, dst_fd, size):
+        os.write(dst_fd, os.read(src_fd, size // 2))
+
+    monkeypatch.setattr(
+        fastcopy,
+        "_IMPLEMENTATIONS",
+        {strategy: _short_copy for strategy in fastcopy.STRATEGIES},
+    )
+    src = _make_tree(tmpdir)
+
+    with pytest.raises(IOError) as excinfo:
+        fastcopy.copy_path(str(src.join("a.txt")), str(tmpdir.join("dest.txt")))
+    assert excinfo.value.errno == errno.EIO
+
+
+@pytest.mark.parametrize(
+    "path,expected",
+    [
+        ("/var/archivematica/storage", True),
+        ("relative/path", True),
+        ("archivematica@host:/var/archivematica", False),
+        ("host::module/path", False),
+    ],
+)
+def test_is_local_path(path, expected):
+    assert fastcopy.is_local_path(path) is expected
@@ -0,0 +1,28 @@
+from __future__ import absolute_import
+
+from prometheus_client import REGISTRY
+import pytest
+
+from common import metrics
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_measure():
+    labels = {"protocol": "FS", "operation": "test_measure"}
+    with metrics.measure(
+        metrics.package_operation_duration, metrics.package_operation_errors, **labels
+    ):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.measure(
+            metrics.package_operation_duration,
+            metrics.package_operation_errors,
+            **labels
+        ):
+            raise ValueError()
+
+    assert _sample("ss_package_operation_duration_seconds_count", **labels) == 2
+    assert _sample("ss_package_operation_errors_total", **labels) == 1
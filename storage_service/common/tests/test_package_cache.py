@@ -0,0 +1,99 @@
+from __future__ import absolute_import
+import os
+
+import pytest
+
+from common import package_cache
+
+
+def _fetcher(size, calls):
+    def fetch(path):
+        calls.append(path)
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+
+    return fetch
+
+
+def _set_last_use(cache, key, timestamp):
+    os.utime(os.path.join(cache.root, key + package_cache.LOCK_SUFFIX), (0, timestamp))
+
+
+@pytest.fixture
+def cache(tmpdir):
+    return package_cache.PackageCache(str(tmpdir.join("cache")), 100)
+
+
+def test_get_fetches_once(cache):
+    calls = []
+
+    path, pin = cache.get("a", "aip.7z", _fetcher(10, calls), size=10)
+    pin.release()
+    cached_path, pin = cache.get("a", "aip.7z", _fetcher(10, calls), size=10)
+    pin.release()
+
+    assert cached_path == path
+    assert calls == [path]
+    assert os.path.getsize(path) == 10
+    assert cache.contains(path)
+
+
+def test_incomplete_entry_is_fetched_again(cache):
+    calls = []
+
+    def failing_fetch(path):
+        with open(path, "wb") as f:
+            f.write(b"x")
+        raise IOError("Interrupted")
+
+    with pytest.raises(IOError):
+        cache.get("a", "aip.7z", failing_fetch, size=10)
+    path, pin = cache.get("a", "aip.7z", _fetcher(10, calls), size=10)
+    pin.release()
+
+    assert calls == [path]
+    assert os.path.getsize(path) == 10
+
+
+def test_least_recently_used_entries_are_evicted(cache):
+    calls = []
+    for key in ("a", "b"):
+        __, pin = cache.get(key, "aip.7z", _fetcher(40, calls), size=40)
+        pin.release()
+    _set_last_use(cache, "a", 2000)
+    _set_last_use(cache, "b", 1000)
+
+    __, pin = cache.get("c", "aip.7z", _fetcher(40, calls), size=40)
+    pin.release()
+
+    assert sorted(key for __, key, __ in cache._entries()) == ["a", "c"]
+    assert not os.path.exists(os.path.join(cache.root, "b"))
+
+
+def test_pinned_entries_are_not_evicted(cache):
+    calls = []
+    path_a, pin_a = cache.get("a", "aip.7z", _fetcher(60, calls), size=60)
+    __, pin = cache.get("b", "aip.7z", _fetcher(60, calls), size=60)
+    pin.release()
+
+    assert os.path.exists(path_a)
+    assert sorted(key for __, key, __ in cache._entries()) == ["a", "b"]
+
+    pin_a.release()
+    __, pin = cache.get("c", "aip.7z", _fetcher(10, calls), size=10)
+    pin.release()
+
+    assert not os.path.exists(path_a)
+
+
+def test_pinned_entries_can_be_read_concurrently(cache):
+    calls = []
+    path, pin = cache.get("a", "aip.7z", _fetcher(10, calls), size=10)
+
+    # An exclusive lock would wait for the first pin forever
+    cached_path, other_pin = cache.get("a", "aip.7z", _fetcher(10, calls), size=10)
+    other_pin.release()
+    pin.release()
+
+    assert cached_path == path
+    assert calls == [path]
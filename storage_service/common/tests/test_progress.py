@@ -0,0 +1,95 @@
+from __future__ import absolute_import
+import subprocess
+import threading
+
+import pytest
+
+from common import progress
+
+
+def test_progress_outside_tasks():
+    progress.stage("copy", lambda: 1 / 0)
+    progress.advance(10)
+
+
+def test_progress_writes_are_throttled(mocker):
+    time = mocker.patch("common.progress.time.time", return_value=100.0)
+    writes = []
+
+    with progress.tracking(writes.append, interval=5):
+        progress.stage("copy", lambda: 300)
+        time.return_value = 102.0
+        progress.advance(100)
+        time.return_value = 110.0
+        progress.advance(100)
+
+    assert writes == [
+        {
+            "stage": "copy",
+            "bytes_done": 0,
+            "bytes_total": 300,
+            "bytes_per_second": None,
+            "stage_started": 100.0,
+        },
+        {
+            "stage": "copy",
+            "bytes_done": 200,
+            "bytes_total": 300,
+            "bytes_per_second": 20.0,
+            "stage_started": 100.0,
+        },
+        {
+            "stage": "copy",
+            "bytes_done": 200,
+            "bytes_total": 300,
+            "bytes_per_second": 20.0,
+            "stage_started": 100.0,
+        },
+    ]
+
+
+def test_other_threads_only_count_bytes(mocker):
+    mocker.patch("common.progress.time.time", return_value=100.0)
+    writes = []
+
+    with progress.tracking(writes.append, interval=0):
+        progress.stage("copy", 300)
+        callback = progress.callback()
+        threads = [threading.Thread(target=callback, args=(100,)) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert [fields["bytes_done"] for fields in writes] == [0]
+
+    assert writes[-1]["bytes_done"] == 300
+
+
+def test_cancelled_task_stops_at_checkpoints():
+    cancelled = threading.Event()
+
+    with progress.tracking(lambda fields: None, cancelled=cancelled):
+        progress.stage("copy")
+        progress.advance(100)
+        cancelled.set()
+        with progress.shielded():
+            progress.advance(100)
+            progress.checkpoint()
+        with pytest.raises(progress.TaskCancelled):
+            progress.advance(100)
+
+
+def test_wait_terminates_the_process_of_a_cancelled_task():
+    cancelled = threading.Event()
+    process = subprocess.Popen(["sleep", "60"])
+
+    with progress.tracking(lambda fields: None, cancelled=cancelled):
+        threading.Timer(0.1, cancelled.set).start()
+        with pytest.raises(progress.TaskCancelled):
+            progress.wait(process)
+
+    assert process.returncode is not None
+
+
+def test_wait_outside_tasks():
+    assert progress.wait(subprocess.Popen(["true"])) == 0
@@ -0,0 +1,117 @@
+from __future__ import absolute_import
+import hashlib
+import json
+import os
+
+import pytest
+
+from common import tar_split
+
+VOLUME_SIZE = 3 * tar_split.RECORD_SIZE
+
+
+@pytest.fixture
+def package(tmpdir):
+    path = tmpdir.join("aip.7z")
+    path.write_binary(os.urandom(4 * VOLUME_SIZE + 1234))
+    return str(path)
+
+
+def _data(volumes):
+    """Return the file data of the multi-volume archive, read back from the
+    headers of its volumes."""
+    data = b""
+    for volume in volumes:
+        with open(volume.path, "rb") as f:
+            content = f.read()
+        if not content.strip(b"\0"):
+            continue  # End of archive only
+        header_size = 512
+        header, content = content[:512], content[512:]
+        # Skip the pax headers of long names
+        while header[156:157] in (b"g", b"x"):
+            size = tar_split._padded(int(header[124:136].rstrip(b"\0"), 8))
+            if header[156:157] == b"g":
+                assert b"GNU.volume.offset=%d\n" % len(data) in content[:size]
+            header_size += 512 + size
+            header, content = content[size : size + 512], content[size + 512 :]
+        if header[156:157] == b"M":
+            assert int(header[369:381].rstrip(b"\0"), 8) == len(data)
+        size = int(header[124:136].rstrip(b"\0"), 8)
+        data += content[: min(size, VOLUME_SIZE - header_size)]
+    return data
+
+
+def test_split(package, tmpdir):
+    prefix = str(tmpdir.join("aip.tar"))
+
+    volumes = tar_split.split(package, prefix, VOLUME_SIZE + 100)
+
+    assert [v.path for v in volumes] == [
+        "{}-{}".format(prefix, i) for i in range(1, len(volumes) + 1)
+    ]
+    for volume in volumes:
+        with open(volume.path, "rb") as f:
+            content = f.read()
+        assert volume.size == len(content) <= VOLUME_SIZE
+        assert volume.checksum == hashlib.md5(content).hexdigest()
+    with open(package, "rb") as f:
+        assert _data(volumes) == f.read()
+    assert not os.path.exists(prefix + tar_split.STATE_SUFFIX)
+
+
+def test_split_long_name(tmpdir):
+    package = tmpdir.mkdir("d" * 120).join("aip.7z")
+    package.write_binary(os.urandom(4 * VOLUME_SIZE + 1234))
+    arcname = str(package).lstrip("/").encode("utf-8")
+
+    volumes = tar_split.split(str(package), str(tmpdir.join("aip.tar")), VOLUME_SIZE)
+
+    # The full name is in the headers of every volume with data
+    for volume in volumes[:-1]:
+        with open(volume.path, "rb") as f:
+            assert arcname in f.read(3 * 512)
+    assert _data(volumes) == package.read_binary()
+
+
+def test_split_concurrently(package, tmpdir):
+    volumes = tar_split.split(package, str(tmpdir.join("a.tar")), VOLUME_SIZE)
+    concurrent_volumes = tar_split.split(
+        package, str(tmpdir.join("b.tar")), VOLUME_SIZE, max_workers=4
+    )
+
+    assert [v[1:] for v in concurrent_volumes] == [v[1:] for v in volumes]
+
+
+def test_split_resumes(package, tmpdir, mocker):
+    prefix = str(tmpdir.join("aip.tar"))
+    volumes = tar_split.split(package, prefix, VOLUME_SIZE, algorithm="sha256")
+    # Simulate an interruption while writing the second volume
+    st = os.stat(package)
+    with open(prefix + tar_split.STATE_SUFFIX, "w") as f:
+        json.dump(
+            {
+                "size": st.st_size,
+                "mtime": st.st_mtime,
+                "volume_size": VOLUME_SIZE,
+                "algorithm": "sha256",
+                "volumes": {
+                    str(i): [v.size, v.checksum]
+                    for i, v in enumerate(volumes)
+                    if i != 1
+                },
+            },
+            f,
+        )
+    os.remove(volumes[1].path)
+    write_volume = mocker.spy(tar_split, "_write_volume")
+
+    resumed_volumes = tar_split.split(package, prefix, VOLUME_SIZE, algorithm="sha256")
+
+    assert resumed_volumes == volumes
+    assert [c[0][1] for c in write_volume.call_args_list] == [volumes[1].path]
+
+
+def test_split_rejects_small_volumes(package, tmpdir):
+    with pytest.raises(ValueError):
+        tar_split.split(package, str(tmpdir.join("aip.tar")), tar_split.RECORD_SIZE)
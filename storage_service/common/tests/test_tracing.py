@@ -0,0 +1,55 @@
+from __future__ import absolute_import
+
+import json
+import logging
+
+import pytest
+
+from common import tracing
+
+
+def test_span_nesting(settings, tmpdir):
+    path = str(tmpdir.join("traces.json"))
+    settings.TRACING_EXPORTER = "json"
+    settings.TRACING_FILE = path
+
+    with tracing.span("parent", {"package.uuid": "1234"}) as parent:
+        assert tracing.current_trace_id() == parent.context.trace_id
+        with tracing.span("child") as child:
+            assert tracing.current_span() is child
+        with pytest.raises(ValueError):
+            with tracing.span("failure"):
+                raise ValueError("boom")
+    assert tracing.current_span() is None
+
+    with open(path) as f:
+        spans = {span["name"]: span for span in map(json.loads, f)}
+    assert spans["parent"]["parent_id"] is None
+    assert spans["parent"]["attributes"] == {"package.uuid": "1234"}
+    assert spans["parent"]["status"] == {"status_code": "OK"}
+    for name in ("child", "failure"):
+        assert spans[name]["context"]["trace_id"] == "0x" + parent.context.trace_id
+        assert spans[name]["parent_id"] == "0x" + parent.context.span_id
+    assert spans["failure"]["status"] == {
+        "status_code": "ERROR",
+        "description": "ValueError: boom",
+    }
+
+
+def test_span_with_parent_context():
+    context = tracing.current_context()
+    assert context.span_id is None
+    with tracing.span("task", parent=context) as task:
+        assert task.context.trace_id == context.trace_id
+        assert task.parent_id is None
+        assert tracing.current_context() == task.context
+
+
+def test_trace_id_filter():
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, "msg", (), None)
+    trace_filter = tracing.TraceIdFilter()
+    assert trace_filter.filter(record)
+    assert record.trace_id == "-"
+    with tracing.span("operation") as operation:
+        trace_filter.filter(record)
+    assert record.trace_id == operation.context.trace_id
@@ -19,6 +19,12 @@ COMPRESS_ORDER_ONE = "1"
 COMPRESS_ORDER_TWO = "2"
 
 
+@pytest.fixture(autouse=True)
+def no_parallel_compressors(mocker):
+    """Make the tests independent of the compression programs installed."""
+    return mocker.patch("common.utils.find_executable", return_value=None)
+
+
 @pytest.mark.parametrize(
     "pronom,algorithm,compression",
     [
@@ -28,6 +34,7 @@ COMPRESS_ORDER_TWO = "2"
         (utils.PRONOM_7Z, "unknown algo", utils.COMPRESSION_7Z_BZIP),
         (utils.PRONOM_BZIP2, "", utils.COMPRESSION_TAR_BZIP2),
         (utils.PRONOM_GZIP, "", utils.COMPRESSION_TAR_GZIP),
+        ("", utils.COMPRESS_ALGO_ZSTD, utils.COMPRESSION_TAR_ZSTD),
         ("unknown pronom", "", utils.COMPRESSION_7Z_BZIP),
     ],
 )
@@ -47,6 +54,36 @@ def test_get_compression(pronom, algorithm, compression):
     )
 
 
+def test_get_pointer_metadata():
+    xml = (
+        '<?xml version="1.0"?>'
+        '<mets:mets xmlns:mets="http://www.loc.gov/METS/" xmlns:premis="http://www.loc.gov/premis/v3">'
+        " <premis:object><premis:objectCharacteristics>"
+        "  <premis:compositionLevel>2</premis:compositionLevel>"
+        "  <premis:fixity>"
+        "   <premis:messageDigestAlgorithm>sha256</premis:messageDigestAlgorithm>"
+        "   <premis:messageDigest>abc123</premis:messageDigest>"
+        "  </premis:fixity>"
+        "  <premis:format><premis:formatRegistry>"
+        "   <premis:formatRegistryKey>fmt/484</premis:formatRegistryKey>"
+        "  </premis:formatRegistry></premis:format>"
+        "  <premis:inhibitors><premis:inhibitorType>GPG</premis:inhibitorType>"
+        "  </premis:inhibitors>"
+        " </premis:objectCharacteristics></premis:object>"
+        ' <mets:transformFile TRANSFORMALGORITHM="bzip2"></mets:transformFile>'
+        "</mets:mets>"
+    )
+
+    assert utils.get_pointer_metadata(StringIO(xml)) == {
+        "compression": utils.COMPRESSION_7Z_BZIP,
+        "format_registry_key": "fmt/484",
+        "message_digest": "abc123",
+        "message_digest_algorithm": "sha256",
+        "composition_level": 2,
+        "inhibitor_type": "GPG",
+    }
+
+
 @pytest.mark.parametrize(
     "compression,command",
     [
@@ -71,6 +108,10 @@ def test_get_compression(pronom, algorithm, compression):
             utils.COMPRESSION_TAR_BZIP2,
             "tar c -j -C /full -f /extract/filename.tar.bz2 path",
         ),
+        (
+            utils.COMPRESSION_TAR_ZSTD,
+            "tar c --use-compress-program=zstd -T0 -C /full -f /extract/filename.tar.zst path",
+        ),
     ],
 )
 def test_get_compress_command(compression, command):
@@ -84,6 +125,71 @@ def test_get_compress_command(compression, command):
     )
 
 
+@pytest.mark.parametrize(
+    "compression,threads,installed,command",
+    [
+        (
+            utils.COMPRESSION_7Z_BZIP,
+            4,
+            [],
+            "7z a -bd -t7z -y -m0=bzip2 -mtc=on -mtm=on -mta=on -mmt=4 /extract/filename.7z /full/path",
+        ),
+        (
+            utils.COMPRESSION_TAR_BZIP2,
+            0,
+            ["pbzip2"],
+            "tar c --use-compress-program=pbzip2 -C /full -f /extract/filename.tar.bz2 path",
+        ),
+        (
+            utils.COMPRESSION_TAR_BZIP2,
+            4,
+            ["lbzip2", "pbzip2"],
+            "tar c --use-compress-program=lbzip2 -n 4 -C /full -f /extract/filename.tar.bz2 path",
+        ),
+        (
+            utils.COMPRESSION_TAR_GZIP,
+            4,
+            ["pigz"],
+            "tar c --use-compress-program=pigz -p 4 -C /full -f /extract/filename.tar.gz path",
+        ),
+        (
+            utils.COMPRESSION_TAR_GZIP,
+            1,
+            ["pigz"],
+            "tar c -z -C /full -f /extract/filename.tar.gz path",
+        ),
+        (
+            utils.COMPRESSION_TAR_ZSTD,
+            1,
+            [],
+            "tar c --use-compress-program=zstd -T1 -C /full -f /extract/filename.tar.zst path",
+        ),
+    ],
+)
+def test_get_compress_command_threads(
+    settings, no_parallel_compressors, compression, threads, installed, command
+):
+    settings.COMPRESSION_THREADS = threads
+    no_parallel_compressors.side_effect = lambda program: (
+        "/usr/bin/" + program if program in installed else None
+    )
+    cmd, _ = utils.get_compress_command(
+        compression, "/extract/", "filename", "/full/path"
+    )
+    assert " ".join(cmd) == command
+
+
+def test_get_update_command(settings):
+    settings.COMPRESSION_THREADS = 2
+    cmd = utils.get_update_command(utils.COMPRESSION_7Z_LZMA, "/aip.7z", ["aip"])
+    assert " ".join(cmd) == (
+        "7z u -bd -t7z -y -up1q1r2x2y2z2w2 -m0=lzma -mtc=on -mtm=on -mta=on"
+        " -mmt=2 /aip.7z aip"
+    )
+    with pytest.raises(NotImplementedError):
+        utils.get_update_command(utils.COMPRESSION_TAR_GZIP, "/aip.tar.gz", ["aip"])
+
+
 @pytest.mark.parametrize(
     "compression,command",
     [
@@ -111,6 +217,10 @@ def test_get_compress_command(compression, command):
             utils.COMPRESSION_TAR_BZIP2,
             'echo program="tar"\\; algorithm="-j"\\; version="`tar --version | grep tar`"',
         ),
+        (
+            utils.COMPRESSION_TAR_ZSTD,
+            'echo program="tar"\\; algorithm="zstd"\\; version="`tar --version | grep tar`"',
+        ),
     ],
 )
 def test_get_tool_info_command(compression, command):
@@ -250,6 +360,24 @@ def test_get_compression_event_detail(
                 },
             ],
         ),
+        (
+            utils.COMPRESSION_TAR_ZSTD,
+            PROG_VERS_TAR,
+            utils.COMPRESS_EXTENSION_ZSTD,
+            utils.COMPRESS_PROGRAM_TAR,
+            [
+                {
+                    "type": utils.DECOMPRESS_TRANSFORM_TYPE,
+                    "order": COMPRESS_ORDER_ONE,
+                    "algorithm": utils.COMPRESS_ALGO_ZSTD,
+                },
+                {
+                    "type": utils.DECOMPRESS_TRANSFORM_TYPE,
+                    "order": COMPRESS_ORDER_TWO,
+                    "algorithm": utils.COMPRESS_ALGO_TAR,
+                },
+            ],
+        ),
     ],
 )
 def test_get_format_info(compression, version, extension, program_name, transform):
@@ -262,3 +390,42 @@ def test_get_format_info(compression, version, extension, program_name, transfor
     assert ext == extension
     assert program_name in prog_name
     assert fsentry.transform_files == transform
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_map_concurrently(max_workers):
+    assert utils.map_concurrently(lambda x: x * 2, range(10), max_workers) == [
+        x * 2 for x in range(10)
+    ]
+
+
+@pytest.mark.parametrize(
+    "space_processes,default,gevent,processes",
+    [
+        (None, 2, False, 2),
+        (None, 0, False, 8),
+        (4, 2, False, 4),
+        (4, 2, True, 1),
+        (None, 0, True, 1),
+    ],
+)
+def test_get_bag_validation_processes(
+    settings, space_processes, default, gevent, processes
+):
+    settings.BAG_VALIDATION_NO_PROCESSES = default
+    space = mock.Mock(bag_validation_processes=space_processes)
+    with mock.patch(
+        "common.utils.multiprocessing.cpu_count", return_value=8
+    ), mock.patch("common.utils._is_gevent_patched", return_value=gevent):
+        assert utils.get_bag_validation_processes(space) == processes
+
+
+@mock.patch("common.utils.time.time", side_effect=[0, 2, 10, 11, 20, 24])
+def test_stage_timings(time):
+    timings = utils.StageTimings()
+    for stage in ("fetch", "extract", "fetch"):
+        with timings.stage(stage):
+            pass
+
+    assert list(timings.durations.items()) == [("fetch", 6), ("extract", 1)]
+    assert str(timings) == "fetch: 6.00s, extract: 1.00s"
@@ -0,0 +1,215 @@
+"""Tracing of the storage operations.
+
+A span records the duration of a stage of an operation (e.g. the move of a
+package, a call to rsync or 7z) and is nested in the span of the operation it
+is part of; all the spans of an operation share its trace ID. The spans follow
+the data model of OpenTelemetry (128-bit trace IDs, 64-bit span IDs, parent
+span, status and attributes) and are exported in the JSON format of its
+console exporter, without depending on the OpenTelemetry SDK.
+
+``settings.TRACING_EXPORTER`` selects the exporter: ``none`` (the default)
+drops the spans, ``json`` appends them to ``settings.TRACING_FILE``, one JSON
+object per line. The trace IDs are kept in either case: they are recorded on
+the ``Async`` model of the asynchronous tasks and added to the log records
+by ``TraceIdFilter``.
+"""
+from __future__ import absolute_import
+from collections import namedtuple
+from contextlib import contextmanager
+import datetime
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+LOGGER = logging.getLogger(__name__)
+
+SERVICE_NAME = "archivematica-storage-service"
+
+SpanContext = namedtuple("SpanContext", ["trace_id", "span_id"])
+
+# Spans in progress in the current thread (or greenlet, under gevent)
+_local = threading.local()
+
+
+class Span(object):
+    """A timed stage of an operation."""
+
+    def __init__(self, name, context, parent_id=None, attributes=None):
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time()
+        self.end_time = None
+        self.status = "UNSET"
+        self.description = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def record_error(self, error):
+        """Set the status of this span to the failure ``error``."""
+        self.status = "ERROR"
+        self.description = "{}: {}".format(type(error).__name__, error)
+
+    def to_dict(self):
+        """Return the span in the JSON format of OpenTelemetry."""
+        status = {"status_code": self.status}
+        if self.description:
+            status["description"] = self.description
+        return {
+            "name": self.name,
+            "context": {
+                "trace_id": "0x" + self.context.trace_id,
+                "span_id": "0x" + self.context.span_id,
+                "trace_state": "[]",
+            },
+            "kind": "SpanKind.INTERNAL",
+            "parent_id": "0x" + self.parent_id if self.parent_id else None,
+            "start_time": _format_time(self.start_time),
+            "end_time": _format_time(self.end_time),
+            "status": status,
+            "attributes": self.attributes,
+            "resource": {"service.name": SERVICE_NAME},
+        }
+
+
+class NoOpExporter(object):
+    """Drop the spans."""
+
+    def export(self, span):
+        pass
+
+
+class JSONFileExporter(object):
+    """Append the spans to the file at ``path``, one JSON object per line."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), sort_keys=True) + "\n"
+        try:
+            with self.lock, open(self.path, "a") as f:
+                f.write(line)
+        except EnvironmentError as err:
+            LOGGER.warning("Unable to export span %s: %s", span.name, err)
+
+
+EXPORTERS = {"none": lambda path: NoOpExporter(), "json": JSONFileExporter}
+
+_exporters = {}
+
+
+def get_exporter():
+    """Return the exporter configured in the settings."""
+    key = (settings.TRACING_EXPORTER, settings.TRACING_FILE)
+    if key not in _exporters:
+        try:
+            _exporters[key] = EXPORTERS[key[0]](key[1])
+        except KeyError:
+            LOGGER.warning("Unknown tracing exporter %s, spans are dropped", key[0])
+            _exporters[key] = NoOpExporter()
+    return _exporters[key]
+
+
+def _spans():
+    if not hasattr(_local, "spans"):
+        _local.spans = []
+    return _local.spans
+
+
+def current_span():
+    """Return the innermost span in progress in this thread, or None."""
+    spans = _spans()
+    return spans[-1] if spans else None
+
+
+def current_trace_id():
+    """Return the trace ID of the span in progress in this thread, or None."""
+    current = current_span()
+    return current.context.trace_id if current else None
+
+
+def current_context():
+    """Return the context that the spans of a task started from this thread
+    should have as parent: the context of the span in progress or, outside
+    spans, a new trace."""
+    current = current_span()
+    if current:
+        return current.context
+    return SpanContext(uuid.uuid4().hex, None)
+
+
+@contextmanager
+def span(name, attributes=None, parent=None):
+    """Record the block as the span ``name``, child of the ``parent``
+    context or of the span in progress in this thread."""
+    spans = _spans()
+    if parent is None and spans:
+        parent = spans[-1].context
+    trace_id = parent.trace_id if parent else uuid.uuid4().hex
+    new_span = Span(
+        name,
+        SpanContext(trace_id, uuid.uuid4().hex[:16]),
+        parent_id=parent.span_id if parent else None,
+        attributes=attributes,
+    )
+    spans.append(new_span)
+    try:
+        yield new_span
+    except Exception as err:
+        new_span.record_error(err)
+        raise
+    else:
+        if new_span.status == "UNSET":
+            new_span.status = "OK"
+    finally:
+        spans.pop()
+        new_span.end_time = time.time()
+        get_exporter().export(new_span)
+
+
+def traced(name):
+    """Decorate a function to record its calls as the span ``name``."""
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def command_span(command):
+    """Return a span recording the run of the external ``command`` (a list
+    of arguments), named after its program."""
+    program = os.path.basename(command[0])
+    return span(
+        program, {"process.command": program, "process.command_args": list(command)}
+    )
+
+
+class TraceIdFilter(logging.Filter):
+    """Add the ``trace_id`` of the span in progress to the log records, or
+    ``-`` outside spans."""
+
+    def filter(self, record):
+        record.trace_id = current_trace_id() or "-"
+        return True
+
+
+def _format_time(timestamp):
+    if timestamp is None:
+        return None
+    return datetime.datetime.utcfromtimestamp(timestamp).isoformat() + "Z"
@@ -1,25 +1,34 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
 import ast
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
 import datetime
+from distutils.spawn import find_executable
+import errno
 import hashlib
 import logging
 from lxml import etree
 from lxml.builder import ElementMaker
 import mimetypes
+import multiprocessing
 import os
 import shutil
 import subprocess
+import sys
+import time
 import uuid
 
+from concurrent import futures
 import scandir
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from django import http
 from django.utils.translation import ugettext as _
 from django.utils import six
 
 from administration import models
+from common import tracing
 from storage_service import __version__ as ss_version
 from six.moves import range
 
@@ -47,6 +56,7 @@ COMPRESSION_7Z_COPY = "7z without compression"
 COMPRESSION_TAR = "tar"
 COMPRESSION_TAR_BZIP2 = "tar bz2"
 COMPRESSION_TAR_GZIP = "tar gz"
+COMPRESSION_TAR_ZSTD = "tar zstd"
 COMPRESSION_ALGORITHMS = (
     COMPRESSION_7Z_BZIP,
     COMPRESSION_7Z_LZMA,
@@ -54,6 +64,13 @@ COMPRESSION_ALGORITHMS = (
     COMPRESSION_TAR,
     COMPRESSION_TAR_BZIP2,
     COMPRESSION_TAR_GZIP,
+    COMPRESSION_TAR_ZSTD,
+)
+COMPRESSION_TAR_ALGORITHMS = (
+    COMPRESSION_TAR,
+    COMPRESSION_TAR_BZIP2,
+    COMPRESSION_TAR_GZIP,
+    COMPRESSION_TAR_ZSTD,
 )
 
 PRONOM_7Z = "fmt/484"
@@ -65,15 +82,18 @@ COMPRESS_ALGO_LZMA = "lzma"
 COMPRESS_ALGO_BZIP2 = "bzip2"
 COMPRESS_ALGO_TAR = "tar"
 COMPRESS_ALGO_GZIP = "gzip"
+COMPRESS_ALGO_ZSTD = "zstd"
 
 COMPRESS_EXTENSION_7Z = ".7z"
 COMPRESS_EXTENSION_BZIP2 = ".bz2"
 COMPRESS_EXTENSION_GZIP = ".gz"
+COMPRESS_EXTENSION_ZSTD = ".zst"
 
 COMPRESS_EXTENSIONS = (
     COMPRESS_EXTENSION_7Z,
     COMPRESS_EXTENSION_BZIP2,
     COMPRESS_EXTENSION_GZIP,
+    COMPRESS_EXTENSION_ZSTD,
 )
 
 PACKAGE_EXTENSIONS = (".tar",) + COMPRESS_EXTENSIONS
@@ -81,6 +101,22 @@ PACKAGE_EXTENSIONS = (".tar",) + COMPRESS_EXTENSIONS
 COMPRESS_PROGRAM_7Z = "7-Zip"
 COMPRESS_PROGRAM_TAR = "tar"
 
+# Multi-threaded programs producing the same format as the compression
+# algorithm, in order of preference, with their option setting the number of
+# threads. tar uses the first one installed instead of its -j/-z options.
+PARALLEL_COMPRESSORS = {
+    COMPRESS_ALGO_BZIP2: (("lbzip2", "-n {}"), ("pbzip2", "-p{}")),
+    COMPRESS_ALGO_GZIP: (("pigz", "-p {}"),),
+    COMPRESS_ALGO_ZSTD: (("zstd", "-T{}"),),
+}
+
+# Compression algorithm applied by tar for each compression option.
+TAR_COMPRESS_ALGOS = {
+    COMPRESSION_TAR_BZIP2: COMPRESS_ALGO_BZIP2,
+    COMPRESSION_TAR_GZIP: COMPRESS_ALGO_GZIP,
+    COMPRESSION_TAR_ZSTD: COMPRESS_ALGO_ZSTD,
+}
+
 PREFIX_NS = {k: "{" + v + "}" for k, v in NSMAP.items()}
 
 DECOMPRESS_TRANSFORM_TYPE = "decompression"
@@ -157,10 +193,13 @@ def download_file_stream(filepath, temp_dir=None):
     """
     Returns `filepath` as a HttpResponse stream.
 
-    Deletes temp_dir once stream created if it exists.
+    Deletes temp_dir once stream created if it exists, or if the file is not
+    found.
     """
     # If not found, return 404
     if not os.path.exists(filepath):
+        if temp_dir and os.path.exists(temp_dir):
+            shutil.rmtree(temp_dir, ignore_errors=True)
         return http.HttpResponseNotFound(_("File not found"))
 
     filename = os.path.basename(filepath)
@@ -299,10 +338,14 @@ def get_compression(pointer_path):
     """Return the compression algorithm used to compress the package, as
     documented in the pointer file at ``pointer_path``.
 
-    :param pointer_path: path to xml pointer file
+    :param pointer_path: path to xml pointer file, or the pointer file
+        already parsed as an lxml tree.
     :returns: one of the constants in ``COMPRESSION_ALGORITHMS``.
     """
-    doc = etree.parse(pointer_path)
+    if isinstance(pointer_path, etree._ElementTree):
+        doc = pointer_path
+    else:
+        doc = etree.parse(pointer_path)
 
     puid = doc.findtext(".//premis:formatRegistryKey", namespaces=NSMAP)
     if puid is None:
@@ -328,6 +371,12 @@ def get_compression(pointer_path):
         return COMPRESSION_TAR_BZIP2
     elif puid == PRONOM_GZIP:
         return COMPRESSION_TAR_GZIP
+    elif COMPRESS_ALGO_ZSTD in [
+        transform.get("TRANSFORMALGORITHM")
+        for transform in doc.findall(".//mets:transformFile", namespaces=NSMAP)
+    ]:
+        # No PRONOM identifier is recorded for Zstandard archives
+        return COMPRESSION_TAR_ZSTD
     else:
         LOGGER.warning(
             "Unable to determine reingested file format,"
@@ -336,6 +385,92 @@ def get_compression(pointer_path):
         return COMPRESSION_7Z_BZIP
 
 
+def get_pointer_metadata(pointer_path):
+    """Return what the pointer file at ``pointer_path`` records about its
+    package, as the values of the ``Package`` fields of the same names.
+
+    :param pointer_path: path to xml pointer file, or the pointer file
+        already parsed as an lxml tree.
+    :returns: dict with keys ``compression``, ``format_registry_key``,
+        ``message_digest``, ``message_digest_algorithm``,
+        ``composition_level`` and ``inhibitor_type``.
+    """
+    if isinstance(pointer_path, etree._ElementTree):
+        doc = pointer_path
+    else:
+        doc = etree.parse(pointer_path)
+
+    premis_object = None
+    for prefix in ("premis", "premis3"):
+        premis_object = doc.find(".//{}:object".format(prefix), namespaces=NSMAP)
+        if premis_object is not None:
+            break
+
+    def find(path):
+        if premis_object is None:
+            return ""
+        value = premis_object.findtext(path.format(prefix), namespaces=NSMAP)
+        return (value or "").strip()
+
+    try:
+        composition_level = int(find("{0}:objectCharacteristics/{0}:compositionLevel"))
+    except ValueError:
+        composition_level = None
+    return {
+        "compression": get_compression(doc),
+        "format_registry_key": find(".//{0}:formatRegistryKey"),
+        "message_digest": find(".//{0}:fixity/{0}:messageDigest"),
+        "message_digest_algorithm": find(".//{0}:fixity/{0}:messageDigestAlgorithm"),
+        "composition_level": composition_level,
+        "inhibitor_type": find(".//{0}:inhibitors/{0}:inhibitorType"),
+    }
+
+
+def get_compression_from_extension(path):
+    """Return the compression of the tar archive at ``path`` as told by its
+    extension, or None if the extension does not tell (e.g. 7z archives,
+    whose compression method is only recorded in pointer files).
+
+    :returns: one of the constants in ``COMPRESSION_ALGORITHMS`` or None.
+    """
+    for extension, compression in (
+        (".tar", COMPRESSION_TAR),
+        (".tar" + COMPRESS_EXTENSION_BZIP2, COMPRESSION_TAR_BZIP2),
+        (".tar" + COMPRESS_EXTENSION_GZIP, COMPRESSION_TAR_GZIP),
+        (".tar" + COMPRESS_EXTENSION_ZSTD, COMPRESSION_TAR_ZSTD),
+    ):
+        if path.endswith(extension):
+            return compression
+    return None
+
+
+def get_tar_compress_program(compression):
+    """Return the multi-threaded program tar should run to compress or
+    decompress an archive with ``compression``, or None if tar's own -j/-z
+    options should be used.
+
+    ``settings.COMPRESSION_THREADS`` is the number of threads the program may
+    use; with 0 it uses all CPUs and with 1 the multi-threaded bzip2 and gzip
+    programs are not used.
+
+    :param compression: one of the constants in ``COMPRESSION_ALGORITHMS``.
+    :returns: program and its options, as a string for tar's
+        ``--use-compress-program``, or None.
+    """
+    algo = TAR_COMPRESS_ALGOS.get(compression)
+    threads = settings.COMPRESSION_THREADS
+    if algo is None or (threads == 1 and algo != COMPRESS_ALGO_ZSTD):
+        return None
+    for program, threads_option in PARALLEL_COMPRESSORS[algo]:
+        if algo == COMPRESS_ALGO_ZSTD:
+            return "{} {}".format(program, threads_option.format(threads))
+        if find_executable(program):
+            if threads > 1:
+                return "{} {}".format(program, threads_option.format(threads))
+            return program
+    return None
+
+
 def get_compress_command(compression, extract_path, basename, full_path):
     """Return command for compressing the package
 
@@ -347,16 +482,21 @@ def get_compress_command(compression, extract_path, basename, full_path):
         `command` is the compression command (as a list of strings)
         `compressed_filename` is the full path to the compressed file
     """
-    if compression in (COMPRESSION_TAR, COMPRESSION_TAR_BZIP2, COMPRESSION_TAR_GZIP):
+    if compression in COMPRESSION_TAR_ALGORITHMS:
         compressed_filename = os.path.join(extract_path, basename + ".tar")
         relative_path = os.path.dirname(full_path)
         algo = ""
         if compression == COMPRESSION_TAR_BZIP2:
             algo = "-j"  # Compress with bzip2
-            compressed_filename += ".bz2"
+            compressed_filename += COMPRESS_EXTENSION_BZIP2
         elif compression == COMPRESSION_TAR_GZIP:
             algo = "-z"  # Compress with gzip
-            compressed_filename += ".gz"
+            compressed_filename += COMPRESS_EXTENSION_GZIP
+        elif compression == COMPRESSION_TAR_ZSTD:
+            compressed_filename += COMPRESS_EXTENSION_ZSTD
+        program = get_tar_compress_program(compression)
+        if program:
+            algo = "--use-compress-program=" + program  # Multi-threaded
         command = [
             "tar",
             "c",  # Create tar
@@ -385,7 +525,7 @@ def get_compress_command(compression, extract_path, basename, full_path):
             "-mtc=on",
             "-mtm=on",
             "-mta=on",  # Keep timestamps (create, mod, access)
-            "-mmt=on",  # Multithreaded
+            "-mmt=" + _7z_threads(),  # Multithreaded
             compressed_filename,  # Destination
             full_path,  # Source
         ]
@@ -399,16 +539,80 @@ def get_compress_command(compression, extract_path, basename, full_path):
     return (command, compressed_filename)
 
 
+def _7z_threads():
+    """Return the value of 7z's -mmt option."""
+    if settings.COMPRESSION_THREADS > 0:
+        return str(settings.COMPRESSION_THREADS)
+    return "on"
+
+
+def get_update_command(compression, archive_path, paths):
+    """Return the command adding or replacing ``paths`` (relative to the
+    working directory of the command) in the archive at ``archive_path``,
+    leaving its other files as they are. Only 7z archives can be updated,
+    without recompressing the solid blocks holding none of ``paths``.
+
+    :param compression: one of the 7z constants in ``COMPRESSION_ALGORITHMS``.
+    :returns: the command as a list of strings.
+    """
+    try:
+        algo = {
+            COMPRESSION_7Z_BZIP: COMPRESS_ALGO_BZIP2,
+            COMPRESSION_7Z_LZMA: COMPRESS_ALGO_LZMA,
+            COMPRESSION_7Z_COPY: COMPRESS_ALGO_7Z_COPY,
+        }[compression]
+    except KeyError:
+        raise NotImplementedError(
+            _("Algorithm %(algorithm)s not implemented") % {"algorithm": compression}
+        )
+    return [
+        "7z",
+        "u",  # Update
+        "-bd",  # Disable percentage indicator
+        "-t7z",  # Type of archive
+        "-y",  # Assume Yes on all queries
+        # Keep the files missing from ``paths``, replace the others
+        "-up1q1r2x2y2z2w2",
+        "-m0=" + algo,  # Compression method
+        "-mtc=on",
+        "-mtm=on",
+        "-mta=on",  # Keep timestamps (create, mod, access)
+        "-mmt=" + _7z_threads(),  # Multithreaded
+        archive_path,
+    ] + list(paths)
+
+
+def get_7z_file_sizes(archive_path, paths):
+    """Return the size of the files at ``paths`` in the 7z archive at
+    ``archive_path`` as a dict {path: size}, without the missing ones."""
+    command = ["7z", "l", "-slt", archive_path] + list(paths)
+    with tracing.command_span(command):
+        output = subprocess.check_output(command).decode("utf8")
+    sizes = {}
+    path = None
+    for line in output.splitlines():
+        key, __, value = line.partition(" = ")
+        if key == "Path":
+            path = value
+        elif key == "Size" and path in paths:
+            sizes[path] = int(value)
+    return sizes
+
+
 def get_tool_info_command(compression):
     """Return command for outputting compression tool details
 
     :param compression: one of the constants in ``COMPRESSION_ALGORITHMS``.
     :returns: command in string format
     """
-    if compression in (COMPRESSION_TAR, COMPRESSION_TAR_BZIP2, COMPRESSION_TAR_GZIP):
-        algo = {COMPRESSION_TAR_BZIP2: "-j", COMPRESSION_TAR_GZIP: "-z"}.get(
-            compression, ""
-        )
+    if compression in COMPRESSION_TAR_ALGORITHMS:
+        program = get_tar_compress_program(compression)
+        if program:
+            algo = program.split()[0]
+        else:
+            algo = {COMPRESSION_TAR_BZIP2: "-j", COMPRESSION_TAR_GZIP: "-z"}.get(
+                compression, ""
+            )
 
         tool_info_command = (
             'echo program="tar"\\; '
@@ -459,7 +663,7 @@ def get_compression_event_detail(compression):
             event_detail = 'program="7z"; version="{}"'.format(version)
         except (subprocess.CalledProcessError, Exception):
             event_detail = 'program="7z"'
-    elif compression in (COMPRESSION_TAR_BZIP2, COMPRESSION_TAR, COMPRESSION_TAR_GZIP):
+    elif compression in COMPRESSION_TAR_ALGORITHMS:
         try:
             version = get_tar_version()
             event_detail = 'program="tar"; version="{}"'.format(version)
@@ -527,10 +731,10 @@ def set_compression_transforms(aip, compression, transform_order):
         extension = COMPRESS_EXTENSION_BZIP2
         program_name = "tar"
 
-    elif compression == COMPRESSION_TAR_GZIP:
+    elif compression in (COMPRESSION_TAR_GZIP, COMPRESSION_TAR_ZSTD):
         aip.transform_files.append(
             {
-                "algorithm": COMPRESS_ALGO_GZIP,
+                "algorithm": TAR_COMPRESS_ALGOS[compression],
                 "order": str(transform_order),
                 "type": DECOMPRESS_TRANSFORM_TYPE,
             }
@@ -544,7 +748,10 @@ def set_compression_transforms(aip, compression, transform_order):
             }
         )
         version = get_tar_version()
-        extension = COMPRESS_EXTENSION_GZIP
+        extension = {
+            COMPRESSION_TAR_GZIP: COMPRESS_EXTENSION_GZIP,
+            COMPRESSION_TAR_ZSTD: COMPRESS_EXTENSION_ZSTD,
+        }[compression]
         program_name = "tar"
 
     else:
@@ -613,6 +820,15 @@ def coerce_str(string):
     return string
 
 
+def process_exists(pid):
+    """Return True if a process with ID ``pid`` runs on this host."""
+    try:
+        os.kill(pid, 0)
+    except OSError as err:
+        return err.errno != errno.ESRCH
+    return True
+
+
 StorageEffects = namedtuple(
     "StorageEffects", ["events", "composition_level_updater", "inhibitors"]
 )
@@ -632,3 +848,102 @@ def recalculate_size(rein_aip_internal_path):
     else:
         size = os.path.getsize(rein_aip_internal_path)
     return size
+
+
+class StageTimings(object):
+    """Time spent in each stage of a long operation, in seconds."""
+
+    def __init__(self):
+        self.durations = OrderedDict()
+
+    @contextmanager
+    def stage(self, name):
+        """Add the time spent in the block to the duration of stage ``name``."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.durations[name] = self.durations.get(name, 0) + time.time() - start
+
+    def __str__(self):
+        return ", ".join(
+            "{}: {:.2f}s".format(name, duration)
+            for name, duration in self.durations.items()
+        )
+
+
+def map_concurrently(function, items, max_workers):
+    """Return the list of ``function(item)`` for every item of ``items``,
+    computed by up to ``max_workers`` threads (in this thread if 1).
+
+    ``function`` should not use the database: the threads have their own
+    connections, which don't see the uncommitted changes of this one.
+    """
+    items = list(items)
+    if max_workers <= 1 or len(items) <= 1:
+        return [function(item) for item in items]
+    with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(function, items))
+
+
+def get_bag_validation_processes(space=None):
+    """Return the number of processes validating bags stored in ``space``:
+    its own setting if any (e.g. measured by the benchmark_bag_validation
+    command), ``settings.BAG_VALIDATION_NO_PROCESSES`` otherwise, one per CPU
+    if that is 0. Always 1 in gevent workers, where multiprocessing hangs.
+    """
+    if _is_gevent_patched():
+        return 1
+    processes = getattr(space, "bag_validation_processes", None)
+    if processes is None:
+        processes = settings.BAG_VALIDATION_NO_PROCESSES
+    if processes <= 0:
+        try:
+            processes = multiprocessing.cpu_count()
+        except NotImplementedError:
+            processes = 1
+    return processes
+
+
+def _is_gevent_patched():
+    monkey = sys.modules.get("gevent.monkey")
+    return monkey is not None and monkey.is_module_patched("os")
+
+
+def map_in_processes(function, items, processes):
+    """Return the list of ``function(item)`` for every item of ``items``,
+    computed by a pool of ``processes`` processes (in this process if 1).
+
+    ``function`` and the items must be picklable. Like bagit's, the pool
+    cannot be used with gevent workers (see ``get_bag_validation_processes``).
+    """
+    items = list(items)
+    if processes <= 1 or len(items) <= 1:
+        return [function(item) for item in items]
+    pool = multiprocessing.Pool(processes=processes)
+    try:
+        return pool.map(function, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def imap_in_processes(function, items, processes):
+    """Yield ``function(item)`` for every item of ``items``, in any order, as
+    they are computed by a pool of ``processes`` processes (in this process
+    if 1). The pool is terminated if the iteration is stopped early.
+
+    ``function`` and the items must be picklable (see ``map_in_processes``).
+    """
+    items = list(items)
+    if processes <= 1 or len(items) <= 1:
+        for item in items:
+            yield function(item)
+        return
+    pool = multiprocessing.Pool(processes=processes)
+    try:
+        for result in pool.imap_unordered(function, items):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
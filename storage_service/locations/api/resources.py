@@ -19,7 +19,7 @@ from django.conf import settings
 from django.conf.urls import url
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
 from django.core.urlresolvers import reverse
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, StreamingHttpResponse
 from django.forms.models import model_to_dict
 from django.utils.translation import ugettext as _
 from django.utils import six
@@ -36,13 +36,14 @@ from tastypie.authorization import DjangoAuthorization
 import tastypie.exceptions
 from tastypie import fields
 from tastypie import http
+from tastypie.paginator import Paginator
 from tastypie.resources import ModelResource, ALL, ALL_WITH_RELATIONS
 from tastypie.validation import CleanedDataFormValidation
 from tastypie.utils import trailing_slash, dict_strip_unicode_keys
 
 # This project, alphabetical
 from administration.models import Settings
-from common import utils
+from common import progress, utils
 from locations.api.sword import views as sword_views
 
 from ..models import (
@@ -50,6 +51,7 @@ from ..models import (
     CallbackError,
     Event,
     File,
+    InsufficientStagingSpace,
     Package,
     Location,
     LocationPipeline,
@@ -58,6 +60,7 @@ from ..models import (
     StorageException,
     Async,
     PosixMoveUnsupportedError,
+    ReplicationTask,
 )
 from ..forms import SpaceForm
 from ..constants import PROTOCOL
@@ -76,6 +79,84 @@ LOGGER = logging.getLogger(__name__)
 # See https://github.com/toastdriven/django-tastypie/issues/152 for details
 
 
+class HttpInsufficientStorage(http.HttpResponse):
+    status_code = 507
+
+
+def _insufficient_storage_response(resource, request, error):
+    """Return the response to a request rejected for lack of space to stage
+    the package (``InsufficientStagingSpace`` ``error``)."""
+    response = {"error": True, "message": six.text_type(error)}
+    return resource.create_response(
+        request, response, response_class=HttpInsufficientStorage
+    )
+
+
+class KeysetPaginator(Paginator):
+    """Paginator also supporting keyset pagination.
+
+    When the ``cursor`` parameter is given, the objects are ordered by id and
+    the page holds the ``limit`` objects following the one with the id
+    ``cursor`` (start with ``cursor=0``), and the ``next`` link of the page
+    gives the cursor of the next page. Unlike ``offset``, the last pages are
+    as fast to get as the first ones. The total count is not computed.
+    """
+
+    def page(self):
+        cursor = self.request_data.get("cursor")
+        if cursor is None:
+            return super(KeysetPaginator, self).page()
+        try:
+            cursor = int(cursor)
+        except ValueError:
+            raise tastypie.exceptions.BadRequest(
+                "Invalid cursor '%s' provided. Please provide an integer." % cursor
+            )
+        limit = self.get_limit()
+        objects = self.objects.filter(pk__gt=cursor).order_by("pk")
+        if limit:
+            objects = objects[:limit]
+        objects = list(objects)
+        meta = {"cursor": cursor, "limit": limit, "next": None}
+        if limit and len(objects) == limit:
+            meta["next"] = self._generate_cursor_uri(limit, objects[-1].pk)
+        return {self.collection_name: objects, "meta": meta}
+
+    def _generate_cursor_uri(self, limit, cursor):
+        if self.resource_uri is None:
+            return None
+        request_params = self.request_data.copy()
+        request_params.pop("offset", None)
+        request_params["limit"] = limit
+        request_params["cursor"] = cursor
+        try:
+            encoded_params = request_params.urlencode()
+        except AttributeError:
+            encoded_params = six.moves.urllib.parse.urlencode(request_params)
+        return "%s?%s" % (self.resource_uri, encoded_params)
+
+
+def _requested_fields(request):
+    """Return the set of fields listed in the ``fields`` parameter of
+    ``request``, separated by commas, or None if it has none."""
+    requested = request.GET.get("fields") if request is not None else None
+    if not requested:
+        return None
+    return set(requested.split(","))
+
+
+def _use_if_requested(field_name):
+    """Return a ``use_in`` function of a resource field, using the field
+    ``field_name`` unless the request lists others (see
+    ``_requested_fields``)."""
+
+    def use_in(bundle):
+        requested = _requested_fields(bundle.request)
+        return requested is None or field_name in requested
+
+    return use_in
+
+
 def _custom_endpoint(expected_methods=["get"], required_fields=[]):
     """
     Decorator for custom endpoints that handles boilerplate code.
@@ -197,6 +278,7 @@ class SpaceResource(ModelResource):
 
         fields = [
             "access_protocol",
+            "bag_validation_processes",
             "last_verified",
             "location_set",
             "path",
@@ -655,6 +737,13 @@ class PackageResource(ModelResource):
 
     Compress package (api/v1/file/<uuid>/compress/) supports:
     PUT: Compress an existing Package
+
+    Export (api/v1/file/export/) supports:
+    GET: All the packages matching the filters, as newline-delimited JSON
+
+    The list and export endpoints accept a ``fields`` parameter, listing the
+    fields to return separated by commas, and the list endpoint a ``cursor``
+    parameter for keyset pagination (see ``KeysetPaginator``).
     """
 
     origin_pipeline = fields.ForeignKey(PipelineResource, "origin_pipeline")
@@ -663,6 +752,7 @@ class PackageResource(ModelResource):
     current_location = fields.ForeignKey(LocationResource, "current_location")
 
     current_full_path = fields.CharField(attribute="full_path", readonly=True)
+    progress = fields.DictField(readonly=True, null=True, use_in="detail")
     related_packages = fields.ManyToManyField("self", "related_packages", null=True)
 
     replicated_package = fields.ForeignKey(
@@ -672,16 +762,33 @@ class PackageResource(ModelResource):
         "self", "replicas", null=True, blank=True, readonly=True
     )
 
+    # Read from the pointer file of the package (see
+    # Package.record_pointer_metadata)
+    compression = fields.CharField(attribute="compression", readonly=True)
+    format_registry_key = fields.CharField(
+        attribute="format_registry_key", readonly=True
+    )
+    message_digest_algorithm = fields.CharField(
+        attribute="message_digest_algorithm", readonly=True
+    )
+    message_digest = fields.CharField(attribute="message_digest", readonly=True)
+
     default_location_regex = re.compile(
         r"\/api\/v2\/location\/default\/(?P<purpose>[A-Z]{2})\/?"
     )
 
+    # Number of packages read at once by the export endpoint
+    EXPORT_BATCH_SIZE = 1000
+
     class Meta:
-        queryset = Package.objects.all()
+        queryset = Package.objects.select_related(
+            "current_location__space", "origin_pipeline", "replicated_package"
+        ).prefetch_related("related_packages", "replicas")
         authentication = MultiAuthentication(
             BasicAuthentication(), ApiKeyAuthentication(), SessionAuthentication()
         )
         authorization = DjangoAuthorization()
+        paginator_class = KeysetPaginator
         # validation = CleanedDataFormValidation(form_class=PackageForm)
         #
         # Note that this resource is exposed as 'file' to the API for
@@ -699,6 +806,11 @@ class PackageResource(ModelResource):
             "misc_attributes",
             "replicated_package",
             "replicas",
+            "compression",
+            "format_registry_key",
+            "message_digest_algorithm",
+            "message_digest",
+            "progress",
         ]
         list_allowed_methods = ["get", "post"]
         detail_allowed_methods = ["get", "put", "patch"]
@@ -712,6 +824,9 @@ class PackageResource(ModelResource):
             "uuid": ALL,
             "status": ALL,
             "related_packages": ALL_WITH_RELATIONS,
+            "compression": ALL,
+            "format_registry_key": ALL,
+            "message_digest": ALL,
         }
 
     def prepend_urls(self):
@@ -828,6 +943,12 @@ class PackageResource(ModelResource):
                 self.wrap_view("file_data"),
                 name="file_data",
             ),
+            url(
+                r"^(?P<resource_name>%s)/export%s$"
+                % (self._meta.resource_name, trailing_slash()),
+                self.wrap_view("export_request"),
+                name="export_request",
+            ),
             url(
                 r"^(?P<resource_name>%s)/(?P<%s>\w[\w/-]*)/reindex%s$"
                 % (
@@ -893,6 +1014,23 @@ class PackageResource(ModelResource):
             ),
         ]
 
+    def __init__(self, api_name=None):
+        super(PackageResource, self).__init__(api_name)
+        # Only dehydrate the fields listed in the request, if any
+        for field_name, field_object in self.fields.items():
+            if field_object.use_in == "all":
+                field_object.use_in = _use_if_requested(field_name)
+
+    def dehydrate_progress(self, bundle):
+        """Progress of the latest unfinished asynchronous task operating on
+        the package (see ``Async.progress``), if any."""
+        task = bundle.obj.async_tasks.filter(completed=False).order_by("-id").first()
+        if task is None:
+            return None
+        progress = task.progress or {}
+        progress["async_id"] = task.id
+        return progress
+
     def dehydrate_misc_attributes(self, bundle):
         """Customize serialization of misc_attributes."""
         # Serialize JSONField as dict, not as repr of a dict
@@ -902,6 +1040,9 @@ class PackageResource(ModelResource):
         """Add an encrypted boolean key to the returned package indicating
         whether it is encrypted.
         """
+        requested = _requested_fields(bundle.request)
+        if requested is not None and "encrypted" not in requested:
+            return bundle
         encrypted = False
         space = bundle.obj.current_location.space
         if space.access_protocol == Space.GPG:
@@ -1035,7 +1176,7 @@ class PackageResource(ModelResource):
 
                 return new_bundle.data
 
-            async_task = AsyncManager.run_task(task)
+            async_task = AsyncManager.run_package_task(bundle.obj, task)
 
             response = http.HttpAccepted()
 
@@ -1223,7 +1364,12 @@ class PackageResource(ModelResource):
         """Return a single file from the Package, extracting if necessary."""
         # NOTE this responds to HEAD because AtoM uses HEAD to check for the existence of a file. The storage service has no way to check if a file exists except by downloading and extracting this AIP
         # TODO this needs to be fixed so that HEAD is not identical to GET
+        # The file streamed is already open when the response is returned, so
+        # a copy of the package in the package cache can be released then
+        with bundle.obj.using_local_copy():
+            return self._extract_file_response(request, bundle)
 
+    def _extract_file_response(self, request, bundle):
         relative_path_to_file = request.GET.get("relative_path_to_file")
         if not relative_path_to_file:
             return http.HttpBadRequest(
@@ -1291,9 +1437,12 @@ class PackageResource(ModelResource):
                 )
         elif package.package_type in Package.PACKAGE_TYPE_CAN_EXTRACT:
             # If file doesn't exist, try to extract it
-            (extracted_file_path, temp_dir) = package.extract_file(
-                relative_path_to_file
-            )
+            try:
+                (extracted_file_path, temp_dir) = package.extract_file(
+                    relative_path_to_file
+                )
+            except InsufficientStagingSpace as e:
+                return _insufficient_storage_response(self, request, e)
         else:
             # If the package is compressed and we can't extract it,
             return http.HttpResponse(
@@ -1311,6 +1460,10 @@ class PackageResource(ModelResource):
         """Return the entire Package to be downloaded."""
         # NOTE this responds to HEAD because AtoM uses HEAD to check for the existence of a package. The storage service has no way to check if the package still exists except by downloading it
         # TODO this needs to be fixed so that HEAD is not identical to GET
+        with bundle.obj.using_local_copy():
+            return self._download_response(request, bundle, kwargs.get("chunk_number"))
+
+    def _download_response(self, request, bundle, lockss_au_number):
         # Get AIP details
         package = bundle.obj
         # Check if the package is in Arkivum and not actually there
@@ -1344,12 +1497,14 @@ class PackageResource(ModelResource):
                     content_type="application/json",
                     status=502,
                 )
-        lockss_au_number = kwargs.get("chunk_number")
         try:
             temp_dir = None
             full_path = package.get_download_path(lockss_au_number)
         except StorageException:
-            full_path, temp_dir = package.compress_package(utils.COMPRESSION_TAR)
+            try:
+                full_path, temp_dir = package.compress_package(utils.COMPRESSION_TAR)
+            except InsufficientStagingSpace as e:
+                return _insufficient_storage_response(self, request, e)
         response = utils.download_file_stream(full_path, temp_dir)
         return response
 
@@ -1627,12 +1782,18 @@ class PackageResource(ModelResource):
             )
 
         def task():
-            package.move(location)
+            try:
+                package.move(location)
+            except progress.TaskCancelled:
+                # The package was not moved, it is still in its location
+                package.status = Package.UPLOADED
+                package.save()
+                raise
             package.status = Package.UPLOADED
             package.save()
             return _("Package moved successfully")
 
-        async_task = AsyncManager.run_task(task)
+        async_task = AsyncManager.run_package_task(package, task)
 
         response = http.HttpAccepted()
         response["Location"] = reverse(
@@ -1859,6 +2020,41 @@ class PackageResource(ModelResource):
             status=200, content=json.dumps(response), content_type="application/json"
         )
 
+    def export_request(self, request, **kwargs):
+        """Stream the packages matching the filters of the request as
+        newline-delimited JSON, one package per line.
+
+        The packages are read by batches of ``EXPORT_BATCH_SIZE``, ordered by
+        id, so that the whole catalogue can be exported in one request.
+        """
+        self.method_check(request, allowed=["get"])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+        self.log_throttled_access(request)
+
+        objects = self.obj_get_list(
+            bundle=self.build_bundle(request=request),
+            **self.remove_api_resource_names(kwargs)
+        )
+        return StreamingHttpResponse(
+            self._export_lines(request, objects), content_type="application/x-ndjson"
+        )
+
+    def _export_lines(self, request, objects):
+        cursor = 0
+        while True:
+            batch = list(
+                objects.filter(pk__gt=cursor).order_by("pk")[: self.EXPORT_BATCH_SIZE]
+            )
+            for package in batch:
+                bundle = self.full_dehydrate(
+                    self.build_bundle(obj=package, request=request), for_list=True
+                )
+                yield self._meta.serializer.to_json(bundle) + "\n"
+            if len(batch) < self.EXPORT_BATCH_SIZE:
+                return
+            cursor = batch[-1].pk
+
     def file_data(self, request, **kwargs):
         """
         Returns file metadata as a JSON array of objects.
@@ -1946,6 +2142,8 @@ class AsyncResource(ModelResource):
             "id",
             "completed",
             "was_error",
+            "cancel_requested",
+            "trace_id",
             "created_time",
             "updated_time",
             "completed_time",
@@ -1954,12 +2152,107 @@ class AsyncResource(ModelResource):
         detail_allowed_methods = ["get"]
         detail_uri_name = "id"
 
+    def prepend_urls(self):
+        return [
+            url(
+                r"^(?P<resource_name>%s)/(?P<id>\d+)/cancel%s$"
+                % (self._meta.resource_name, trailing_slash()),
+                self.wrap_view("cancel_request"),
+                name="cancel_async",
+            )
+        ]
+
+    def cancel_request(self, request, **kwargs):
+        """Request the cancellation of a running task.
+
+        Called when a POST request is made to api/v2/async/ID/cancel/. The
+        task stops at its next checkpoint: poll it for completion as usual.
+        """
+        self.method_check(request, allowed=["post"])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+        self.log_throttled_access(request)
+        async_id = int(kwargs["id"])
+        if not Async.objects.filter(id=async_id).exists():
+            return http.HttpNotFound(_("Task %(id)s does not exist") % {"id": async_id})
+        if not AsyncManager.cancel(async_id):
+            response = {"error": True, "message": _("The task has already completed.")}
+            return self.create_response(
+                request, response, response_class=http.HttpBadRequest
+            )
+        response = {"id": async_id, "cancel_requested": True}
+        return self.create_response(request, response, response_class=http.HttpAccepted)
+
     def dehydrate(self, bundle):
-        """Pull out errors and results using our accessors so they get unpickled."""
+        """Pull out errors and results using our accessors so they get unpickled,
+        and add the progress of the task."""
         if bundle.obj.completed:
             if bundle.obj.was_error:
                 bundle.data["error"] = bundle.obj.error
             else:
                 bundle.data["result"] = bundle.obj.result
+        bundle.data["progress"] = bundle.obj.progress
 
         return bundle
+
+
+class ReplicationTaskResource(ModelResource):
+    """
+    Represents the queued replication of a package to a replicator location.
+
+    Replication lag (api/v1/replication/lag/) supports:
+    GET: Number of outstanding replications, bytes still to be replicated and
+    age of the oldest outstanding replication, for each replicator location.
+    """
+
+    package = fields.ForeignKey(PackageResource, "package")
+    location = fields.ForeignKey(LocationResource, "location")
+    replica = fields.ForeignKey(PackageResource, "replica", null=True)
+
+    class Meta:
+        queryset = ReplicationTask.objects.all()
+        resource_name = "replication"
+        authentication = MultiAuthentication(
+            BasicAuthentication(), ApiKeyAuthentication(), SessionAuthentication()
+        )
+        authorization = DjangoAuthorization()
+
+        fields = [
+            "id",
+            "status",
+            "attempts",
+            "last_error",
+            "bytes_copied",
+            "created_time",
+            "updated_time",
+            "next_attempt_time",
+            "started_time",
+            "completed_time",
+        ]
+        list_allowed_methods = ["get"]
+        detail_allowed_methods = ["get"]
+        detail_uri_name = "id"
+        filtering = {
+            "status": ALL,
+            "package": ALL_WITH_RELATIONS,
+            "location": ALL_WITH_RELATIONS,
+        }
+
+    def prepend_urls(self):
+        return [
+            url(
+                r"^(?P<resource_name>%s)/lag%s$"
+                % (self._meta.resource_name, trailing_slash()),
+                self.wrap_view("lag_request"),
+                name="replication_lag",
+            )
+        ]
+
+    def lag_request(self, request, **kwargs):
+        """Return the replication lag of every replicator location."""
+        self.method_check(request, allowed=["get"])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+        response = {"objects": ReplicationTask.lag()}
+        self.log_throttled_access(request)
+        return self.create_response(request, response)
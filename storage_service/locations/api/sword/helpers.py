@@ -179,7 +179,7 @@ def _fetch_content(deposit_uuid, objects, subdirs=None):
     fedora_password = getattr(deposit_space, "fedora_password", None)
 
     # download the files
-    temp_dir = tempfile.mkdtemp()
+    temp_dir = models.Workspace.create("sword_download")
     completed = 0
     for item in objects:
         # create download task file record
@@ -243,7 +243,7 @@ def _fetch_content(deposit_uuid, objects, subdirs=None):
             task_file.save()
 
     # remove temp dir
-    shutil.rmtree(temp_dir)
+    models.Workspace.remove(temp_dir)
 
     # record the number of successful downloads and completion time
     task.downloads_completed = completed
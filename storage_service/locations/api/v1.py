@@ -35,3 +35,9 @@ class PackageResource(resources.PackageResource):
 
 class AsyncResource(resources.AsyncResource):
     pass
+
+
+class ReplicationTaskResource(resources.ReplicationTaskResource):
+    package = fields.ForeignKey(PackageResource, "package")
+    location = fields.ForeignKey(LocationResource, "location")
+    replica = fields.ForeignKey(PackageResource, "replica", null=True)
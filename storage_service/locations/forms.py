@@ -89,7 +89,13 @@ class PipelineForm(forms.ModelForm):
 class SpaceForm(forms.ModelForm):
     class Meta:
         model = models.Space
-        fields = ("access_protocol", "size", "path", "staging_path")
+        fields = (
+            "access_protocol",
+            "size",
+            "path",
+            "staging_path",
+            "bag_validation_processes",
+        )
 
     def __init__(self, *args, **kwargs):
         super(SpaceForm, self).__init__(*args, **kwargs)
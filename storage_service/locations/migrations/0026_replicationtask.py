@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from __future__ import absolute_import
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("locations", "0025_update_package_size")]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReplicationTask",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        verbose_name="ID",
+                        serialize=False,
+                        auto_created=True,
+                        primary_key=True,
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        default="pending",
+                        max_length=8,
+                        verbose_name="Status",
+                        db_index=True,
+                        choices=[
+                            ("pending", "Pending"),
+                            ("running", "Running"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.PositiveIntegerField(
+                        default=0,
+                        help_text="Number of times this replication has been attempted.",
+                        verbose_name="Attempts",
+                    ),
+                ),
+                ("last_error", models.TextField(verbose_name="Last error", blank=True)),
+                (
+                    "bytes_copied",
+                    models.BigIntegerField(
+                        default=0,
+                        help_text="Bytes of the package found in the replicator location.",
+                        verbose_name="Bytes copied",
+                    ),
+                ),
+                ("created_time", models.DateTimeField(auto_now_add=True)),
+                ("updated_time", models.DateTimeField(auto_now=True)),
+                (
+                    "next_attempt_time",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, db_index=True
+                    ),
+                ),
+                ("started_time", models.DateTimeField(null=True, blank=True)),
+                ("completed_time", models.DateTimeField(null=True, blank=True)),
+                (
+                    "location",
+                    models.ForeignKey(
+                        related_name="replication_tasks",
+                        to="locations.Location",
+                        to_field="uuid",
+                    ),
+                ),
+                (
+                    "package",
+                    models.ForeignKey(
+                        related_name="replication_tasks",
+                        to="locations.Package",
+                        to_field="uuid",
+                    ),
+                ),
+                (
+                    "replica",
+                    models.ForeignKey(
+                        related_name="+",
+                        to_field="uuid",
+                        blank=True,
+                        to="locations.Package",
+                        null=True,
+                    ),
+                ),
+            ],
+            options={"verbose_name": "Replication task"},
+        )
+    ]
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from __future__ import absolute_import
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("locations", "0026_replicationtask")]
+
+    operations = [
+        migrations.AddField(
+            model_name="package",
+            name="base_directory",
+            field=models.TextField(
+                default="",
+                help_text="Directory all the contents of the package are nested in",
+                blank=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="package",
+            name="compressed",
+            field=models.NullBooleanField(
+                default=None,
+                help_text="True if the package is stored as a single (e.g. compressed) file, False if it is a directory",
+            ),
+        ),
+        migrations.AddField(
+            model_name="package",
+            name="compression",
+            field=models.CharField(
+                default="",
+                help_text="Compression algorithm of the package, if known",
+                max_length=32,
+                blank=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="package",
+            name="encrypted",
+            field=models.NullBooleanField(
+                default=None, help_text="True if the package is stored encrypted"
+            ),
+        ),
+    ]
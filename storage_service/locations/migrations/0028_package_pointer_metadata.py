@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from __future__ import absolute_import
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("locations", "0027_package_shape")]
+
+    operations = [
+        migrations.AddField(
+            model_name="package",
+            name="composition_level",
+            field=models.PositiveIntegerField(
+                default=None,
+                help_text="Number of transformations (e.g. compression) of the package",
+                null=True,
+                blank=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="package",
+            name="format_registry_key",
+            field=models.CharField(
+                default="",
+                help_text="PRONOM identifier of the format of the package",
+                max_length=32,
+                db_index=True,
+                blank=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="package",
+            name="inhibitor_type",
+            field=models.CharField(
+                default="",
+                help_text="Encryption of the package, if any (e.g. GPG)",
+                max_length=32,
+                blank=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="package",
+            name="message_digest",
+            field=models.CharField(
+                default="",
+                help_text="Checksum of the package",
+                max_length=128,
+                db_index=True,
+                blank=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="package",
+            name="message_digest_algorithm",
+            field=models.CharField(
+                default="",
+                help_text="Algorithm of the checksum of the package",
+                max_length=32,
+                blank=True,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="package",
+            name="compression",
+            field=models.CharField(
+                default="",
+                help_text="Compression algorithm of the package, if known",
+                max_length=32,
+                db_index=True,
+                blank=True,
+            ),
+        ),
+        migrations.AlterIndexTogether(
+            name="package", index_together=set([("current_location", "compression")])
+        ),
+    ]
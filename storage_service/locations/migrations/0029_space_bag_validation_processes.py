@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from __future__ import absolute_import
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("locations", "0028_package_pointer_metadata")]
+
+    operations = [
+        migrations.AddField(
+            model_name="space",
+            name="bag_validation_processes",
+            field=models.PositiveIntegerField(
+                help_text="Number of processes validating the bags of packages stored in this space, e.g. more for network storage or 1 for a single spinning disk (see the benchmark_bag_validation command). Leave empty to use the default (SS_BAG_VALIDATION_NO_PROCESSES).",
+                null=True,
+                verbose_name="Bag validation processes",
+                blank=True,
+            ),
+        )
+    ]
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from __future__ import absolute_import
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("locations", "0029_space_bag_validation_processes")]
+
+    operations = [
+        migrations.AddField(
+            model_name="async",
+            name="trace_id",
+            field=models.CharField(
+                help_text="ID of the trace of this task (see common.tracing).",
+                max_length=32,
+                verbose_name="Trace ID",
+                blank=True,
+            ),
+        )
+    ]
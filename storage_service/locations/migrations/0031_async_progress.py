@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from __future__ import absolute_import
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("locations", "0030_async_trace_id")]
+
+    operations = [
+        migrations.AddField(
+            model_name="async",
+            name="bytes_done",
+            field=models.BigIntegerField(
+                default=0, help_text="Bytes copied in the current stage."
+            ),
+        ),
+        migrations.AddField(
+            model_name="async",
+            name="bytes_per_second",
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name="async",
+            name="bytes_total",
+            field=models.BigIntegerField(
+                help_text="Bytes to copy in the current stage, if known.", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="async",
+            name="package",
+            field=models.ForeignKey(
+                related_name="async_tasks",
+                to_field="uuid",
+                blank=True,
+                to="locations.Package",
+                help_text="Package this task operates on, if any.",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="async",
+            name="stage",
+            field=models.CharField(
+                help_text="Current stage of this task.",
+                max_length=64,
+                verbose_name="Stage",
+                blank=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="async",
+            name="stage_started_time",
+            field=models.DateTimeField(null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from __future__ import absolute_import
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("locations", "0031_async_progress")]
+
+    operations = [
+        migrations.AddField(
+            model_name="async",
+            name="cancel_requested",
+            field=models.BooleanField(
+                default=False,
+                help_text="True if the cancellation of this task was requested.",
+                verbose_name="Cancel requested",
+            ),
+        )
+    ]
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from __future__ import absolute_import
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("locations", "0032_async_cancel")]
+
+    operations = [
+        migrations.CreateModel(
+            name="Workspace",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        verbose_name="ID",
+                        serialize=False,
+                        auto_created=True,
+                        primary_key=True,
+                    ),
+                ),
+                (
+                    "path",
+                    models.TextField(
+                        help_text="Absolute path of the directory.", verbose_name="Path"
+                    ),
+                ),
+                (
+                    "purpose",
+                    models.CharField(
+                        help_text="Operation the directory was created for.",
+                        max_length=64,
+                        verbose_name="Purpose",
+                    ),
+                ),
+                (
+                    "task",
+                    models.IntegerField(
+                        help_text="ID of the asynchronous task using the directory, if any.",
+                        null=True,
+                        verbose_name="Task",
+                        blank=True,
+                    ),
+                ),
+                ("hostname", models.CharField(max_length=255, verbose_name="Host")),
+                ("pid", models.IntegerField(verbose_name="Process ID")),
+                (
+                    "size",
+                    models.BigIntegerField(
+                        help_text="Size in bytes of the directory when last swept.",
+                        null=True,
+                        verbose_name="Size",
+                        blank=True,
+                    ),
+                ),
+                ("created_time", models.DateTimeField(auto_now_add=True)),
+                ("swept_time", models.DateTimeField(null=True, blank=True)),
+            ],
+            options={"verbose_name": "Workspace"},
+        )
+    ]
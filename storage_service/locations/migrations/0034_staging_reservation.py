@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from __future__ import absolute_import
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("locations", "0033_workspace")]
+
+    operations = [
+        migrations.CreateModel(
+            name="StagingReservation",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        verbose_name="ID",
+                        serialize=False,
+                        auto_created=True,
+                        primary_key=True,
+                    ),
+                ),
+                (
+                    "filesystem",
+                    models.CharField(
+                        help_text="Host and device ID of the filesystem.",
+                        max_length=300,
+                        verbose_name="Filesystem",
+                        db_index=True,
+                    ),
+                ),
+                ("path", models.TextField(verbose_name="Path")),
+                ("purpose", models.CharField(max_length=64, verbose_name="Purpose")),
+                (
+                    "size",
+                    models.BigIntegerField(
+                        help_text="Bytes reserved.", verbose_name="Size"
+                    ),
+                ),
+                (
+                    "task",
+                    models.IntegerField(
+                        help_text="ID of the asynchronous task holding the reservation, if any.",
+                        null=True,
+                        verbose_name="Task",
+                        blank=True,
+                    ),
+                ),
+                ("pid", models.IntegerField(verbose_name="Process ID")),
+                ("created_time", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={"verbose_name": "Staging reservation"},
+        )
+    ]
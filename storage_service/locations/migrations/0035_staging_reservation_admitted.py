@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from __future__ import absolute_import
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [("locations", "0034_staging_reservation")]
+
+    operations = [
+        migrations.AddField(
+            model_name="stagingreservation",
+            name="admitted",
+            field=models.BooleanField(
+                default=False,
+                help_text="Whether the operation stopped waiting for the space.",
+                verbose_name="Admitted",
+            ),
+        )
+    ]
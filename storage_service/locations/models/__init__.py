@@ -24,6 +24,9 @@ from .package import *
 from .pipeline import *
 from .space import *
 from .fixity_log import *
+from .replication import *
+from .reservation import *
+from .workspace import *
 
 # not importing managers as that is internal
 
@@ -300,6 +300,54 @@ class Arkivum(models.Model):
 
     def update_package_status(self, package):
         LOGGER.info("Package status: %s", package.status)
+        replication, error = self._get_replication_state(package)
+        if error:
+            return (None, error)
+        if replication.lower() == "green":
+            # Set status to UPLOADED
+            package.status = Package.UPLOADED
+            package.save()
+        LOGGER.info("Package status: %s", package.status)
+        return (package.status, _("Replication status: ") + replication)
+
+    def update_packages_status(self, packages, max_workers=1):
+        """Update the status of several packages, asking Arkivum for the
+        replication state of up to ``max_workers`` of them at once.
+
+        :returns: dict of (status, error) tuples, by package UUID.
+        """
+        results = {}
+        queried = []
+        for package in packages:
+            if "arkivum_identifier" not in package.misc_attributes:
+                # Needs to be posted to Arkivum again
+                results[package.uuid] = self.update_package_status(package)
+                continue
+            # Make sure it is known before the requests are made in threads
+            package.is_compressed
+            queried.append(package)
+        states = utils.map_concurrently(
+            self._get_replication_state, queried, max_workers
+        )
+        uploaded = 0
+        for package, (replication, error) in zip(queried, states):
+            if error:
+                results[package.uuid] = (None, error)
+                continue
+            if replication.lower() == "green":
+                package.status = Package.UPLOADED
+                package.save()
+                uploaded += 1
+            results[package.uuid] = (
+                package.status,
+                _("Replication status: ") + replication,
+            )
+        LOGGER.info("%s of %s package(s) uploaded", uploaded, len(results))
+        return results
+
+    def _get_replication_state(self, package):
+        """Return the replication state of ``package`` in Arkivum (e.g.
+        "green") and an error message, one of them being None."""
         response_json = self._get_package_info(package)
         if response_json.get("error"):
             return (None, response_json["error_message"])
@@ -318,12 +366,7 @@ class Arkivum(models.Model):
                 if response_json.get("error"):
                     return (None, response_json["error_message"])
                 replication = response_json.get("replicationState", "")
-        if replication.lower() == "green":
-            # Set status to UPLOADED
-            package.status = Package.UPLOADED
-            package.save()
-        LOGGER.info("Package status: %s", package.status)
-        return (package.status, _("Replication status: ") + replication)
+        return (replication, None)
 
     def is_file_local(self, package, path=None, email_nonlocal=False):
         """
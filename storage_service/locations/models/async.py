@@ -29,10 +29,47 @@ class Async(models.Model):
         help_text=_("True if this task threw an exception."),
     )
 
+    cancel_requested = models.BooleanField(
+        default=False,
+        verbose_name=_("Cancel requested"),
+        help_text=_("True if the cancellation of this task was requested."),
+    )
+
     _result = models.BinaryField(null=True, db_column="result")
 
     _error = models.BinaryField(null=True, db_column="error")
 
+    trace_id = models.CharField(
+        max_length=32,
+        blank=True,
+        verbose_name=_("Trace ID"),
+        help_text=_("ID of the trace of this task (see common.tracing)."),
+    )
+
+    package = models.ForeignKey(
+        "Package",
+        to_field="uuid",
+        null=True,
+        blank=True,
+        related_name="async_tasks",
+        help_text=_("Package this task operates on, if any."),
+    )
+
+    stage = models.CharField(
+        max_length=64,
+        blank=True,
+        verbose_name=_("Stage"),
+        help_text=_("Current stage of this task."),
+    )
+    bytes_done = models.BigIntegerField(
+        default=0, help_text=_("Bytes copied in the current stage.")
+    )
+    bytes_total = models.BigIntegerField(
+        null=True, help_text=_("Bytes to copy in the current stage, if known.")
+    )
+    bytes_per_second = models.FloatField(null=True)
+    stage_started_time = models.DateTimeField(null=True)
+
     created_time = models.DateTimeField(auto_now_add=True)
     updated_time = models.DateTimeField(auto_now=True)
     completed_time = models.DateTimeField(null=True)
@@ -59,6 +96,25 @@ class Async(models.Model):
     def error(self, value):
         self._error = pickle.dumps(str(type(value)) + ": " + str(value))
 
+    @property
+    def progress(self):
+        """Progress of the current stage of this task: bytes done and total,
+        rate in bytes per second and estimated seconds to completion, or
+        None if it has not reported any."""
+        if not self.stage:
+            return None
+        eta = None
+        if self.bytes_total is not None and self.bytes_per_second:
+            eta = max(self.bytes_total - self.bytes_done, 0) / self.bytes_per_second
+        return {
+            "stage": self.stage,
+            "stage_started_time": self.stage_started_time,
+            "bytes_done": self.bytes_done,
+            "bytes_total": self.bytes_total,
+            "bytes_per_second": self.bytes_per_second,
+            "eta_seconds": eta,
+        }
+
     class Meta:
         verbose_name = _("Async")
         app_label = "locations"
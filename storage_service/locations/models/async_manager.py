@@ -9,6 +9,12 @@
 # own copy of AsyncManager, and that's OK: where it matters, we'll only interact
 # with the tasks we're responsible for.  And when expiring old entries from the
 # database, it doesn't matter if another AsyncManager does our job for us.
+#
+# A task is cancelled by setting the cancel_requested flag of its Async model,
+# from whichever process: the watchdog of the process running it notices and
+# the task stops at its next checkpoint (see common.progress).  When a worker
+# shuts down, drain() stops accepting tasks and waits for the running ones,
+# cancelling those that don't finish in time.
 
 from __future__ import absolute_import
 import datetime
@@ -16,9 +22,12 @@ import logging
 import threading
 import time
 
+from django.conf import settings
 from django.utils import timezone
 
+from common import metrics, progress, tracing
 from .async import Async  # noqa
+from .workspace import Workspace
 
 LOGGER = logging.getLogger(__name__)
 
@@ -36,11 +45,26 @@ MAX_TASK_AGE_SECONDS = datetime.timedelta(seconds=86400)
 # check the status of our tasks.
 WATCHDOG_POLL_SECONDS = 5
 
+# Minimum interval between two writes of the progress of a task to the DB,
+# unless it starts a new stage.
+PROGRESS_WRITE_SECONDS = 5
+
+# How long a worker shutting down waits for its cancelled tasks to stop before
+# giving up on them.
+CANCEL_WAIT_SECONDS = 15
+
+
+class ShuttingDown(Exception):
+    """Raised when a task is submitted to a worker that is shutting down."""
+
 
 class RunningTask(object):
     def __init__(self):
         self.async_id = None
         self.thread = None
+        self.cancelled = threading.Event()
+        # common.progress.Progress of the task, once started
+        self.progress = None
         self.was_error = False
         self.result = None
         self.error = None
@@ -49,15 +73,28 @@ class RunningTask(object):
 class AsyncManager(object):
     running_tasks = []
     lock = threading.Lock()
+    # Set when this process shuts down: no more tasks are accepted
+    draining = False
 
     @staticmethod
     def _watchdog():
+        last_sweep = time.time()
         while True:
             try:
                 AsyncManager._watchdog_loop()
             except Exception as e:
                 LOGGER.warning("Failure in watchdog thread: %s", e)
 
+            # Remove the temporary directories left by failed or interrupted
+            # tasks and requests
+            interval = settings.WORKSPACE_SWEEP_INTERVAL
+            if interval and time.time() - last_sweep >= interval:
+                last_sweep = time.time()
+                try:
+                    Workspace.sweep(settings.WORKSPACE_MAX_AGE)
+                except Exception as e:
+                    LOGGER.warning("Failure sweeping the workspaces: %s", e)
+
             time.sleep(WATCHDOG_POLL_SECONDS)
 
     @staticmethod
@@ -88,6 +125,23 @@ class AsyncManager(object):
                 updated_time=timezone.now()
             )
 
+            # Write the bytes counted by the threads of the transfers the
+            # running tasks are blocked in
+            for task in AsyncManager.running_tasks:
+                if task.progress is not None and task.thread.is_alive():
+                    task.progress.flush()
+
+            # Cancel the running tasks whose cancellation was requested
+            cancelled_ids = set(
+                Async.objects.filter(
+                    id__in=running_task_ids, cancel_requested=True
+                ).values_list("id", flat=True)
+            )
+            for task in AsyncManager.running_tasks:
+                if task.async_id in cancelled_ids and not task.cancelled.is_set():
+                    LOGGER.info("Cancelling task %d", task.async_id)
+                    task.cancelled.set()
+
             # Find any tasks that have completed since we last looked
             completed_tasks = [
                 task
@@ -124,17 +178,55 @@ class AsyncManager(object):
             )
 
     @staticmethod
-    def _wrap_task(task, task_fn):
-        """Run a function, capturing its output/errors in `task`"""
+    def _write_progress(async_id):
+        """Return a function writing the progress of a task (see
+        ``common.progress``) to the Async ``async_id``."""
+
+        def write(fields):
+            Async.objects.filter(id=async_id).update(
+                stage=fields["stage"][:64],
+                bytes_done=fields["bytes_done"],
+                bytes_total=fields["bytes_total"],
+                bytes_per_second=fields["bytes_per_second"],
+                stage_started_time=datetime.datetime.fromtimestamp(
+                    fields["stage_started"], timezone.utc
+                ),
+            )
+
+        return write
+
+    @staticmethod
+    def _wrap_task(task, task_fn, trace_context):
+        """Run a function, capturing its output/errors in `task`, in a span
+        child of `trace_context`"""
 
         def wrapper(*args, **kwargs):
             value = error = None
+            name = getattr(task_fn, "__name__", "task")
 
-            try:
-                value = task_fn(*args, **kwargs)
-            except Exception as e:
-                error = e
-                LOGGER.exception("Task threw an error: " + str(e))
+            metrics.async_tasks_running.inc()
+            # Errors are logged inside the span so the records have its trace ID
+            with tracing.span(
+                "async." + name, {"async.id": task.async_id}, parent=trace_context
+            ) as task_span:
+                try:
+                    with progress.tracking(
+                        AsyncManager._write_progress(task.async_id),
+                        PROGRESS_WRITE_SECONDS,
+                        task.cancelled,
+                        task.async_id,
+                    ) as task.progress, metrics.measure(
+                        metrics.async_task_duration,
+                        metrics.async_task_errors,
+                        task=name,
+                    ):
+                        value = task_fn(*args, **kwargs)
+                except Exception as e:
+                    error = e
+                    task_span.record_error(e)
+                    LOGGER.exception("Task threw an error: " + str(e))
+                finally:
+                    metrics.async_tasks_running.dec()
 
             if error:
                 task.was_error = True
@@ -149,13 +241,84 @@ class AsyncManager(object):
     def run_task(task_fn, *args, **kwargs):
         """Run `task_fn` in a separate thread.  Return an Async model that will
         hold its result upon completion."""
-        async_task = Async()
+        return AsyncManager._run(None, task_fn, args, kwargs)
+
+    @staticmethod
+    def run_package_task(package, task_fn, *args, **kwargs):
+        """Run `task_fn` operating on `package` in a separate thread, like
+        `run_task`. Its progress is also shown in the details of the package."""
+        return AsyncManager._run(package, task_fn, args, kwargs)
+
+    @staticmethod
+    def cancel(async_id):
+        """Request the cancellation of the task `async_id`.  Return False if
+        it has already completed."""
+        if not Async.objects.filter(id=async_id, completed=False).update(
+            cancel_requested=True
+        ):
+            return False
+        # Don't wait for the watchdog if the task runs in this process
+        with AsyncManager.lock:
+            for task in AsyncManager.running_tasks:
+                if task.async_id == async_id:
+                    task.cancelled.set()
+        return True
+
+    @staticmethod
+    def drain(timeout=None):
+        """Stop accepting tasks and wait up to `timeout` seconds (by default
+        settings.ASYNC_DRAIN_TIMEOUT) for the running tasks to finish, then
+        cancel the others.  Called when this process shuts down."""
+        if timeout is None:
+            timeout = settings.ASYNC_DRAIN_TIMEOUT
+        AsyncManager.draining = True
+        with AsyncManager.lock:
+            tasks = list(AsyncManager.running_tasks)
+        if not tasks:
+            return
+        LOGGER.info("Waiting for %d tasks to finish before exiting", len(tasks))
+        deadline = time.time() + timeout
+        for task in tasks:
+            task.thread.join(max(deadline - time.time(), 0))
+
+        running = [task for task in tasks if task.thread.is_alive()]
+        if running:
+            LOGGER.warning("Cancelling %d tasks still running", len(running))
+            for task in running:
+                task.cancelled.set()
+            deadline = time.time() + CANCEL_WAIT_SECONDS
+            for task in running:
+                task.thread.join(max(deadline - time.time(), 0))
+
+        # Record the results of the tasks that finished or stopped, and fail
+        # the others now rather than letting them expire
+        AsyncManager._watchdog_loop()
+        with AsyncManager.lock:
+            stuck_ids = [task.async_id for task in AsyncManager.running_tasks]
+            for async_task in Async.objects.filter(id__in=stuck_ids):
+                LOGGER.warning("Task %d did not stop, giving up on it", async_task.id)
+                async_task.completed = True
+                async_task.completed_time = timezone.now()
+                async_task.was_error = True
+                async_task.error = ShuttingDown(
+                    "Interrupted by the shutdown of the storage service"
+                )
+                async_task.save()
+
+    @staticmethod
+    def _run(package, task_fn, args, kwargs):
+        if AsyncManager.draining:
+            raise ShuttingDown("The storage service is shutting down")
+        trace_context = tracing.current_context()
+        async_task = Async(trace_id=trace_context.trace_id, package=package)
         async_task.save()
 
         task = RunningTask()
         task.async_id = async_task.id
         task.thread = threading.Thread(
-            target=AsyncManager._wrap_task(task, task_fn), args=args, kwargs=kwargs
+            target=AsyncManager._wrap_task(task, task_fn, trace_context),
+            args=args,
+            kwargs=kwargs,
         )
 
         # Note: Important to start the thread prior to adding it to our list of
@@ -13,6 +13,7 @@ from django_extensions.db.fields import UUIDField
 import requests
 
 # This project, alphabetical
+from common import metrics
 
 # This module, alphabetical
 from . import StorageException
@@ -168,15 +169,18 @@ class Callback(models.Model):
         if not body:
             body = self.body
 
-        try:
-            response = getattr(requests, self.method)(
-                url, data=body or "", headers=self.get_headers()
-            )
-        except requests.exceptions.ConnectionError as e:
-            raise CallbackError(str(e))
-
-        if not response.status_code == self.expected_status:
-            raise CallbackError(response.text)
+        with metrics.measure(
+            metrics.callback_duration, metrics.callback_errors, event=self.event
+        ):
+            try:
+                response = getattr(requests, self.method)(
+                    url, data=body or "", headers=self.get_headers()
+                )
+            except requests.exceptions.ConnectionError as e:
+                raise CallbackError(str(e))
+
+            if not response.status_code == self.expected_status:
+                raise CallbackError(response.text)
 
 
 class File(models.Model):
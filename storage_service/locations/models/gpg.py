@@ -17,7 +17,7 @@ from django.utils import six
 # Third party dependencies, alphabetical
 
 # This project, alphabetical
-from common import gpgutils, premis, utils
+from common import gpgutils, premis, tracing, utils
 
 # This module, alphabetical
 from .location import Location
@@ -233,6 +233,7 @@ class GPG(models.Model):
         self.space.last_verified = datetime.datetime.now()
 
 
+@tracing.traced("gpg encrypt")
 def _gpg_encrypt(path, key_fingerprint):
     """Use GnuPG to encrypt the package at ``path`` using the GPG key
     matching the fingerprint ``key_fingerprint``. Returns the path to the
@@ -313,7 +314,8 @@ def _create_tar(path):
         "creating archive of %s at %s, relative to %s", source, tarpath, changedir
     )
     try:
-        subprocess.check_output(cmd)
+        with tracing.command_span(cmd):
+            subprocess.check_output(cmd)
     except (OSError, subprocess.CalledProcessError):
         _abort_create_tar(path, tarpath)
     if os.path.isfile(tarpath) and tarfile.is_tarfile(tarpath):
@@ -345,7 +347,8 @@ def _extract_tar(tarpath):
     changedir = os.path.dirname(newtarpath)
     cmd = ["tar", "-xf", newtarpath, "-C", changedir]
     try:
-        subprocess.check_output(cmd)
+        with tracing.command_span(cmd):
+            subprocess.check_output(cmd)
     except (OSError, subprocess.CalledProcessError):
         _abort_extract_tar(tarpath, newtarpath)
     if os.path.isdir(tarpath):
@@ -367,6 +370,7 @@ def _get_gpg_version():
     return _parse_gpg_version(gpgutils.gpg().version)
 
 
+@tracing.traced("gpg decrypt")
 def _gpg_decrypt(path):
     """Use GnuPG to decrypt the file at ``path`` and then delete the
     encrypted file.
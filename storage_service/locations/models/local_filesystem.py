@@ -14,6 +14,7 @@ from django.utils.translation import ugettext_lazy as _
 
 # This module, alphabetical
 from .location import Location
+from .space import PosixMoveUnsupportedError, Space
 
 
 class LocalFilesystem(models.Model):
@@ -64,3 +65,15 @@ class LocalFilesystem(models.Model):
         """
         destination_space.create_local_directory(destination_path)
         return self.space.move_rsync(source_path, destination_path, try_mv_local=True)
+
+    def copy_from_space(
+        self, source_space, source_path, destination_path, package=None
+    ):
+        """
+        Copy from another locally mounted filesystem space to this one,
+        bypassing staging and leaving the source in place.
+        """
+        if source_space.access_protocol not in Space.LOCAL_POSIX:
+            raise PosixMoveUnsupportedError()
+        self.space.create_local_directory(destination_path)
+        return self.space.move_rsync(source_path, destination_path)
@@ -3,14 +3,16 @@ from __future__ import division
 
 # stdlib, alphabetical
 import errno
+import hashlib
 import logging
 from lxml import etree
 import math
 import os
+import requests
 import shutil
-import subprocess
 
 # Core Django, alphabetical
+from django.conf import settings
 from django.core.urlresolvers import reverse
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
@@ -19,14 +21,18 @@ from django.utils.translation import ugettext_lazy as _
 import sword2
 
 # This project, alphabetical
-from common import utils
+from common import tar_split, utils
+from storage_service import __version__ as ss_version
 
 # This module, alphabetical
 from .location import Location
-from .package import Package
+from .package import Package, write_pointer_file
 
 LOGGER = logging.getLogger(__name__)
 
+# Seconds to wait for LOCKSS-o-matic to send a SWORD statement
+STATEMENT_TIMEOUT = 60
+
 
 class Lockssomatic(models.Model):
     """ Spaces that store their contents in LOCKSS, via LOCKSS-o-matic. """
@@ -164,8 +170,6 @@ class Lockssomatic(models.Model):
         If all are in agreement, add those URLs to the pointer file for each
         LOCKSS chunk.
         """
-        status = package.status
-
         # Need to have state and edit IRI to talk to LOM
         if (
             "state_iri" not in package.misc_attributes
@@ -193,7 +197,105 @@ class Lockssomatic(models.Model):
         if response.code != 200:
             return (None, _("Error polling LOCKSS-o-matic for SWORD statement."))
 
-        statement_root = etree.fromstring(response.content)
+        return self._update_status_from_statement(
+            package, etree.fromstring(response.content)
+        )
+
+    def update_packages_status(self, packages, max_workers=1):
+        """
+        Poll LOM for the SWORD statements of several packages and update their
+        status from the responses.
+
+        Like update_package_status, but the service document is only fetched
+        once and up to `max_workers` statements are fetched at once. The
+        statements are fetched conditionally: packages whose statement hasn't
+        changed since they were last polled are left as they are.
+
+        :returns: dict of (status, error) tuples, by package UUID.
+        """
+        if not self.sword_connection and not self.update_service_document():
+            error = _("Error contacting LOCKSS-o-matic.")
+            return {package.uuid: (None, error) for package in packages}
+
+        results = {}
+        polled = []
+        for package in packages:
+            if (
+                "state_iri" in package.misc_attributes
+                and "edit_iri" in package.misc_attributes
+            ):
+                polled.append(package)
+            else:
+                # Needs to be posted to LOM again
+                results[package.uuid] = self.update_package_status(package)
+
+        responses = utils.map_concurrently(self._get_statement, polled, max_workers)
+        for package, response in zip(polled, responses):
+            if response is None or response.status_code not in (200, 304):
+                results[package.uuid] = (
+                    None,
+                    _("Error polling LOCKSS-o-matic for SWORD statement."),
+                )
+            elif response.status_code == 304:
+                LOGGER.info(
+                    "SWORD statement of package %s unchanged, status: %s",
+                    package.uuid,
+                    package.status,
+                )
+                results[package.uuid] = (
+                    package.status,
+                    _("SWORD statement unchanged since the last poll"),
+                )
+            else:
+                results[package.uuid] = self._update_status_from_statement(
+                    package,
+                    etree.fromstring(response.content),
+                    etag=response.headers.get("ETag"),
+                )
+        return results
+
+    def _get_statement(self, package):
+        """
+        Fetch the SWORD statement of `package`, unless it is the same as when
+        it was last fetched (the response status is then 304).
+
+        Helper to update_packages_status, safe to call from several threads.
+
+        :returns: a requests.Response, or None on error.
+        """
+        headers = {
+            "Accept": "application/atom+xml;type=feed",
+            "On-Behalf-Of": str(self.content_provider_id),
+        }
+        etag = package.misc_attributes.get("state_etag")
+        if etag:
+            headers["If-None-Match"] = etag
+        try:
+            return requests.get(
+                package.misc_attributes["state_iri"],
+                headers=headers,
+                timeout=STATEMENT_TIMEOUT,
+            )
+        except requests.RequestException:
+            LOGGER.warning(
+                "Error fetching the SWORD statement of package %s",
+                package.uuid,
+                exc_info=True,
+            )
+            return None
+
+    def _update_status_from_statement(self, package, statement_root, etag=None):
+        """
+        Update the status of `package` from its SWORD statement. If all the
+        servers are in agreement, add the LOCKSS URLs to the pointer file,
+        which is only written again if they changed.
+
+        Helper to update_package_status.
+
+        :param etag: ETag of the statement, sent when it is fetched again to
+            only get it if it changed.
+        """
+        status = package.status
 
         # TODO Check that number of lom:content entries is same as number of chunks
         # TODO what to do if was quorum, and now not??
@@ -206,13 +308,15 @@ class Lockssomatic(models.Model):
         )
         if not all(s.get("state") == "agreement" for s in servers):
             # TODO update pointer file for new failed status?
+            if etag and etag != package.misc_attributes.get("state_etag"):
+                package.misc_attributes["state_etag"] = etag
+                package.save()
             return (status, _("LOCKSS servers not in agreement"))
 
         status = Package.UPLOADED
 
         # Add LOCKSS URLs to each chunk
-        if not self.pointer_root:
-            self.pointer_root = etree.parse(package.full_pointer_file_path)
+        self.pointer_root = etree.parse(package.full_pointer_file_path)
         files = self.pointer_root.findall(
             ".//mets:fileSec/mets:fileGrp[@USE='LOCKSS chunk']/mets:file",
             namespaces=utils.NSMAP,
@@ -224,7 +328,9 @@ class Lockssomatic(models.Model):
                 namespaces=utils.NSMAP,
             )
 
-        # Add new FLocat elements for each LOCKSS URL to each file element
+        # Replace the FLocat elements of each file element by one for each
+        # LOCKSS URL
+        pointer_changed = False
         for index, file_e in enumerate(files):
             LOGGER.debug("file element: %s", etree.tostring(file_e, pretty_print=True))
             if len(files) == 1:
@@ -237,20 +343,25 @@ class Lockssomatic(models.Model):
                 namespaces=utils.NSMAP,
             )
             LOGGER.debug("lom_servers: %s", lom_servers)
-            # Remove existing LOCKSS URLs, if they exist
-            for old_url in file_e.findall(
+            # TODO check that size and checksum are the same
+            # TODO what to do if size & checksum different?
+            urls = [server.get("src") for server in lom_servers]
+            old_urls = file_e.findall(
                 "mets:FLocat[@LOCTYPE='URL']", namespaces=utils.NSMAP
-            ):
+            )
+            if [e.get(utils.PREFIX_NS["xlink"] + "href") for e in old_urls] == urls:
+                continue
+            pointer_changed = True
+            # Remove existing LOCKSS URLs, if they exist
+            for old_url in old_urls:
                 file_e.remove(old_url)
             # Add URLs from SWORD statement
-            for server in lom_servers:
-                # TODO check that size and checksum are the same
-                # TODO what to do if size & checksum different?
-                LOGGER.debug("LOM URL: %s", server.get("src"))
+            for url in urls:
+                LOGGER.debug("LOM URL: %s", url)
                 flocat = etree.SubElement(
                     file_e, utils.PREFIX_NS["mets"] + "FLocat", LOCTYPE="URL"
                 )
-                flocat.set(utils.PREFIX_NS["xlink"] + "href", server.get("src"))
+                flocat.set(utils.PREFIX_NS["xlink"] + "href", url)
 
         # Delete local files
         # Note: This will tell LOCKSS to stop harvesting, even if the file was
@@ -259,20 +370,13 @@ class Lockssomatic(models.Model):
         delete_lom_ids = [e.get("id") for e in lom_content]
         error = self._delete_update_lom(package, delete_lom_ids)
         if error is None:
-            self._delete_files()
+            pointer_changed = self._delete_files() or pointer_changed
 
         LOGGER.info("update_package_status: new status: %s", status)
 
         # Write out pointer file again
-        with open(package.full_pointer_file_path, "w") as f:
-            f.write(
-                etree.tostring(
-                    self.pointer_root,
-                    pretty_print=True,
-                    xml_declaration=True,
-                    encoding="utf-8",
-                )
-            )
+        if pointer_changed:
+            write_pointer_file(self.pointer_root, package.full_pointer_file_path)
 
         # Update value if different
         package.status = status
@@ -333,6 +437,8 @@ class Lockssomatic(models.Model):
         Delete AIP local files once stored in LOCKSS from disk and pointer file.
 
         Helper to update_package_status.
+
+        :returns: True if the pointer file was changed.
         """
         # Get paths to delete
         if self.keep_local:
@@ -391,7 +497,7 @@ class Lockssomatic(models.Model):
                     namespaces=utils.NSMAP,
                 )
                 del_elem.getparent().remove(del_elem)
-        return None
+        return bool(delete_elements)
 
     def update_service_document(self):
         """ Fetch the service document from self.sd_iri and updates based on that.
@@ -474,50 +580,37 @@ class Lockssomatic(models.Model):
             LOGGER.info("LOCKSS: after splitting: %s", output_files)
             return output_files
 
-        # Split file
-        # Strip extension, add .tar-1 ('-1' to make rename script happy)
-        output_path = os.path.splitext(file_path)[0] + ".tar-1"
-        command = [
-            "tar",
-            "--create",
-            "--multi-volume",
-            "--tape-length",
-            str(self.au_size),
-            "--new-volume-script",
-            "common/tar_new_volume.sh",
-            "-f",
-            output_path,
-            file_path,
-        ]
+        # Split file into the volumes of a multi-volume tar archive named
+        # <name>.tar-1, <name>.tar-2...
+        algorithm = self.checksum_type
+        try:
+            hashlib.new(algorithm)
+        except (TypeError, ValueError):  # Invalid checksum type
+            algorithm = "md5"
         # TODO reserve space in quota for extra files
-        LOGGER.info("LOCKSS split command: %s", command)
+        LOGGER.info("LOCKSS: splitting %s into volumes of %s", file_path, self.au_size)
         try:
-            subprocess.check_call(command)
+            volumes = tar_split.split(
+                file_path,
+                os.path.splitext(file_path)[0] + ".tar",
+                self.au_size,
+                algorithm=algorithm,
+                max_workers=settings.LOCKSS_SPLIT_MAX_WORKERS,
+            )
         except Exception:
-            LOGGER.exception("Split of %s failed with command %s", file_path, command)
+            LOGGER.exception("Split of %s failed", file_path)
             raise
-        output_path = output_path[:-2]  # Remove '-1'
-        dirname, basename = os.path.split(output_path)
-        output_files = sorted(
-            [
-                os.path.join(dirname, entry)
-                for entry in os.listdir(dirname)
-                if entry.startswith(basename)
-            ]
-        )
+        output_files = [volume.path for volume in volumes]
 
         # Update pointer file
         amdsec = self.pointer_root.find("mets:amdSec", namespaces=utils.NSMAP)
 
         # Add 'division' PREMIS:EVENT
-        try:
-            event_detail = subprocess.check_output(["tar", "--version"])
-        except subprocess.CalledProcessError as e:
-            event_detail = e.output or _("Error: getting tool info; probably GNU tar")
         utils.mets_add_event(
             amdsec,
             event_type="division",
-            event_detail=event_detail,
+            event_detail=_("Storage Service %(version)s, GNU tar multi-volume format")
+            % {"version": ss_version},
             event_outcome_detail_note="{} LOCKSS chunks created".format(
                 len(output_files)
             ),
@@ -545,7 +638,9 @@ class Lockssomatic(models.Model):
             div.append(local_ftpr)  # This moves local_fptr
 
         # Add each split chunk to structMap & fileSec
-        for idx, out_path in enumerate(output_files):
+        checksum_name = hashlib.new(algorithm).name.upper().replace("SHA", "SHA-")
+        for idx, volume in enumerate(volumes):
+            out_path = volume.path
             # Add div to structMap
             div = etree.SubElement(
                 aip_div,
@@ -556,20 +651,13 @@ class Lockssomatic(models.Model):
             etree.SubElement(
                 div, utils.PREFIX_NS["mets"] + "fptr", FILEID=os.path.basename(out_path)
             )
-            # Get checksum and size for fileSec
-            try:
-                checksum = utils.generate_checksum(out_path, self.checksum_type)
-            except ValueError:  # Invalid checksum type
-                checksum = utils.generate_checksum(out_path, "md5")
-            checksum_name = checksum.name.upper().replace("SHA", "SHA-")
-            size = os.path.getsize(out_path)
             # Add file & FLocat to fileSec
             file_e = etree.SubElement(
                 filegrp,
                 utils.PREFIX_NS["mets"] + "file",
                 ID=os.path.basename(out_path),
-                SIZE=str(size),
-                CHECKSUM=checksum.hexdigest(),
+                SIZE=str(volume.size),
+                CHECKSUM=volume.checksum,
                 CHECKSUMTYPE=checksum_name,
             )
             flocat = etree.SubElement(
@@ -581,15 +669,7 @@ class Lockssomatic(models.Model):
             flocat.set(utils.NSMAP["xlink"] + "href", out_path)
 
         # Write out pointer file again
-        with open(package.full_pointer_file_path, "w") as f:
-            f.write(
-                etree.tostring(
-                    self.pointer_root,
-                    pretty_print=True,
-                    xml_declaration=True,
-                    encoding="utf-8",
-                )
-            )
+        write_pointer_file(self.pointer_root, package.full_pointer_file_path)
 
         return output_files
 
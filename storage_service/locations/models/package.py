@@ -2,10 +2,14 @@
 from __future__ import absolute_import
 
 # stdlib, alphabetical
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 import codecs
+from contextlib import closing, contextmanager
 import copy
 import distutils.dir_util
+import errno
+import functools
+import hashlib
 import json
 import logging
 from lxml import etree
@@ -16,6 +20,11 @@ import subprocess
 import tempfile
 from uuid import uuid4
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
 try:
     from pathlib import Path
 except ImportError:
@@ -23,11 +32,13 @@ except ImportError:
 
 # Core Django, alphabetical
 from django.conf import settings
-from django.db import models
+from django.db import connection, models
+from django.db.models import F
 from django.utils.translation import ugettext_lazy as _
 
 # Third party dependencies, alphabetical
 import bagit
+from concurrent import futures
 import jsonfield
 from django_extensions.db.fields import UUIDField
 from django.utils import six
@@ -37,7 +48,7 @@ import requests
 import scandir
 
 # This project, alphabetical
-from common import premis, utils
+from common import fastcopy, metrics, package_cache, premis, progress, tracing, utils
 from locations import signals
 
 # This module, alphabetical
@@ -46,6 +57,8 @@ from .location import Location
 from .space import Space, PosixMoveUnsupportedError
 from .event import Callback, CallbackError, File
 from .fixity_log import FixityLog
+from .reservation import InsufficientStagingSpace, StagingReservation
+from .workspace import Workspace
 from six.moves import range
 
 __all__ = ("Package",)
@@ -53,6 +66,83 @@ __all__ = ("Package",)
 
 LOGGER = logging.getLogger(__name__)
 
+# Directory of the SS internal location holding the package cache
+PACKAGE_CACHE_DIRECTORY = "package-cache"
+
+# Values of the pointer file metadata fields of packages without pointer file
+POINTER_METADATA_DEFAULTS = {
+    "format_registry_key": "",
+    "message_digest_algorithm": "",
+    "message_digest": "",
+    "composition_level": None,
+    "inhibitor_type": "",
+}
+
+# Name of a preservation derivative: the name of its original (without
+# extension), its UUID and its extension
+PRESERVATION_DERIVATIVE_REGEX = re.compile(r"(.+)-\w{8}-\w{4}-\w{4}-\w{4}-\w{12}(.*)")
+
+# Compressions of the packages that metadata-only reingests update in place
+IN_PLACE_COMPRESSIONS = (
+    utils.COMPRESSION_7Z_BZIP,
+    utils.COMPRESSION_7Z_LZMA,
+    utils.COMPRESSION_7Z_COPY,
+)
+
+# What the replicas of a package need from it, see
+# Package._get_replication_source
+ReplicationSource = namedtuple(
+    "ReplicationSource",
+    ["local_path", "staged_path", "checksum_algorithm", "master_checksum", "checksum"],
+)
+
+
+def _instrumented(operation):
+    """Decorate the ``Package`` method doing ``operation`` to record its
+    duration, failures and the size of the package in Prometheus metrics,
+    labelled by the protocol of the space of the package, and to trace it."""
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            labels = {
+                "protocol": self.current_location.space.access_protocol,
+                "operation": operation,
+            }
+            attributes = {
+                "package.uuid": self.uuid,
+                "space.protocol": labels["protocol"],
+            }
+            with tracing.span("package." + operation, attributes), metrics.measure(
+                metrics.package_operation_duration,
+                metrics.package_operation_errors,
+                **labels
+            ):
+                result = method(self, *args, **kwargs)
+            metrics.package_operation_bytes.labels(**labels).inc(self.size or 0)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def _using_local_copy(method):
+    """Decorate the ``Package`` method to stop using any copy in the package
+    cache it fetched once it returns, see ``Package.using_local_copy``."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.using_local_copy():
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+def _in_package_cache(path):
+    """Return whether ``path`` is a copy of a package in the package cache."""
+    return PACKAGE_CACHE_DIRECTORY in os.path.normpath(path).split(os.sep)
+
 
 @six.python_2_unicode_compatible
 class Package(models.Model):
@@ -149,6 +239,68 @@ class Package(models.Model):
         default={},
         help_text=_("For storing flexible, often Space-specific, attributes"),
     )
+    # Shape of the package as stored, recorded when it is stored so that it is
+    # known without fetching the package from its space. None or blank if
+    # unknown, e.g. for packages stored before these were added (see the
+    # backfill_package_shape management command).
+    compressed = models.NullBooleanField(
+        default=None,
+        help_text=_(
+            "True if the package is stored as a single (e.g. compressed) file,"
+            " False if it is a directory"
+        ),
+    )
+    compression = models.CharField(
+        max_length=32,
+        blank=True,
+        default="",
+        db_index=True,
+        help_text=_("Compression algorithm of the package, if known"),
+    )
+    base_directory = models.TextField(
+        blank=True,
+        default="",
+        help_text=_("Directory all the contents of the package are nested in"),
+    )
+    encrypted = models.NullBooleanField(
+        default=None, help_text=_("True if the package is stored encrypted")
+    )
+    # What the pointer file records about the package, copied from it when it
+    # is written so that it can be queried without parsing pointer files (see
+    # the backfill_pointer_metadata management command). Blank if the package
+    # has no pointer file.
+    format_registry_key = models.CharField(
+        max_length=32,
+        blank=True,
+        default="",
+        db_index=True,
+        help_text=_("PRONOM identifier of the format of the package"),
+    )
+    message_digest_algorithm = models.CharField(
+        max_length=32,
+        blank=True,
+        default="",
+        help_text=_("Algorithm of the checksum of the package"),
+    )
+    message_digest = models.CharField(
+        max_length=128,
+        blank=True,
+        default="",
+        db_index=True,
+        help_text=_("Checksum of the package"),
+    )
+    composition_level = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        default=None,
+        help_text=_("Number of transformations (e.g. compression) of the package"),
+    )
+    inhibitor_type = models.CharField(
+        max_length=32,
+        blank=True,
+        default="",
+        help_text=_("Encryption of the package, if any (e.g. GPG)"),
+    )
 
     PACKAGE_TYPE_CAN_DELETE = (AIP, AIC, TRANSFER)
     PACKAGE_TYPE_CAN_DELETE_DIRECTLY = (DIP,)
@@ -167,6 +319,7 @@ class Package(models.Model):
     class Meta:
         verbose_name = _("Package")
         app_label = "locations"
+        index_together = [("current_location", "compression")]
 
     def __init__(self, *args, **kwargs):
         super(Package, self).__init__(*args, **kwargs)
@@ -175,6 +328,10 @@ class Package(models.Model):
         self.local_path = None
         self.local_path_location = None
         self.origin_location = None
+        # Pin on the copy of the package in the package cache in use
+        self._cache_pin = None
+        # Pointer file last read or written: [path, file key, tree, document]
+        self._pointer_cache = None
 
     def __str__(self):
         return u"{uuid}: {path}".format(uuid=self.uuid, path=self.full_path)
@@ -221,19 +378,29 @@ class Package(models.Model):
         encrypted. Note that we can't compare the type of the child space to
         GPG because that would cause a circular import.
         """
-        space_is_encr = getattr(
-            self.current_location.space.get_child_space(), "encrypted_space", False
-        )
+        if self.encrypted is None:
+            space_is_encr = _is_encrypted_space(self.current_location.space)
+        else:
+            space_is_encr = self.encrypted
         is_file = os.path.isfile(local_path)
         return space_is_encr and is_file
 
     @property
+    @_using_local_copy
     def is_compressed(self):
-        """ Determines whether or not the package is a compressed file. """
+        """Determines whether or not the package is a compressed file.
+
+        The package is only fetched if that was not recorded when it was
+        stored, and the answer is then recorded.
+        """
+        if self.compressed is not None:
+            return self.compressed
         full_path = self.fetch_local_path()
         if os.path.isdir(full_path):
+            self._update_fields(compressed=False)
             return False
         elif os.path.isfile(full_path):
+            self._update_fields(compressed=True)
             return True
         else:
             if not os.path.exists(full_path):
@@ -316,19 +483,48 @@ class Package(models.Model):
         local_path = self.get_local_path()
         if local_path and not self.is_encrypted(local_path):
             return local_path
-        # Not locally accessible, so copy to SS internal temp dir
+        # Not locally accessible, so copy to SS internal location
         ss_internal = Location.active.get(purpose=Location.STORAGE_SERVICE_INTERNAL)
-        temp_dir = tempfile.mkdtemp(dir=ss_internal.full_path)
-        int_path = os.path.join(temp_dir, self.current_path)
+        if 0 < self.size <= settings.PACKAGE_CACHE_SIZE:
+            cache = package_cache.PackageCache(
+                os.path.join(ss_internal.full_path, PACKAGE_CACHE_DIRECTORY),
+                settings.PACKAGE_CACHE_SIZE,
+            )
+            self._release_cache_pin()
+            int_path, self._cache_pin = cache.get(
+                self._cache_key(),
+                self.current_path,
+                lambda path: self._fetch_to_internal(ss_internal, path),
+                size=self.size,
+            )
+        else:
+            temp_dir = Workspace.create("fetch", dir=ss_internal.full_path)
+            int_path = os.path.join(temp_dir, self.current_path)
+            try:
+                self._fetch_to_internal(ss_internal, int_path)
+            except InsufficientStagingSpace:
+                Workspace.remove(temp_dir)
+                raise
+
+        self.local_path_location = ss_internal
+        self.local_path = int_path
+        return self.local_path
 
+    def _fetch_to_internal(self, ss_internal, int_path):
+        """Copy this package to ``int_path`` in the internal location
+        ``ss_internal``, decrypting it if needed."""
         # If encrypted, this will decrypt.
-        self.current_location.space.move_to_storage_service(
-            source_path=os.path.join(
-                self.current_location.relative_path, self.current_path
-            ),
-            destination_path=self.current_path,
-            destination_space=ss_internal.space,
-        )
+        with StagingReservation.reserve(
+            _staging_copy_path(ss_internal.space, self.current_path), self.size, "fetch"
+        ):
+            self.current_location.space.move_to_storage_service(
+                source_path=os.path.join(
+                    self.current_location.relative_path, self.current_path
+                ),
+                destination_path=self.current_path,
+                destination_space=ss_internal.space,
+                package=self,
+            )
 
         relative_path = int_path.replace(ss_internal.space.path, "", 1).lstrip("/")
 
@@ -336,9 +532,81 @@ class Package(models.Model):
             source_path=self.current_path, destination_path=relative_path, package=self
         )
 
-        self.local_path_location = ss_internal
-        self.local_path = int_path
-        return self.local_path
+    def _cache_key(self):
+        """Return the key of the current content of this package in the
+        package cache: its UUID and the checksum recorded in its pointer file,
+        or its size if it has none."""
+        version = self.size
+        ptr_path = self.full_pointer_file_path
+        if not ptr_path or not os.path.isfile(ptr_path):
+            return "{}-{}".format(self.uuid, version)
+        try:
+            pointer = self._get_pointer_document()
+            premis_objects = pointer.get_file(file_uuid=self.uuid).get_premis_objects()
+            version = premis_objects[0].message_digest
+        except (
+            AttributeError,
+            IndexError,
+            EnvironmentError,
+            etree.LxmlError,
+            metsrw.MetsError,
+        ):
+            LOGGER.warning(
+                "Unable to read the checksum of package %s from its pointer file",
+                self.uuid,
+            )
+        return "{}-{}".format(self.uuid, version)
+
+    def _release_cache_pin(self):
+        """Let the package cache evict the copy of this package in use."""
+        if self._cache_pin is not None:
+            self._cache_pin.release()
+            self._cache_pin = None
+
+    @contextmanager
+    def using_local_copy(self):
+        """Stop using the copy in the package cache fetched by
+        ``fetch_local_path`` within the block, if any, when it exits, so the
+        cache can evict it. Copies fetched before the block are kept."""
+        pin = self._cache_pin
+        try:
+            yield
+        finally:
+            if self._cache_pin is not None and self._cache_pin is not pin:
+                self._release_cache_pin()
+                if self.local_path and _in_package_cache(self.local_path):
+                    self.local_path = self.local_path_location = None
+
+    def _copy_from_cache(self, cached_path):
+        """Copy the copy of this package in the package cache at
+        ``cached_path`` to a temporary directory, use that copy instead and
+        return the temporary directory."""
+        ss_internal = self.local_path_location
+        temp_dir = Workspace.create("fetch", dir=ss_internal.full_path)
+        local_path = os.path.join(temp_dir, os.path.basename(cached_path))
+        try:
+            with StagingReservation.reserve(temp_dir, self.size, "fetch"):
+                shutil.copytree(cached_path, local_path)
+        except Exception:
+            Workspace.remove(temp_dir)
+            raise
+        self._release_cache_pin()
+        self.local_path = local_path
+        return temp_dir
+
+    def remove_local_copy(self, local_path):
+        """Delete the copy of this package made by ``fetch_local_path`` at
+        ``local_path``, or stop using it if it is in the package cache."""
+        if _in_package_cache(local_path):
+            self._release_cache_pin()
+            self.local_path = self.local_path_location = None
+            return
+        # fetch_local_path copies to <temporary directory>/<current_path>
+        temp_dir = os.path.normpath(local_path)
+        for __ in os.path.normpath(self.current_path).split(os.sep):
+            temp_dir = os.path.dirname(temp_dir)
+        Workspace.remove(temp_dir)
+        self.local_path = self.local_path_location = None
 
     def get_base_directory(self):
         """
@@ -355,9 +623,13 @@ class Package(models.Model):
         The string "package-00000000-0000-0000-0000-000000000000" would be
         returned.
 
-        Note that this currently only supports locally-available packages.
-        If the package is stored externally, raises NotImplementedError.
+        The base directory recorded when the package was stored is returned
+        if there is one. Otherwise this currently only supports
+        locally-available packages: if the package is stored externally,
+        raises NotImplementedError.
         """
+        if self.base_directory:
+            return self.base_directory
         full_path = self.get_local_path()
         if full_path is None:
             raise NotImplementedError(
@@ -366,26 +638,117 @@ class Package(models.Model):
                 )
             )
 
-        if self.is_compressed:
-            # Use lsar's JSON output to determine the directories in a
-            # compressed file. Since the index of the base directory may
-            # not be consistent, determine it by filtering all entries
-            # for directories, then determine the directory with the
-            # shortest name. (e.g. foo is the parent of foo/bar)
-            # NOTE: lsar's JSON output is broken in certain circumstances in
-            #       all released versions; make sure to use a patched version
-            #       for this to work.
-            command = ["lsar", "-ja", full_path]
-            output = subprocess.check_output(command).decode("utf8")
-            output = json.loads(output)
-            directories = [
-                d["XADFileName"]
-                for d in output["lsarContents"]
-                if d.get("XADIsDirectory", False)
-            ]
-            directories = sorted(directories, key=len)
-            return directories[0]
-        return os.path.basename(full_path)
+        compressed = self.is_compressed
+        base_directory = _get_base_directory(
+            full_path, compressed, self._get_compression() if compressed else None
+        )
+        self._update_fields(base_directory=base_directory)
+        return base_directory
+
+    def _get_compression(self):
+        """Return the compression of this compressed package, as recorded
+        when it was stored or in its pointer file, or None if unknown.
+
+        :returns: one of the constants in ``COMPRESSION_ALGORITHMS`` or None.
+        """
+        if self.compression:
+            return self.compression
+        if self.full_pointer_file_path:
+            return utils.get_compression(self._pointer_tree())
+        return None
+
+    def _record_shape(self, local_path, space, compression=None):
+        """Set the attributes describing the shape of this package (see
+        ``compressed``) from the copy of it at ``local_path``, as it is or
+        will be stored in ``space``. The package is not saved.
+
+        :param compression: compression of the package, if known by the
+            caller (otherwise it is guessed from the extension of tar
+            archives).
+        """
+        self.encrypted = _is_encrypted_space(space)
+        if not local_path or not os.path.exists(local_path):
+            return
+        self.compressed = os.path.isfile(local_path)
+        if compression is None and self.compressed:
+            compression = utils.get_compression_from_extension(local_path)
+        self.compression = compression or ""
+        try:
+            self.base_directory = _get_base_directory(
+                local_path, self.compressed, self.compression or None
+            )
+        except (
+            EnvironmentError,
+            subprocess.CalledProcessError,
+            ValueError,
+            IndexError,
+        ):
+            LOGGER.warning(
+                "Unable to determine the base directory of %s",
+                local_path,
+                exc_info=True,
+            )
+            self.base_directory = ""
+
+    def backfill_shape(self, fetch=False):
+        """Record the shape of this package (see ``compressed``) if it was
+        stored before it was recorded at store time.
+
+        The package is looked at where it is stored if that is local and
+        unencrypted. Otherwise, packages with a pointer file are known to be
+        compressed, and other packages are only fetched if ``fetch`` is True.
+
+        :returns: True if the shape of the package is known.
+        """
+        space = self.current_location.space
+        local_path = self.get_local_path()
+        if local_path and not _is_encrypted_space(space):
+            self._record_shape(local_path, space)
+        elif self.full_pointer_file_path and os.path.isfile(
+            self.full_pointer_file_path
+        ):
+            self.encrypted = _is_encrypted_space(space)
+            self.compressed = True
+        elif fetch:
+            local_path = self.fetch_local_path()
+            try:
+                self._record_shape(local_path, space)
+            finally:
+                if self.local_path_location is not None:
+                    self.remove_local_copy(local_path)
+        else:
+            return False
+        if (
+            self.compressed
+            and self.full_pointer_file_path
+            and os.path.isfile(self.full_pointer_file_path)
+        ):
+            self.compression = utils.get_compression(self._pointer_tree())
+        self._update_fields(
+            compressed=self.compressed,
+            compression=self.compression,
+            base_directory=self.base_directory,
+            encrypted=self.encrypted,
+        )
+        return self.compressed is not None
+
+    def _update_fields(self, **fields):
+        """Record attributes found out about this package (e.g. its shape, see
+        ``compressed``), without saving its other attributes."""
+        for attr, value in fields.items():
+            setattr(self, attr, value)
+        if self.pk is not None:
+            Package.objects.filter(pk=self.pk).update(**fields)
+
+    def record_pointer_metadata(self, tree=None):
+        """Copy what this package's pointer file records about it (see
+        ``format_registry_key``) to its fields.
+
+        :param tree: the pointer file parsed as an lxml tree, parsed if None.
+        """
+        if tree is None:
+            tree = self._pointer_tree()
+        self._update_fields(**utils.get_pointer_metadata(tree))
 
     def _check_quotas(self, dest_space, dest_location):
         """
@@ -424,14 +787,20 @@ class Package(models.Model):
                 }
             )
 
-    def _update_quotas(self, space, location):
+    @tracing.traced("db.update_quotas")
+    def _update_quotas(self, space, location, size=None):
         """
-        Add this package's size to the space and location.
+        Add this package's size, or ``size`` bytes, to the space and location.
+
+        The sizes are added by the database, so that concurrent updates, e.g.
+        by replications to the same space, are not lost.
         """
-        space.used += self.size
-        space.save()
-        location.used += self.size
-        location.save()
+        if size is None:
+            size = self.size
+        Space.objects.filter(pk=space.pk).update(used=F("used") + size)
+        space.used += size
+        Location.objects.filter(pk=location.pk).update(used=F("used") + size)
+        location.used += size
 
     def move(self, to_location):
         """Move the package to location."""
@@ -456,18 +825,27 @@ class Package(models.Model):
             )
 
         except PosixMoveUnsupportedError:
-            origin_space.move_to_storage_service(
-                source_path=source_path,
-                destination_path=destination_path,
-                destination_space=destination_space,
-            )
+            try:
+                with StagingReservation.reserve(
+                    _staging_copy_path(destination_space, destination_path),
+                    self.size,
+                    "staging",
+                ):
+                    origin_space.move_to_storage_service(
+                        source_path=source_path,
+                        destination_path=destination_path,
+                        destination_space=destination_space,
+                    )
 
-            origin_space.post_move_to_storage_service()
-            destination_space.move_from_storage_service(
-                source_path=destination_path,
-                destination_path=destination_path,
-                package=None,
-            )
+                    origin_space.post_move_to_storage_service()
+                    destination_space.move_from_storage_service(
+                        source_path=destination_path,
+                        destination_path=destination_path,
+                        package=None,
+                    )
+            except progress.TaskCancelled:
+                _remove_staging_copy(destination_space, destination_path)
+                raise
 
             destination_space.post_move_from_storage_service(
                 destination_path, destination_path
@@ -475,6 +853,7 @@ class Package(models.Model):
 
         # If we get here everything went well, update with new location
         self.current_location = to_location
+        self.encrypted = _is_encrypted_space(destination_space)
         self.save()
         self.current_location.space.update_package_status(self)
         self._update_existing_ptr_loc_info()
@@ -559,7 +938,10 @@ class Package(models.Model):
         success, failures, message, __ = self.check_fixity(force_local=True)
         return success, failures, message
 
-    def replicate(self, replicator_location):
+    @_instrumented("replicate")
+    def replicate(
+        self, replicator_location, replication_source=None, replica_package=None
+    ):
         """Replicate this package in the database and on disk by
         1. creating a new ``Package`` model instance that references this one in
            its ``replicated_package`` attribute,
@@ -569,9 +951,20 @@ class Package(models.Model):
            replication event, and
         4. updating the pointer file for the replicated AIP, which encodes the
            replication event.
+
+        If ``replication_source`` (see ``_get_replication_source``) is given,
+        it is used instead of hashing the AIP again and step 4 is left to the
+        caller, which allows replicating to several locations concurrently.
+
+        If ``replica_package`` is given it must be a replica of this package in
+        ``replicator_location`` left behind by a failed replication; it is
+        reused so that the copy resumes from whatever already reached the
+        replicator location instead of starting over.
+
+        :returns: 2-tuple of the replica package and the UUID of the
+            replication event (None if the AIP has no pointer file).
         """
         # Replicandum is the package to be replicated, i.e., ``self``
-        replicandum_location = self.current_location
         replicandum_path = self.current_path
         replicandum_uuid = self.uuid
         LOGGER.info(
@@ -580,66 +973,183 @@ class Package(models.Model):
             replicator_location.uuid,
         )
 
-        replica_package = self._clone()
-        replica_package.replicated_package = self
-
-        # Remove the /uuid/path from the replica's current_path and replace the
-        # old UUID in the basename with the new UUID.
-        replica_package.current_path = os.path.basename(
-            replicandum_path.rstrip("/")
-        ).replace(replicandum_uuid, replica_package.uuid, 1)
-        replica_package.current_location = replicator_location
+        if replica_package is None:
+            replica_package = self._clone()
+            replica_package.replicated_package = self
+
+            # Remove the /uuid/path from the replica's current_path and replace
+            # the old UUID in the basename with the new UUID.
+            replica_package.current_path = os.path.basename(
+                replicandum_path.rstrip("/")
+            ).replace(replicandum_uuid, replica_package.uuid, 1)
+            replica_package.current_location = replicator_location
+
+            # Replicate AIP at
+            # destination_location/uuid/split/into/chunks/destination_path
+            uuid_path = utils.uuid_to_path(replica_package.uuid)
+            replica_package.current_path = os.path.join(
+                uuid_path, replica_package.current_path
+            )
+        elif (
+            replica_package.replicated_package_id != self.uuid
+            or replica_package.current_location_id != replicator_location.uuid
+        ):
+            raise StorageException(
+                _(
+                    "Package %(replica)s is not a replica of %(uuid)s in location %(location)s"
+                )
+                % {
+                    "replica": replica_package.uuid,
+                    "uuid": self.uuid,
+                    "location": replicator_location.uuid,
+                }
+            )
+        else:
+            LOGGER.info("Resuming replica package %s", replica_package.uuid)
 
         # Check if enough space on the space and location
-        src_space = replicandum_location.space
         dest_space = replica_package.current_location.space
         self._check_quotas(dest_space, replica_package.current_location)
+        replica_package.encrypted = _is_encrypted_space(dest_space)
 
-        # Replicate AIP at
-        # destination_location/uuid/split/into/chunks/destination_path
-        uuid_path = utils.uuid_to_path(replica_package.uuid)
-        replica_package.current_path = os.path.join(
-            uuid_path, replica_package.current_path
-        )
-        replica_destination_path = os.path.join(
-            replica_package.current_location.relative_path, replica_package.current_path
-        )
         replica_package.status = Package.PENDING
         replica_package.save()
 
-        # Copy replicandum AIP from its source location to the SS
-        src_space.move_to_storage_service(
-            source_path=os.path.join(
-                replicandum_location.relative_path, replicandum_path, ""
-            ),
-            destination_path=replica_package.current_path,
-            destination_space=dest_space,
+        update_master_pointer = replication_source is None
+        if replication_source is None:
+            replication_source = self._get_replication_source()
+        try:
+            replication_event_uuid = self._replicate_to(
+                replica_package, replication_source
+            )
+        except Exception:
+            LOGGER.exception(
+                "Replicating package %s to replicator location %s failed",
+                replicandum_uuid,
+                replicator_location.uuid,
+            )
+            replica_package.status = Package.FAIL
+            replica_package.save()
+            raise
+        finally:
+            if update_master_pointer:
+                self._remove_replication_source(replication_source)
+
+        # Update the pointer file of the replicated AIP (master) so that it
+        # contains a record of its replication.
+        if update_master_pointer and replication_event_uuid:
+            self._record_replication(replica_package, replication_event_uuid)
+
+        LOGGER.info(
+            "Finished replicating package %s as replica package %s",
+            replicandum_uuid,
+            replica_package.uuid,
         )
-        replica_package.status = Package.STAGING
-        replica_package.save()
-        src_space.post_move_to_storage_service()
+        return replica_package, replication_event_uuid
+
+    def _get_replication_source(self):
+        """Gather what every replica of this package needs from the master:
+        the checksum recorded in its pointer file and the checksum of the
+        package as it is now, calculated once whatever the number of
+        replicas. If the package is not locally accessible it is fetched
+        once and the replicas are staged from that local copy.
 
-        # Get the master AIP's pointer file and extract the checksum details
-        master_ptr = self.get_pointer_instance()
-        if master_ptr:
+        :returns: ReplicationSource namedtuple.
+        """
+        local_path = self.get_local_path()
+        if self.message_digest and self.full_pointer_file_path:
+            master_checksum_algorithm = self.message_digest_algorithm
+            master_checksum = self.message_digest
+        else:
+            master_ptr = self.get_pointer_instance()
+            if not master_ptr:
+                return ReplicationSource(local_path, None, None, None, None)
             master_ptr_aip_fsentry = master_ptr.get_file(file_uuid=self.uuid)
             master_premis_object = master_ptr_aip_fsentry.get_premis_objects()[0]
             master_checksum_algorithm = master_premis_object.message_digest_algorithm
             master_checksum = master_premis_object.message_digest
+        staged_path = None
+        if local_path is None:
+            staged_path = local_path = self.fetch_local_path()
+        # Calculate the checksum of the replicas while we have it locally, to
+        # compare it to the master's checksum.
+        checksum = utils.generate_checksum(
+            local_path, master_checksum_algorithm
+        ).hexdigest()
+        return ReplicationSource(
+            local_path,
+            staged_path,
+            master_checksum_algorithm,
+            master_checksum,
+            checksum,
+        )
 
-            # Calculate the checksum of the replica while we have it locally,
-            # compare it to the master's checksum and create a PREMIS validation
-            # event out of the result.
-            replica_local_path = self.get_local_path()
-            replica_checksum = utils.generate_checksum(
-                replica_local_path, master_checksum_algorithm
-            ).hexdigest()
+    def _remove_replication_source(self, replication_source):
+        """Delete the local copy fetched by ``_get_replication_source``."""
+        if replication_source.staged_path:
+            self.remove_local_copy(replication_source.staged_path)
+
+    def _replicate_to(self, replica_package, replication_source):
+        """Copy this package to ``replica_package``'s location and create the
+        replica's pointer file.
+
+        :returns: UUID of the replication event, or None if this package has
+            no pointer file.
+        """
+        src_space = self.current_location.space
+        dest_space = replica_package.current_location.space
+        replica_destination_path = os.path.join(
+            replica_package.current_location.relative_path, replica_package.current_path
+        )
+        replicandum_source_path = os.path.join(
+            self.current_location.relative_path, self.current_path, ""
+        )
+
+        # Copy replicandum AIP straight to the replicator location if the
+        # destination space supports it, otherwise from its source location
+        # (or the local copy already fetched) to the SS
+        try:
+            if replication_source.staged_path:
+                raise PosixMoveUnsupportedError()
+            replica_storage_effects = src_space.copy_direct(
+                source_path=replicandum_source_path,
+                destination_path=replica_destination_path,
+                destination_space=dest_space,
+                package=replica_package,
+            )
+            staged = False
+        except PosixMoveUnsupportedError:
+            if replication_source.staged_path:
+                staging_path = os.path.join(
+                    dest_space.staging_path, replica_package.current_path
+                )
+                dest_space.create_local_directory(staging_path)
+                source_path = replication_source.staged_path
+                if os.path.isdir(source_path):
+                    source_path = os.path.join(source_path, "")
+                dest_space.move_rsync(source_path, staging_path)
+            else:
+                src_space.move_to_storage_service(
+                    source_path=replicandum_source_path,
+                    destination_path=replica_package.current_path,
+                    destination_space=dest_space,
+                    package=replica_package,
+                )
+                src_space.post_move_to_storage_service()
+            replica_package.status = Package.STAGING
+            replica_package.save()
+            staged = True
+
+        replication_event_uuid = None
+        if replication_source.checksum_algorithm:
+            # Compare the replica's checksum to the master's checksum and
+            # create a PREMIS validation event out of the result.
             checksum_report = _get_checksum_report(
-                master_checksum,
+                replication_source.master_checksum,
                 self.uuid,
-                replica_checksum,
+                replication_source.checksum,
                 replica_package.uuid,
-                master_checksum_algorithm,
+                replication_source.checksum_algorithm,
             )
             replication_validation_event = premis.create_replication_validation_event(
                 replica_package.uuid,
@@ -651,29 +1161,25 @@ class Package(models.Model):
             # contains the PREMIS replication event.
             replication_event_uuid = str(uuid4())
             replica_pointer_file = self.create_replica_pointer_file(
-                replica_package,
-                replication_event_uuid,
-                replication_validation_event,
-                master_ptr=master_ptr,
-            )
-            write_pointer_file(
-                replica_pointer_file, replica_package.full_pointer_file_path
+                replica_package, replication_event_uuid, replication_validation_event
             )
+            replica_package.save_pointer_file(replica_pointer_file)
             replica_package.save()
 
         # Copy replicandum AIP from the SS to replica package's replicator
         # location.
-        replica_storage_effects = dest_space.move_from_storage_service(
-            source_path=replica_package.current_path,
-            destination_path=replica_destination_path,
-            package=replica_package,
-        )
+        if staged:
+            replica_storage_effects = dest_space.move_from_storage_service(
+                source_path=replica_package.current_path,
+                destination_path=replica_destination_path,
+                package=replica_package,
+            )
         if dest_space.access_protocol not in (Space.LOM, Space.ARKIVUM):
             replica_package.status = Package.UPLOADED
         replica_package.save()
         dest_space.post_move_from_storage_service(
-            staging_path=replica_package.current_path,
-            destination_path=replica_destination_path,
+            staging_path=replica_package.current_path if staged else None,
+            destination_path=replica_destination_path if staged else None,
             package=replica_package,
         )
         self._update_quotas(dest_space, replica_package.current_location)
@@ -689,23 +1195,22 @@ class Package(models.Model):
                 revised_replica_pointer_file = replica_package.create_new_pointer_file_given_storage_effects(
                     replica_pointer_file, replica_storage_effects
                 )
-                write_pointer_file(
-                    revised_replica_pointer_file, replica_package.full_pointer_file_path
+                replica_package.save_pointer_file(revised_replica_pointer_file)
+        return replication_event_uuid
+
+    def _record_replication(self, replica_package, replication_event_uuid):
+        """Add the replication of this package to ``replica_package`` to this
+        package's pointer file."""
+        # Replicas may be created by several processes at once (see
+        # ReplicationTask), so the pointer file is read and written while
+        # holding a lock on its directory.
+        with _locked_directory(os.path.dirname(self.full_pointer_file_path)):
+            master_ptr = self.get_pointer_instance()
+            if master_ptr:
+                new_master_pointer_file = self.create_new_pointer_file_with_replication(
+                    master_ptr, replica_package, replication_event_uuid
                 )
-
-        # Update the pointer file of the replicated AIP (master) so that it
-        # contains a record of its replication.
-        if master_ptr:
-            new_master_pointer_file = self.create_new_pointer_file_with_replication(
-                master_ptr, replica_package, replication_event_uuid
-            )
-            write_pointer_file(new_master_pointer_file, self.full_pointer_file_path)
-
-        LOGGER.info(
-            "Finished replicating package %s as replica package %s",
-            replicandum_uuid,
-            replica_package.uuid,
-        )
+                self.save_pointer_file(new_master_pointer_file)
 
     def should_have_pointer_file(self, package_full_path=None, package_type=None):
         """Returns ``True`` if the package is both an AIP/AIC and is a file.
@@ -785,24 +1290,53 @@ class Package(models.Model):
         """
         LOGGER.info("store_aip called in Package class of SS")
         LOGGER.info("store_aip got origin_path {}".format(origin_path))
-        v = self._store_aip_to_pending(origin_location, origin_path)
-        storage_effects, checksum = self._store_aip_to_uploaded(v, related_package_uuid)
-        self._store_aip_ensure_pointer_file(
-            v,
-            checksum,
-            premis_events=premis_events,
-            premis_agents=premis_agents,
-            aip_subtype=aip_subtype,
-        )
-        if storage_effects:
-            pointer_file = self.get_pointer_instance()
-            if pointer_file:
-                revised_pointer_file = self.create_new_pointer_file_given_storage_effects(
-                    pointer_file, storage_effects
+        attributes = {
+            "package.uuid": self.uuid,
+            "space.protocol": self.current_location.space.access_protocol,
+        }
+        with tracing.span("package.store_aip", attributes):
+            with tracing.span("store_aip.pending"):
+                progress.stage("store_aip.pending")
+                v = self._store_aip_to_pending(origin_location, origin_path)
+            with tracing.span("store_aip.uploaded"):
+                progress.stage("store_aip.uploaded", self.size)
+                try:
+                    storage_effects, checksum = self._store_aip_to_uploaded(
+                        v, related_package_uuid
+                    )
+                except progress.TaskCancelled:
+                    self.status = Package.FAIL
+                    self.save()
+                    raise
+            # Once uploaded, the AIP is stored to the end: cancelling the task
+            # would leave it without pointer file, replicas or callbacks
+            with progress.shielded(), tracing.span("store_aip.pointer_file"):
+                progress.stage("store_aip.pointer_file")
+                self._store_aip_ensure_pointer_file(
+                    v,
+                    checksum,
+                    premis_events=premis_events,
+                    premis_agents=premis_agents,
+                    aip_subtype=aip_subtype,
                 )
-                write_pointer_file(revised_pointer_file, self.full_pointer_file_path)
-        self.create_replicas()
-        self.run_post_store_callbacks()
+                if storage_effects:
+                    pointer_file = self.get_pointer_instance()
+                    if pointer_file:
+                        revised_pointer_file = self.create_new_pointer_file_given_storage_effects(
+                            pointer_file, storage_effects
+                        )
+                        self.save_pointer_file(revised_pointer_file)
+            with progress.shielded(), tracing.span("store_aip.replication"):
+                progress.stage("store_aip.replication")
+                if settings.REPLICATION_QUEUE_ENABLED:
+                    from .replication import ReplicationTask
+
+                    ReplicationTask.enqueue(self)
+                else:
+                    self.create_replicas()
+            with progress.shielded(), tracing.span("store_aip.callbacks"):
+                progress.stage("store_aip.callbacks")
+                self.run_post_store_callbacks()
 
     def _store_aip_to_pending(self, origin_location, origin_path):
         """Get this AIP to the "pending" stage of ``store_aip`` by
@@ -907,10 +1441,18 @@ class Package(models.Model):
             checksum = None
             if v.should_have_pointer and (not v.already_generated_ptr_exists):
                 # If posix_move didn't raise, then get_local_path() should
-                # return not None
+                # return not None, unless the package was copied directly to
+                # an object store, in which case the source is still local
+                local_path = self.get_local_path() or os.path.join(
+                    v.src_space.path, source_path
+                )
                 checksum = utils.generate_checksum(
-                    self.get_local_path(), Package.DEFAULT_CHECKSUM_ALGORITHM
+                    local_path, Package.DEFAULT_CHECKSUM_ALGORITHM
                 ).hexdigest()
+            self._record_shape(
+                self.get_local_path() or os.path.join(v.src_space.path, source_path),
+                v.dest_space,
+            )
             if related_package_uuid is not None:
                 related_package = Package.objects.get(uuid=related_package_uuid)
                 self.related_packages.add(related_package)
@@ -929,34 +1471,16 @@ class Package(models.Model):
             # 8. call ``post_move_from_storage_service`` on the destination space,
             # 9. update quotas on the destination space, and
             # 10. persist the package to the database.
-            v.src_space.move_to_storage_service(
-                source_path=os.path.join(
-                    self.origin_location.relative_path, self.origin_path
-                ),
-                destination_path=self.current_path,  # This should include Location.path
-                destination_space=v.dest_space,
-            )
-            # We have to manually construct the AIP's current path here;
-            # ``self.get_local_path()`` won't work.
-            local_aip_path = os.path.join(v.dest_space.staging_path, self.current_path)
-            checksum = None
-            if v.should_have_pointer and (not v.already_generated_ptr_exists):
-                checksum = utils.generate_checksum(
-                    local_aip_path, Package.DEFAULT_CHECKSUM_ALGORITHM
-                ).hexdigest()
-            self.status = Package.STAGING
-            self.save()
-            v.src_space.post_move_to_storage_service()
-            storage_effects = v.dest_space.move_from_storage_service(
-                source_path=self.current_path,  # This should include Location.path
-                destination_path=os.path.join(
-                    self.current_location.relative_path, self.current_path
-                ),
-                package=self,
-            )
-            # Update package status once transferred to SS
-            if v.dest_space.access_protocol not in (Space.LOM, Space.ARKIVUM):
-                self.status = Package.UPLOADED
+            try:
+                with StagingReservation.reserve(
+                    _staging_copy_path(v.dest_space, self.current_path),
+                    self.size,
+                    "staging",
+                ):
+                    storage_effects, checksum = self._store_aip_via_staging(v)
+            except progress.TaskCancelled:
+                _remove_staging_copy(v.dest_space, self.current_path)
+                raise
             if related_package_uuid is not None:
                 related_package = Package.objects.get(uuid=related_package_uuid)
                 self.related_packages.add(related_package)
@@ -971,6 +1495,42 @@ class Package(models.Model):
             self._update_quotas(v.dest_space, self.current_location)
             return storage_effects, checksum
 
+    def _store_aip_via_staging(self, v):
+        """Move this AIP to its destination through the SS internal location
+        (steps 1 to 6 of the staging case of ``_store_aip_to_uploaded``) and
+        return the storage effects and the checksum of the AIP."""
+        v.src_space.move_to_storage_service(
+            source_path=os.path.join(
+                self.origin_location.relative_path, self.origin_path
+            ),
+            destination_path=self.current_path,  # This should include Location.path
+            destination_space=v.dest_space,
+            package=self,
+        )
+        # We have to manually construct the AIP's current path here;
+        # ``self.get_local_path()`` won't work.
+        local_aip_path = os.path.join(v.dest_space.staging_path, self.current_path)
+        checksum = None
+        if v.should_have_pointer and (not v.already_generated_ptr_exists):
+            checksum = utils.generate_checksum(
+                local_aip_path, Package.DEFAULT_CHECKSUM_ALGORITHM
+            ).hexdigest()
+        self._record_shape(local_aip_path, v.dest_space)
+        self.status = Package.STAGING
+        self.save()
+        v.src_space.post_move_to_storage_service()
+        storage_effects = v.dest_space.move_from_storage_service(
+            source_path=self.current_path,  # This should include Location.path
+            destination_path=os.path.join(
+                self.current_location.relative_path, self.current_path
+            ),
+            package=self,
+        )
+        # Update package status once transferred to SS
+        if v.dest_space.access_protocol not in (Space.LOM, Space.ARKIVUM):
+            self.status = Package.UPLOADED
+        return storage_effects, checksum
+
     def _store_aip_ensure_pointer_file(
         self, v, checksum, premis_events=None, premis_agents=None, aip_subtype=None
     ):
@@ -1054,7 +1614,7 @@ class Package(models.Model):
             self.pointer_file_location = None
             self.pointer_file_path = None
         else:
-            write_pointer_file(pointer_file, pointer_file_dst)
+            self.save_pointer_file(pointer_file, pointer_file_dst)
 
     def _update_existing_ptr_loc_info(self):
         """Update an AM-created pointer file's location information."""
@@ -1076,12 +1636,8 @@ class Package(models.Model):
             root.find(".//mets:fileGrp", namespaces=utils.NSMAP).set(
                 "USE", "Archival Information Package"
             )
-        with open(pointer_absolute_path, "w") as f:
-            f.write(
-                etree.tostring(
-                    root, pretty_print=True, xml_declaration=True, encoding="utf-8"
-                )
-            )
+        write_pointer_file(root, pointer_absolute_path)
+        self.record_pointer_metadata(root)
 
     # ==========================================================================
     # END Store AIP methods
@@ -1095,10 +1651,68 @@ class Package(models.Model):
         """
         if not self.should_have_pointer_file():
             return None
-        ptr_path = self.full_pointer_file_path
-        if not ptr_path:
+        if not self.full_pointer_file_path:
             return None
-        return metsrw.METSDocument.fromfile(ptr_path)
+        return self._get_pointer_document()
+
+    def get_pointer_tree(self):
+        """Return this package's pointer file parsed as an lxml tree.
+
+        The pointer file is parsed once: the tree is kept, and reused for as
+        long as the file is not modified. The tree returned is a copy of it,
+        that can be modified.
+        """
+        return copy.deepcopy(self._pointer_tree())
+
+    def _pointer_tree(self):
+        """Return the tree kept by ``get_pointer_tree``, which is shared and
+        must not be modified."""
+        ptr_path = self.full_pointer_file_path
+        key = _file_key(ptr_path)
+        if self._pointer_cache and self._pointer_cache[:2] == [ptr_path, key]:
+            return self._pointer_cache[2]
+        parser = etree.XMLParser(remove_blank_text=True)
+        tree = etree.parse(ptr_path, parser=parser)
+        self._pointer_cache = [ptr_path, key, tree, None]
+        return tree
+
+    def _get_pointer_document(self):
+        """Return the ``metsrw.METSDocument`` of ``get_pointer_tree``."""
+        tree = self._pointer_tree()
+        if self._pointer_cache[3] is None:
+            self._pointer_cache[3] = metsrw.METSDocument.fromtree(tree)
+        return self._pointer_cache[3]
+
+    @contextmanager
+    def updating_pointer_file(self):
+        """Yield this package's pointer file as a ``metsrw.METSDocument`` to
+        modify, and write it once done. The pointer file is left untouched if
+        an exception is raised."""
+        mets = self._get_pointer_document()
+        try:
+            yield mets
+        except BaseException:
+            self._pointer_cache = None
+            raise
+        self.save_pointer_file(mets)
+
+    def save_pointer_file(self, pointer_file, pointer_file_path=None):
+        """Write the ``metsrw.METSDocument`` ``pointer_file`` as this
+        package's pointer file, or at ``pointer_file_path``, and keep it so
+        that it is not parsed when read again."""
+        if pointer_file_path is None:
+            pointer_file_path = self.full_pointer_file_path
+        root = write_pointer_file(pointer_file, pointer_file_path)
+        # Serializing a METS document moves some of its elements to the
+        # serialized tree, so keep a copy not affected by later serializations
+        tree = copy.deepcopy(root).getroottree()
+        self._pointer_cache = [
+            pointer_file_path,
+            _file_key(pointer_file_path),
+            tree,
+            None,
+        ]
+        self.record_pointer_metadata(tree)
 
     def create_replica_pointer_file(
         self,
@@ -1434,24 +2048,81 @@ class Package(models.Model):
     def create_replicas(self):
         """Create replicas of this AIP in any replicator locations.
 
-        Note: in a future iteration, this should be done asynchronously by put
-        requests to replicate this package on the "Package Replication Queue";
-        workers will read from this queue and replicate the package to
-        different locations asynchronously, e.g.,::
-
-            >>> job = {'package': self.uuid, 'location': replicator_loc.uuid}
-            >>> RMQ_CHANNEL.basic_publish(
-                exchange='',
-                routing_key=PACKAGE_REPLICATION_QUEUE,
-                body=json.dumps(job).encode('utf8'),
-                properties=pika.BasicProperties(
-                    delivery_mode = 2,  # make message persistent
-                )
-            )
+        The AIP is hashed (and, if not locally accessible, fetched) once and
+        then copied to up to ``settings.REPLICATION_MAX_WORKERS`` replicator
+        locations concurrently. A failed replica is marked as such without
+        stopping the others; a ``StorageException`` listing the failures is
+        raised once all of them have finished. The pointer file of this AIP
+        is updated with every successful replication.
         """
-        replicator_locs = self.current_location.replicators.all()
-        for replicator_loc in replicator_locs:
-            self.replicate(replicator_loc)
+        replicator_locs = list(
+            self.current_location.replicators.select_related("space")
+        )
+        if not replicator_locs:
+            return
+        replication_source = self._get_replication_source()
+        max_workers = min(len(replicator_locs), settings.REPLICATION_MAX_WORKERS)
+        results = []
+        failures = []
+        try:
+            if max_workers <= 1:
+                for replicator_loc in replicator_locs:
+                    try:
+                        results.append(
+                            self.replicate(replicator_loc, replication_source)
+                        )
+                    except Exception as err:
+                        failures.append((replicator_loc, err))
+            else:
+                with futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    pending = {
+                        executor.submit(
+                            self._reload()._replicate_in_thread,
+                            replicator_loc,
+                            replication_source,
+                        ): replicator_loc
+                        for replicator_loc in replicator_locs
+                    }
+                    for future in futures.as_completed(pending):
+                        try:
+                            results.append(future.result())
+                        except Exception as err:
+                            failures.append((pending[future], err))
+        finally:
+            self._remove_replication_source(replication_source)
+
+        # Pointer file updates are applied one at a time, each one on top of
+        # the previous one.
+        for replica_package, replication_event_uuid in sorted(
+            results, key=lambda result: result[0].pk
+        ):
+            if replication_event_uuid:
+                self._record_replication(replica_package, replication_event_uuid)
+
+        if failures:
+            raise StorageException(
+                _("Replication of package %(uuid)s failed: %(failures)s")
+                % {
+                    "uuid": self.uuid,
+                    "failures": "; ".join(
+                        "{}: {}".format(replicator_loc.uuid, err)
+                        for replicator_loc, err in failures
+                    ),
+                }
+            )
+
+    def _reload(self):
+        """Return a new instance of this package, with its own location and
+        space, for a replication thread: the local copy of this package and
+        the clients cached by its space are not shared between threads."""
+        return Package.objects.select_related("current_location__space").get(pk=self.pk)
+
+    def _replicate_in_thread(self, replicator_location, replication_source):
+        try:
+            return self.replicate(replicator_location, replication_source)
+        finally:
+            # Each thread gets its own database connection
+            connection.close()
 
     def _replace_callback_placeholders(self, uri, body):
         """Replace post store callback placeholders with values.
@@ -1500,6 +2171,8 @@ class Package(models.Model):
             except CallbackError as e:
                 LOGGER.error("Error in %s callback: %s", callback.event, str(e))
 
+    @_instrumented("extract_file")
+    @_using_local_copy
     def extract_file(self, relative_path="", extract_path=None):
         """Attempts to extract this package.
 
@@ -1516,8 +2189,9 @@ class Package(models.Model):
         ss_internal = Location.active.get(purpose=Location.STORAGE_SERVICE_INTERNAL)
         full_path = self.fetch_local_path()
 
-        if extract_path is None:
-            extract_path = tempfile.mkdtemp(dir=ss_internal.full_path)
+        temp_dir = extract_path is None
+        if temp_dir:
+            extract_path = Workspace.create("extract", dir=ss_internal.full_path)
 
         # The basename is the base directory containing a package
         # like an AIP inside the compressed file.
@@ -1530,54 +2204,72 @@ class Package(models.Model):
             output_path = os.path.join(extract_path, relative_path)
         else:
             output_path = os.path.join(extract_path, basename)
+        progress.stage("extract_file", None if relative_path else self.size)
 
-        if self.is_compressed:
-            # The command used to extract the compressed file at
-            # full_path was, previously, universally::
-            #
-            #     $ unar -force-overwrite -o extract_path full_path
-            #
-            # The problem with this command is that unar treats __MACOSX .rsrc
-            # ("resource fork") files differently than 7z and tar do. 7z and
-            # tar convert these .rsrc files to ._-prefixed files. Similar
-            # behaviour with unar can be achieved by passing `-k hidden`.
-            # However, while a command like::
-            #
-            #     $ unar -force-overwrite -k hidden -o extract_path full_path
-            #
-            # preserves the .rsrc MACOSX files as ._-prefixed files, it does so
-            # differently than 7z/tar do: the resulting .-prefixed files have
-            # different sizes than those created via unar. This makes
-            # ``bag.validate`` choke.
-            if self.full_pointer_file_path:
-                compression = utils.get_compression(self.full_pointer_file_path)
-            else:
-                compression = None  # no pointer file :. command will be unar
-            command = _get_decompr_cmd(compression, extract_path, full_path)
-            if relative_path:
-                command.append(relative_path)
-            LOGGER.info("Extracting file with: %s to %s", command, output_path)
-            rc = subprocess.check_output(command).decode("utf8")
-            if "No files extracted" in rc:
-                raise StorageException(_("Extraction error"))
-        else:
-            if relative_path:
-                # copy only one file out of aip
-                head, tail = os.path.split(full_path)
-                src = os.path.join(head, relative_path)
-                os.mkdir(os.path.join(extract_path, basename))
-                shutil.copy(src, output_path)
-            else:
-                src = full_path
-                shutil.copytree(full_path, output_path)
-
-            LOGGER.info("Copying from: %s to %s", src, output_path)
+        try:
+            # Single files are small next to their package: only the
+            # extraction of whole packages reserves space
+            with StagingReservation.reserve(
+                extract_path, None if relative_path else self.size, "extract"
+            ):
+                if self.is_compressed:
+                    # The command used to extract the compressed file at
+                    # full_path was, previously, universally::
+                    #
+                    #     $ unar -force-overwrite -o extract_path full_path
+                    #
+                    # The problem with this command is that unar treats __MACOSX .rsrc
+                    # ("resource fork") files differently than 7z and tar do. 7z and
+                    # tar convert these .rsrc files to ._-prefixed files. Similar
+                    # behaviour with unar can be achieved by passing `-k hidden`.
+                    # However, while a command like::
+                    #
+                    #     $ unar -force-overwrite -k hidden -o extract_path full_path
+                    #
+                    # preserves the .rsrc MACOSX files as ._-prefixed files, it does so
+                    # differently than 7z/tar do: the resulting .-prefixed files have
+                    # different sizes than those created via unar. This makes
+                    # ``bag.validate`` choke.
+                    compression = self._get_compression()
+                    command = _get_decompr_cmd(compression, extract_path, full_path)
+                    if relative_path:
+                        command.append(relative_path)
+                    LOGGER.info("Extracting file with: %s to %s", command, output_path)
+                    with tracing.command_span(
+                        command
+                    ), tempfile.TemporaryFile() as output:
+                        p = subprocess.Popen(command, stdout=output)
+                        returncode = progress.wait(p)
+                        if returncode != 0:
+                            raise subprocess.CalledProcessError(returncode, command)
+                        output.seek(0)
+                        rc = output.read().decode("utf8")
+                    if "No files extracted" in rc:
+                        raise StorageException(_("Extraction error"))
+                else:
+                    if relative_path:
+                        # copy only one file out of aip
+                        head, tail = os.path.split(full_path)
+                        src = os.path.join(head, relative_path)
+                        os.makedirs(os.path.dirname(output_path))
+                        _copy_local(src, output_path)
+                    else:
+                        src = full_path
+                        _copy_local(full_path, output_path)
+
+                    LOGGER.info("Copying from: %s to %s", src, output_path)
+        except (progress.TaskCancelled, InsufficientStagingSpace):
+            if temp_dir:
+                Workspace.remove(extract_path)
+            raise
 
         if not relative_path:
             self.local_path_location = ss_internal
             self.local_path = output_path
         return (output_path, extract_path)
 
+    @_instrumented("compress_package")
+    @_using_local_copy
     def compress_package(self, algorithm, extract_path=None, detailed_output=False):
         """
         Produces a compressed copy of the package.
@@ -1596,9 +2288,10 @@ class Package(models.Model):
         """
         LOGGER.debug("in package.py::compress_package")
 
-        if extract_path is None:
+        temp_dir = extract_path is None
+        if temp_dir:
             ss_internal = Location.active.get(purpose=Location.STORAGE_SERVICE_INTERNAL)
-            extract_path = tempfile.mkdtemp(dir=ss_internal.full_path)
+            extract_path = Workspace.create("compress", dir=ss_internal.full_path)
         if algorithm not in utils.COMPRESSION_ALGORITHMS:
             raise ValueError(
                 _("Algorithm %(algorithm)s not in %(algorithms)s")
@@ -1617,40 +2310,53 @@ class Package(models.Model):
         )
 
         LOGGER.info("Compressing package with: %s to %s", command, compressed_filename)
-        if detailed_output:
-            tool_info_command = utils.get_tool_info_command(algorithm)
-            p = subprocess.Popen(
-                command, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-            )
-            stdout, stderr = p.communicate()
-            rc = p.returncode
-            LOGGER.debug("Compress package RC: %s", rc)
-
-            script_path = "/tmp/{}".format(str(uuid4()))
-            file_ = os.open(script_path, os.O_WRONLY | os.O_CREAT, 0o770)
-            os.write(file_, tool_info_command)
-            os.close(file_)
-            tic_cmd = [script_path]
-            p = subprocess.Popen(
-                tic_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True
-            )
-            tic_stdout, tic_stderr = p.communicate()
-            os.remove(script_path)
-            LOGGER.debug("Tool info stdout")
-            LOGGER.debug(tool_info_command)
-            LOGGER.debug(tic_stdout)
-            LOGGER.debug(tic_stderr)
-            details = {
-                "event_detail": tic_stdout,
-                "event_outcome_detail_note": 'Standard Output="{}"; Standard Error="{}"'.format(
-                    stdout, stderr
-                ),
-            }
-            return (compressed_filename, extract_path, details)
-        else:
-            rc = subprocess.call(command)
-            LOGGER.debug("Compress package RC: %s", rc)
-            return (compressed_filename, extract_path)
+        try:
+            with StagingReservation.reserve(extract_path, self.size, "compress"):
+                if detailed_output:
+                    tool_info_command = utils.get_tool_info_command(algorithm)
+                    with tracing.command_span(
+                        command
+                    ), tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+                        p = subprocess.Popen(command, stdout=out, stderr=err)
+                        rc = progress.wait(p)
+                        out.seek(0)
+                        err.seek(0)
+                        stdout, stderr = out.read(), err.read()
+                    LOGGER.debug("Compress package RC: %s", rc)
+
+                    script_path = "/tmp/{}".format(str(uuid4()))
+                    file_ = os.open(script_path, os.O_WRONLY | os.O_CREAT, 0o770)
+                    os.write(file_, tool_info_command)
+                    os.close(file_)
+                    tic_cmd = [script_path]
+                    p = subprocess.Popen(
+                        tic_cmd,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.PIPE,
+                        shell=True,
+                    )
+                    tic_stdout, tic_stderr = p.communicate()
+                    os.remove(script_path)
+                    LOGGER.debug("Tool info stdout")
+                    LOGGER.debug(tool_info_command)
+                    LOGGER.debug(tic_stdout)
+                    LOGGER.debug(tic_stderr)
+                    details = {
+                        "event_detail": tic_stdout,
+                        "event_outcome_detail_note": 'Standard Output="{}"; Standard Error="{}"'.format(
+                            stdout, stderr
+                        ),
+                    }
+                    return (compressed_filename, extract_path, details)
+                else:
+                    with tracing.command_span(command):
+                        rc = progress.wait(subprocess.Popen(command))
+                    LOGGER.debug("Compress package RC: %s", rc)
+                    return (compressed_filename, extract_path)
+        except (progress.TaskCancelled, InsufficientStagingSpace):
+            if temp_dir:
+                Workspace.remove(extract_path)
+            raise
 
     def _parse_mets(self, prefix):
         """
@@ -1753,6 +2459,7 @@ class Package(models.Model):
             "files": files_data,
         }
 
+    @tracing.traced("db.index_file_data_from_transfer_mets")
     def index_file_data_from_transfer_mets(self, prefix=None):
         """
         Attempts to read an Archivematica transfer METS file inside this
@@ -1811,6 +2518,7 @@ class Package(models.Model):
             ),
             destination_path=self.current_path,  # This should include Location.path
             destination_space=dest_space,
+            package=self,
         )
 
         try:
@@ -1833,6 +2541,18 @@ class Package(models.Model):
         self.status = Package.UPLOADED
         self.save()
 
+    def _get_bag_validation_processes(self, path):
+        """Return the number of processes validating the bag of this package
+        at ``path``: where it is stored, or copied to the internal location.
+        """
+        if os.path.normpath(path) == os.path.normpath(self.full_path):
+            space = self.current_location.space
+        else:
+            space = Location.active.get(purpose=Location.STORAGE_SERVICE_INTERNAL).space
+        return utils.get_bag_validation_processes(space)
+
+    @_instrumented("check_fixity")
+    @_using_local_copy
     def check_fixity(self, force_local=False, delete_after=True):
         """ Scans the package to verify its checksums.
 
@@ -1893,11 +2613,16 @@ class Package(models.Model):
             path = self.fetch_local_path()
             temp_dir = None
 
-        bag = bagit.Bag(path)
         try:
-            success = bag.validate(processes=settings.BAG_VALIDATION_NO_PROCESSES)
+            progress.stage("check_fixity", self.size)
+            bag = bagit.Bag(path)
+            success = _validate_bag(bag, self._get_bag_validation_processes(path))
             failures = []
             message = ""
+        except progress.TaskCancelled:
+            if temp_dir:
+                Workspace.remove(temp_dir)
+            raise
         except bagit.BagValidationError as failure:
             LOGGER.error("bagit.BagValidationError on %s:\n%s", path, failure.message)
             try:
@@ -1918,7 +2643,7 @@ class Package(models.Model):
                 or self.local_path != self.full_path
             )
         ):
-            shutil.rmtree(temp_dir)
+            Workspace.remove(temp_dir)
 
         return (success, failures, message, None)
 
@@ -2065,17 +2790,25 @@ class Package(models.Model):
                 "message": _("This AIP is already being reingested on %(pipeline)s")
                 % {"pipeline": self.misc_attributes["reingest_pipeline"]},
             }
-        self.misc_attributes.update({"reingest_pipeline": pipeline.uuid})
+        self.misc_attributes.update(
+            {"reingest_pipeline": pipeline.uuid, "reingest_type": reingest_type}
+        )
 
         # Fetch and extract if needed
         if self.is_compressed:
             local_path, temp_dir = self.extract_file()
             LOGGER.debug("Reingest: extracted to %s", local_path)
         else:
+            local_path = self.fetch_local_path()
+            temp_dir = ""
+            if self._cache_pin is not None:
+                # The copy in the package cache is shared, so the processing
+                # configuration must not be added to it nor the copy deleted
+                temp_dir = self._copy_from_cache(local_path)
+                local_path = self.local_path
             # Append / to uncompressed AIPS so we send the contents of the dir
             # not the dir itself inside a dir of the same name
-            local_path = os.path.join(self.fetch_local_path(), "")
-            temp_dir = ""
+            local_path = os.path.join(local_path, "")
             LOGGER.debug("Reingest: uncompressed at %s", local_path)
 
         # Run fixity
@@ -2183,7 +2916,7 @@ class Package(models.Model):
             except OSError:  # May have been moved not copied
                 pass
         if temp_dir:
-            shutil.rmtree(temp_dir)
+            Workspace.remove(temp_dir)
 
         # Call reingest API
         reingest_target = "transfer" if reingest_type == self.FULL else "ingest"
@@ -2243,6 +2976,11 @@ class Package(models.Model):
         8. Store the AIP in the reingest_location.
         9. Update the pointer file.
 
+        A metadata-only reingest of a package left in a local location, and
+        compressed the same way, skips steps 2 to 8: the METS file and
+        metadata files are replaced where the package is stored (see
+        ``_reingest_metadata_in_place``).
+
         :param Location origin_location: Location the newly re-ingested AIP was
             procesed on.
         :param str origin_path: Path to newly re-ingested AIP in
@@ -2268,38 +3006,61 @@ class Package(models.Model):
             purpose=Location.STORAGE_SERVICE_INTERNAL
         )
         internal_space = internal_location.space
+        timings = utils.StageTimings()
         # Take note of whether the (soon-to-be) old (i.e., current) version of
         # this AIP was compressed.
         was_compressed = self.is_compressed
-        # Copy the current AIP to the Storage Service's internal location,
-        # extracting it if needed. We keep track of ``extract_path_to_delete``
-        # so we can delete it later. Note: ``old_aip_internal_path`` points to
-        # a copy of this package in a SS-internal location.
-        old_aip_internal_path, extract_path_to_delete = self.extract_file()
 
-        # 1. Fetch (and extract) the reingested AIP (and its pointer file) from
-        #    the origin_location and put them in the internal processing
-        #    location. Move the newly re-ingested version of the AIP from the
-        #    original location to the internal location for processing.
-        rein_aip_internal_path = self._move_reingested_aip_from_origin_to_internal(
-            origin_space,
-            origin_location,
-            origin_path,
-            internal_space,
-            internal_location,
-            reingest_path,
-        )
-
-        # Take note of whether the new version of the AIP should be compressed.
-        to_be_compressed = rein_aip_is_compressed = os.path.isfile(
-            rein_aip_internal_path
-        )
+        def fetch_reingested_aip():
+            # 1. Fetch (and extract) the reingested AIP from the
+            #    origin_location and put it in the internal processing
+            #    location. Returns its path and whether it was compressed.
+            with timings.stage("fetch"):
+                path = self._move_reingested_aip_from_origin_to_internal(
+                    origin_space,
+                    origin_location,
+                    origin_path,
+                    internal_space,
+                    internal_location,
+                    reingest_path,
+                )
+            if not os.path.isfile(path):
+                return path, False
+            with timings.stage("extract_reingested"):
+                return _extract_rein_aip(internal_location, path), True
+
+        # A metadata-only reingest only changes the METS file and metadata
+        # directory, which are updated where the AIP is stored if possible.
+        rein_aip = None
+        if self._can_reingest_metadata_in_place(reingest_location):
+            rein_aip = fetch_reingested_aip()
+            if self._reingest_metadata_in_place(
+                rein_aip, origin_location, origin_path, premis_events, timings
+            ):
+                LOGGER.info("Reingest of package %s finished (%s)", self.uuid, timings)
+                self.misc_attributes["reingest_timings"] = timings.durations
+                self.save()
+                return
 
-        # Extract reingested AIP, if needed
-        if rein_aip_is_compressed:
-            rein_aip_internal_path = _extract_rein_aip(
-                internal_location, rein_aip_internal_path
-            )
+        # Copy the current AIP to the Storage Service's internal location,
+        # extracting it if needed, while the reingested AIP is fetched. We
+        # keep track of ``extract_path_to_delete`` so we can delete it later.
+        # Note: ``old_aip_internal_path`` points to a copy of this package in
+        # a SS-internal location. ``to_be_compressed`` tells whether the new
+        # version of the AIP should be compressed.
+        if rein_aip is None:
+            (
+                old_aip_internal_path,
+                extract_path_to_delete,
+                rein_aip,
+            ) = self._extract_while(fetch_reingested_aip, timings)
+        else:
+            with timings.stage("extract"):
+                old_aip_internal_path, extract_path_to_delete = self.extract_file()
+        rein_aip_internal_path, to_be_compressed = rein_aip
+        # Checksums of the payload of this AIP, to reuse those of the files
+        # that the reingest leaves untouched
+        payload_checksums = _get_payload_checksums(old_aip_internal_path)
 
         # Copy the pointer file, if it exists, from the origin location (e.g.,
         # currently processing) to the internal location.
@@ -2351,61 +3112,39 @@ class Package(models.Model):
         )
 
         # 5. Create a new bag from the AIP at ``old_aip_internal_path`` and
-        #    validate it.
-        _update_bag_payload_and_verify(old_aip_internal_path)
+        #    check that it is complete.
+        with timings.stage("update_bag"):
+            _update_bag_payload_and_verify(
+                old_aip_internal_path,
+                payload_checksums,
+                processes=self._get_bag_validation_processes(old_aip_internal_path),
+            )
 
         compression = None
         if to_be_compressed:
-            if os.path.isfile(rein_pointer_dst_full_path):
-                compression = utils.get_compression(rein_pointer_dst_full_path)
+            compression = self._get_reingest_compression(
+                rein_pointer_dst_full_path, premis_events
+            )
+            if was_compressed and os.path.isfile(rein_pointer_dst_full_path):
                 # If updating, rather than creating a new pointer file, delete
                 # this pointer file. TODO: this is maybe not a good idea and
                 # might be what is messing with encrypted re-ingest...
-                LOGGER.info(
-                    'Extracted compression "{}" from pointer file'.format(compression)
-                )
-                if was_compressed:
-                    os.remove(rein_pointer_dst_full_path)
-            else:
-                compression_algorithm, __, archive_tool = _get_compression_details_from_premis_events(
-                    premis_events, self.uuid
-                )
-                try:
-                    compression = {
-                        "bzip2": utils.COMPRESSION_7Z_BZIP,
-                        "lzma": utils.COMPRESSION_7Z_LZMA,
-                        "pbzip2": utils.COMPRESSION_TAR_BZIP2,
-                        "tar.gzip": utils.COMPRESSION_TAR_GZIP,
-                        "copy": utils.COMPRESSION_7Z_COPY,
-                    }[compression_algorithm]
-                    LOGGER.info(
-                        'Extracted compression "{}" from AM-passed'
-                        " PREMIS events".format(compression)
-                    )
-                except KeyError:
-                    msg = (
-                        "Failed to extract valid compression algorithm from"
-                        ' "{}"; does not match any of the following recognized'
-                        " options: {}".format(
-                            compression_algorithm,
-                            ", ".join(utils.COMPRESSION_ALGORITHMS),
-                        )
-                    )
-                    LOGGER.error(msg)
-                    raise StorageException(msg)
+                os.remove(rein_pointer_dst_full_path)
 
         # 6. Compress the re-ingested AIP (if necessary) and get the local path
         #    to it and to its parent directory. At this point ``updated_aip``
         #    points to the same location as ``old_aip`` but the new var name
         #    indicates the update via reingest.
-        updated_aip_path, updated_aip_parent_path = self._compress_and_clean_for_reingest(
-            to_be_compressed,
-            was_compressed,
-            compression,
-            rein_aip_internal_path,
-            extract_path_to_delete,
-        )
+        with timings.stage("compress"):
+            updated_aip_path, updated_aip_parent_path = self._compress_and_clean_for_reingest(
+                to_be_compressed,
+                was_compressed,
+                compression,
+                rein_aip_internal_path,
+                extract_path_to_delete,
+            )
         self.size = utils.recalculate_size(updated_aip_path)
+        self._record_shape(updated_aip_path, reingest_space, compression or "")
 
         # 7. Create a pointer file if AM has not done so.
         if (
@@ -2425,29 +3164,32 @@ class Package(models.Model):
             )
 
         # 8. Store the AIP in the reingest_location.
-        storage_effects = self._move_rein_updated_to_final_dest(
-            to_be_compressed,
-            removed_pres_der_paths,
-            internal_space,
-            internal_location,
-            updated_aip_parent_path,
-            updated_aip_path,
-            reingest_space,
-            reingest_location,
-            old_aip_internal_path,
-        )
+        with timings.stage("store"):
+            storage_effects = self._move_rein_updated_to_final_dest(
+                to_be_compressed,
+                removed_pres_der_paths,
+                internal_space,
+                internal_location,
+                updated_aip_parent_path,
+                updated_aip_path,
+                reingest_space,
+                reingest_location,
+                old_aip_internal_path,
+            )
         if storage_effects:
             pointer_file = self.get_pointer_instance()
             if pointer_file:
                 revised_pointer_file = self.create_new_pointer_file_given_storage_effects(
                     pointer_file, storage_effects
                 )
-                write_pointer_file(revised_pointer_file, self.full_pointer_file_path)
+                self.save_pointer_file(revised_pointer_file)
 
         # 9. Update the pointer file.
         self._process_pointer_file_for_reingest(
             to_be_compressed, was_compressed, compression, updated_aip_path
         )
+        LOGGER.info("Reingest of package %s finished (%s)", self.uuid, timings)
+        self.misc_attributes["reingest_timings"] = timings.durations
         self.save()
         shutil.rmtree(updated_aip_parent_path)  # Delete working files
 
@@ -2455,6 +3197,144 @@ class Package(models.Model):
     # Private methods for ``finish_reingest``
     # ==========================================================================
 
+    def _extract_while(self, function, timings):
+        """Extract this package in the internal location (see
+        ``extract_file``) while calling ``function`` in another thread, if
+        ``settings.REINGEST_MAX_WORKERS`` allows.
+
+        :returns: 3-tuple of the extracted path, the path to delete once done
+            and the return value of ``function``.
+        """
+
+        def extract():
+            with timings.stage("extract"):
+                return self.extract_file()
+
+        if settings.REINGEST_MAX_WORKERS <= 1:
+            return extract() + (function(),)
+        with futures.ThreadPoolExecutor(max_workers=1) as executor:
+            result = executor.submit(_call_in_thread, function)
+            return extract() + (result.result(),)
+
+    def _can_reingest_metadata_in_place(self, reingest_location):
+        """Return True if this package is being reingested metadata-only and
+        can be updated where it is stored, i.e. it stays in a local,
+        unencrypted location, uncompressed or in a 7z archive.
+        """
+        space = self.current_location.space
+        return (
+            self.misc_attributes.get("reingest_type") == self.METADATA_ONLY
+            and reingest_location == self.current_location
+            and space.access_protocol in (Space.LOCAL_FILESYSTEM, Space.NFS)
+            and not _is_encrypted_space(space)
+            and os.path.exists(self.full_path)
+            and (not self.is_compressed or self.compression in IN_PLACE_COMPRESSIONS)
+        )
+
+    def _reingest_metadata_in_place(
+        self, rein_aip, origin_location, origin_path, premis_events, timings
+    ):
+        """Update this package where it is stored with the METS file and the
+        metadata directory of the reingested AIP, without extracting or
+        recompressing the rest of it: the files are replaced in the bag of an
+        uncompressed package or with ``7z u`` in a 7z archive, and only them
+        are hashed to update the manifests of the bag.
+
+        :param rein_aip: path to the (extracted) reingested AIP and whether it
+            was compressed.
+        :returns: False if the package has to go through the full reingest
+            instead because its compression changes, True once updated.
+        """
+        rein_aip_internal_path, to_be_compressed = rein_aip
+        compression = ""
+        if to_be_compressed:
+            pointer_path = os.path.join(
+                origin_location.full_path, os.path.dirname(origin_path), "pointer.xml"
+            )
+            compression = self._get_reingest_compression(pointer_path, premis_events)
+        if to_be_compressed != self.is_compressed or compression != (
+            self.compression if to_be_compressed else ""
+        ):
+            LOGGER.info(
+                "Reingest: compression of %s changes, updating it entirely", self.uuid
+            )
+            return False
+        updated_files = _get_reingested_metadata_files(
+            rein_aip_internal_path, self.uuid
+        )
+        LOGGER.info(
+            "Reingest: updating %s metadata file(s) of %s in place",
+            len(updated_files),
+            self.full_path,
+        )
+        with timings.stage("update_in_place"):
+            if to_be_compressed:
+                self._update_archive_files(updated_files)
+            else:
+                _update_bag_files(
+                    self.full_path,
+                    updated_files,
+                    processes=self._get_bag_validation_processes(self.full_path),
+                )
+        old_size = self.size
+        self.size = utils.recalculate_size(self.full_path)
+        self._update_quotas(
+            self.current_location.space, self.current_location, self.size - old_size
+        )
+        if to_be_compressed:
+            with self.updating_pointer_file() as mets:
+                aip = mets.get_file(type="Archival Information Package")
+                self._filter_and_remove_decompression_transforms(aip)
+                self._update_pointer_file(compression, mets, path=self.full_path)
+        shutil.rmtree(rein_aip_internal_path)
+        return True
+
+    def _update_archive_files(self, updated_files):
+        """Replace or add files in the bag of this package's 7z archive (see
+        ``_update_bag_files``), extracting its tag files only.
+        """
+        archive_path = self.full_path
+        base_directory = self.get_base_directory()
+        internal_location = Location.active.get(
+            purpose=Location.STORAGE_SERVICE_INTERNAL
+        )
+        work_dir = Workspace.create("update_archive", dir=internal_location.full_path)
+        processes = utils.get_bag_validation_processes(internal_location.space)
+        try:
+            command = [
+                "7z",
+                "x",
+                "-bd",
+                "-y",
+                "-r-",  # Files at the root of the bag only
+                "-o" + work_dir,
+                archive_path,
+                os.path.join(base_directory, "*"),
+            ]
+            with tracing.command_span(command):
+                subprocess.check_call(command)
+            old_sizes = utils.get_7z_file_sizes(
+                archive_path,
+                [os.path.join(base_directory, path) for path in updated_files],
+            )
+            _update_bag_files(
+                os.path.join(work_dir, base_directory),
+                updated_files,
+                {
+                    os.path.relpath(path, base_directory): size
+                    for path, size in old_sizes.items()
+                },
+                processes=processes,
+            )
+            command = utils.get_update_command(
+                self.compression, archive_path, [base_directory]
+            )
+            LOGGER.info("Updating %s with: %s", archive_path, command)
+            with tracing.command_span(command):
+                subprocess.check_call(command, cwd=work_dir)
+        finally:
+            Workspace.remove(work_dir)
+
     def _validate_pipelines_for_reingest(self):
         """Confirm that this package's origin_pipeline matches the
         reingest_pipeline set during ``start_reingest``.
@@ -2489,6 +3369,7 @@ class Package(models.Model):
             source_path=os.path.join(origin_location.relative_path, origin_path),
             destination_path=reingest_path,  # This should include Location.path
             destination_space=internal_space,
+            package=self,
         )
         internal_space.move_from_storage_service(
             source_path=reingest_path,  # This should include Location.path
@@ -2549,6 +3430,47 @@ class Package(models.Model):
             rein_pointer_dst_full_path,
         )
 
+    def _get_reingest_compression(self, pointer_path, premis_events):
+        """Return the compression of the reingested AIP, read from the pointer
+        file made by Archivematica at ``pointer_path`` if there is one, from
+        the compression PREMIS event otherwise.
+        """
+        if os.path.isfile(pointer_path):
+            compression = utils.get_compression(pointer_path)
+            LOGGER.info(
+                'Extracted compression "{}" from pointer file'.format(compression)
+            )
+            return compression
+        compression_algorithm, __, archive_tool = _get_compression_details_from_premis_events(
+            premis_events, self.uuid
+        )
+        try:
+            compression = {
+                "bzip2": utils.COMPRESSION_7Z_BZIP,
+                "lzma": utils.COMPRESSION_7Z_LZMA,
+                "pbzip2": utils.COMPRESSION_TAR_BZIP2,
+                "lbzip2": utils.COMPRESSION_TAR_BZIP2,
+                "tar.gzip": utils.COMPRESSION_TAR_GZIP,
+                "pigz": utils.COMPRESSION_TAR_GZIP,
+                "zstd": utils.COMPRESSION_TAR_ZSTD,
+                "copy": utils.COMPRESSION_7Z_COPY,
+            }[compression_algorithm]
+        except KeyError:
+            msg = (
+                "Failed to extract valid compression algorithm from"
+                ' "{}"; does not match any of the following recognized'
+                " options: {}".format(
+                    compression_algorithm, ", ".join(utils.COMPRESSION_ALGORITHMS)
+                )
+            )
+            LOGGER.error(msg)
+            raise StorageException(msg)
+        LOGGER.info(
+            'Extracted compression "{}" from AM-passed'
+            " PREMIS events".format(compression)
+        )
+        return compression
+
     def _overwrite_old_mets_with_rein_mets(
         self, rein_aip_internal_path, old_aip_internal_path
     ):
@@ -2662,17 +3584,18 @@ class Package(models.Model):
         """
         if to_be_compressed:
             # Update pointer file
-            mets = metsrw.METSDocument.fromfile(self.full_pointer_file_path)
-            aip = mets.get_file(type="Archival Information Package")
-            # Reset existing decompression transforms before setting new ones
-            # based on the current compression mechanism
-            self._filter_and_remove_decompression_transforms(aip)
-            self._update_pointer_file(compression, mets, path=updated_aip_path)
+            with self.updating_pointer_file() as mets:
+                aip = mets.get_file(type="Archival Information Package")
+                # Reset existing decompression transforms before setting new
+                # ones based on the current compression mechanism
+                self._filter_and_remove_decompression_transforms(aip)
+                self._update_pointer_file(compression, mets, path=updated_aip_path)
         elif was_compressed:
             # AIP used to be compressed, but is no longer so delete pointer file
             os.remove(self.full_pointer_file_path)
             self.pointer_file_location = None
             self.pointer_file_path = None
+            self._update_fields(**POINTER_METADATA_DEFAULTS)
 
     # ==========================================================================
     # END Private methods for ``finish_reingest``
@@ -2756,10 +3679,6 @@ class Package(models.Model):
             if techmd_position is not None:
                 del aip.amdsecs[0].subsections[techmd_position]
 
-        # Write out pointer file again
-        with open(self.full_pointer_file_path, "w") as f:
-            f.write(mets.tostring().decode("utf8"))
-
     # SWORD-related methods
     def has_been_submitted_for_processing(self):
         return "deposit_completion_time" in self.misc_attributes
@@ -2767,8 +3686,17 @@ class Package(models.Model):
     def _clone(self):
         """Create a new ``Package`` instance that is exactly like ``package`` but has
         a new primary key and UUID.
+
+        Only the field values are copied: the other attributes, e.g. the pin of
+        the package in the package cache or the connections held by the spaces
+        related to the package, are not shared with the clone.
         """
-        clone = copy.deepcopy(self)
+        clone = Package(
+            **{
+                field.attname: copy.deepcopy(getattr(self, field.attname))
+                for field in self._meta.concrete_fields
+            }
+        )
         clone.pk = None
         clone.uuid = None
         clone.save()  # Generate a new id and UUID
@@ -2776,6 +3704,110 @@ class Package(models.Model):
         return clone
 
 
+def _is_encrypted_space(space):
+    """Return True if packages stored in ``space`` are encrypted. Note that we
+    can't compare the type of the child space to GPG because that would cause
+    a circular import.
+    """
+    return getattr(space.get_child_space(), "encrypted_space", False)
+
+
+def _get_base_directory(full_path, compressed, compression=None):
+    """Return the base directory of the package at ``full_path`` (see
+    ``Package.get_base_directory``), compressed with ``compression`` if
+    ``compressed`` (by default, the compression told by its extension)."""
+    if compressed:
+        if compression is None:
+            compression = utils.get_compression_from_extension(full_path)
+        if compression in utils.COMPRESSION_TAR_ALGORITHMS:
+            # lsar does not read Zstandard, and would decompress the whole
+            # archive to list the members of the other tar archives
+            return _get_tar_base_directory(full_path, compression)
+        # Use lsar's JSON output to determine the directories in a
+        # compressed file. Since the index of the base directory may
+        # not be consistent, determine it by filtering all entries
+        # for directories, then determine the directory with the
+        # shortest name. (e.g. foo is the parent of foo/bar)
+        # NOTE: lsar's JSON output is broken in certain circumstances in
+        #       all released versions; make sure to use a patched version
+        #       for this to work.
+        command = ["lsar", "-ja", full_path]
+        with tracing.command_span(command):
+            output = subprocess.check_output(command).decode("utf8")
+        output = json.loads(output)
+        directories = [
+            d["XADFileName"]
+            for d in output["lsarContents"]
+            if d.get("XADIsDirectory", False)
+        ]
+        directories = sorted(directories, key=len)
+        return directories[0]
+    return os.path.basename(full_path)
+
+
+def _get_tar_base_directory(full_path, compression):
+    """Return the base directory of the tar archive at ``full_path``
+    compressed with ``compression``: the first component of the path of its
+    first member, as tar archives are named after the directory they contain
+    (see ``compress_package``). The rest of the archive is not read."""
+    command = ["/bin/tar", "tf", full_path]
+    program = utils.get_tar_compress_program(compression)
+    if program:
+        command.append("--use-compress-program=" + program)
+    elif compression == utils.COMPRESSION_TAR_BZIP2:
+        command.append("-j")
+    elif compression == utils.COMPRESSION_TAR_GZIP:
+        command.append("-z")
+    with tracing.command_span(command):
+        p = subprocess.Popen(command, stdout=subprocess.PIPE)
+        try:
+            member = p.stdout.readline().decode("utf8").strip()
+        finally:
+            # tar stops once it can't write the other members
+            p.stdout.close()
+            returncode = p.wait()
+    if member.startswith("./"):
+        member = member[2:]
+    if not member:
+        raise subprocess.CalledProcessError(returncode or 1, command)
+    return member.split("/")[0]
+
+
+def _staging_copy_path(space, path):
+    """Return the path of the copy of ``path`` in the staging directory of
+    ``space`` made by ``move_to_storage_service``."""
+    return os.path.join(space.staging_path, path.lstrip(os.sep))
+
+
+def _remove_staging_copy(space, path):
+    """Remove the copy of ``path`` left in the staging directory of ``space``
+    by an interrupted move, if any."""
+    staging_copy = _staging_copy_path(space, path)
+    try:
+        if os.path.isdir(staging_copy):
+            shutil.rmtree(utils.coerce_str(staging_copy))
+        elif os.path.isfile(staging_copy):
+            os.remove(staging_copy)
+    except OSError:
+        LOGGER.warning("Unable to remove %s", staging_copy, exc_info=True)
+
+
+def _copy_local(src, dst):
+    """Copy the file or directory ``src`` to ``dst`` (which must not exist),
+    using a reflink or in-kernel copy if possible and ``shutil`` otherwise.
+    """
+    try:
+        fastcopy.copy_path(src, dst)
+        return
+    except (fastcopy.FastCopyUnsupported, EnvironmentError) as err:
+        LOGGER.debug("Fast copy of %s failed, using shutil: %s", src, err)
+    if os.path.isdir(src):
+        shutil.rmtree(dst, ignore_errors=True)
+        shutil.copytree(src, dst)
+    else:
+        shutil.copy(src, dst)
+
+
 def _get_decompr_cmd(compression, extract_path, full_path):
     """Returns a decompression command (as a list), given ``compression``
     (one of ``COMPRESSION_ALGORITHMS``), the destination path
@@ -2787,6 +3819,16 @@ def _get_decompr_cmd(compression, extract_path, full_path):
         utils.COMPRESSION_7Z_COPY,
     ):
         return ["7z", "x", "-bd", "-y", "-o{0}".format(extract_path), full_path]
+    program = utils.get_tar_compress_program(compression)
+    if program:
+        return [
+            "/bin/tar",
+            "xvf",
+            full_path,
+            "--use-compress-program=" + program,
+            "-C",
+            extract_path,
+        ]
     elif compression == utils.COMPRESSION_TAR_BZIP2:
         return ["/bin/tar", "xvjf", full_path, "-C", extract_path]
     elif compression == utils.COMPRESSION_TAR_GZIP:
@@ -2801,6 +3843,22 @@ def _extract_rein_aip(internal_location, rein_aip_internal_path):
     if os.path.isfile(rein_aip_internal_path):
         # TODO modify extract_file and get_base_directory to handle
         # reingest paths?  Update self.local_path sooner?
+        if rein_aip_internal_path.endswith(utils.COMPRESS_EXTENSION_ZSTD):
+            # unar and lsar do not read Zstandard; tar archives are named
+            # after the directory they contain (see compress_package)
+            command = _get_decompr_cmd(
+                utils.COMPRESSION_TAR_ZSTD,
+                internal_location.full_path,
+                rein_aip_internal_path,
+            )
+            LOGGER.info("Extracting reingested AIP with: %s", command)
+            with tracing.command_span(command):
+                subprocess.check_call(command)
+            os.remove(rein_aip_internal_path)
+            bname = os.path.basename(rein_aip_internal_path)[
+                : -len(".tar" + utils.COMPRESS_EXTENSION_ZSTD)
+            ]
+            return os.path.join(internal_location.full_path, bname)
         # Extract
         command = [
             "unar",
@@ -2810,12 +3868,14 @@ def _extract_rein_aip(internal_location, rein_aip_internal_path):
             rein_aip_internal_path,
         ]
         LOGGER.info("Extracting reingested AIP with: %s", command)
-        rc = subprocess.call(command)
+        with tracing.command_span(command):
+            rc = subprocess.call(command)
         LOGGER.debug("Extract file RC: %s", rc)
         # Get output path
         command = ["lsar", "-ja", rein_aip_internal_path]
         try:
-            output = subprocess.check_output(command).decode("utf8")
+            with tracing.command_span(command):
+                output = subprocess.check_output(command).decode("utf8")
             j = json.loads(output)
             bname = sorted(
                 [
@@ -2850,53 +3910,366 @@ def _replace_old_pres_ders_with_reingested(
     path ``internal_path``. Return a list of paths (in the old AIP, in the
     internal processing space) of the old preservation derivatives that were
     deleted (i.e., replaced) from this AIP.
+
+    The reingested derivatives are moved, so the reingested AIP must not be
+    used afterwards.
     """
     rein_aip_objects_dir = os.path.join(rein_aip_internal_path, "data", "objects")
     old_aip_objects_dir = os.path.join(old_aip_internal_path, "data", "objects")
-    preservation_regex = r"(.+)-\w{8}-\w{4}-\w{4}-\w{4}-\w{12}(.*)"
     removed_pres_der_paths = []  # a return value
+    # Preservation derivatives of each directory of this package, indexed by
+    # (name before the UUID, name after the UUID), listed once
+    old_aip_pres_ders = {}
     # Walk through all files in the internally stored reingested AIP
     for rein_aip_dirpath, ___, rein_aip_filenames in scandir.walk(rein_aip_objects_dir):
+        old_aip_pres_der_dir_path = os.path.normpath(
+            os.path.join(
+                old_aip_objects_dir,
+                os.path.relpath(rein_aip_dirpath, rein_aip_objects_dir),
+            )
+        )
         for rein_aip_filename in rein_aip_filenames:
-            match = re.match(preservation_regex, rein_aip_filename)
-            # This file is a preservation derivative, so copy it
-            # to this package's objects/ directory and delete any
-            # same-named preservation derivative in this package's objects/
-            # directory.
-            if match:
-                rein_aip_pres_der_path = os.path.join(
-                    rein_aip_dirpath, rein_aip_filename
-                )
-                old_aip_pres_der_path = rein_aip_pres_der_path.replace(
-                    rein_aip_objects_dir, old_aip_objects_dir
-                )
-                # Check for another preservation derivative and delete
-                old_aip_pres_der_dir_path = os.path.dirname(old_aip_pres_der_path)
-                dupe_preservation_regex = (
-                    match.group(1) + r"-\w{8}-\w{4}-\w{4}-\w{4}-\w{12}" + match.group(2)
-                )
-                for old_aip_filename in os.listdir(old_aip_pres_der_dir_path):
-                    # Don't delete if the 'duplicate' is the original
-                    if rein_aip_filename == old_aip_filename:
-                        continue
-                    if re.match(dupe_preservation_regex, old_aip_filename):
-                        del_path = os.path.join(
-                            old_aip_pres_der_dir_path, old_aip_filename
-                        )
-                        LOGGER.info("Deleting %s", del_path)
-                        os.remove(del_path)
-                        # Save these paths to delete from uncompressed AIP later
-                        removed_pres_der_paths.append(del_path)
-                # Copy new preservation derivative
-                LOGGER.info(
-                    "Moving %s to %s", rein_aip_pres_der_path, old_aip_pres_der_path
+            match = PRESERVATION_DERIVATIVE_REGEX.match(rein_aip_filename)
+            # This file is a preservation derivative, so move it to this
+            # package's objects/ directory and delete any same-named
+            # preservation derivative in this package's objects/ directory.
+            if not match:
+                continue
+            rein_aip_pres_der_path = os.path.join(rein_aip_dirpath, rein_aip_filename)
+            old_aip_pres_der_path = os.path.join(
+                old_aip_pres_der_dir_path, rein_aip_filename
+            )
+            if old_aip_pres_der_dir_path not in old_aip_pres_ders:
+                if not os.path.isdir(old_aip_pres_der_dir_path):
+                    os.makedirs(old_aip_pres_der_dir_path)
+                old_aip_pres_ders[old_aip_pres_der_dir_path] = _index_pres_ders(
+                    old_aip_pres_der_dir_path
                 )
-                shutil.copy2(rein_aip_pres_der_path, old_aip_pres_der_path)
+            # Check for another preservation derivative and delete
+            for old_aip_filename in old_aip_pres_ders[old_aip_pres_der_dir_path].pop(
+                match.groups(), []
+            ):
+                # Don't delete if the 'duplicate' is the original
+                if rein_aip_filename == old_aip_filename:
+                    continue
+                del_path = os.path.join(old_aip_pres_der_dir_path, old_aip_filename)
+                LOGGER.info("Deleting %s", del_path)
+                os.remove(del_path)
+                # Save these paths to delete from uncompressed AIP later
+                removed_pres_der_paths.append(del_path)
+            # Move new preservation derivative
+            LOGGER.info(
+                "Moving %s to %s", rein_aip_pres_der_path, old_aip_pres_der_path
+            )
+            _move_local(rein_aip_pres_der_path, old_aip_pres_der_path)
     return removed_pres_der_paths
 
 
-def _update_bag_payload_and_verify(old_aip_internal_path):
-    """Create a new bag from the AIP at ``old_aip_internal_path`` and validate it."""
+def _index_pres_ders(dir_path):
+    """Return the names of the preservation derivatives in ``dir_path`` as a
+    dict {(name before the UUID, name after the UUID): [names]}."""
+    index = {}
+    for entry in scandir.scandir(dir_path):
+        match = PRESERVATION_DERIVATIVE_REGEX.match(entry.name)
+        if match:
+            index.setdefault(match.groups(), []).append(entry.name)
+    return index
+
+
+def _move_local(src, dst):
+    """Move the file ``src`` to ``dst``, replacing it: rename it if both are
+    on the same filesystem, copy it (with a reflink if possible) otherwise.
+    """
+    try:
+        os.rename(src, dst)
+        return
+    except OSError as err:
+        if err.errno != errno.EXDEV:
+            raise
+    try:
+        fastcopy.copy_file(src, dst)
+    except (fastcopy.FastCopyUnsupported, EnvironmentError) as err:
+        LOGGER.debug("Fast copy of %s failed, using shutil: %s", src, err)
+        shutil.copy2(src, dst)
+    os.remove(src)
+
+
+def _call_in_thread(function, *args):
+    """Call ``function`` in a thread of its own."""
+    try:
+        return function(*args)
+    finally:
+        # Each thread gets its own database connection
+        connection.close()
+
+
+def _get_payload_checksums(bag_path):
+    """Return the checksums recorded in the manifests of the bag at
+    ``bag_path``, with the status of the files they were recorded for, as
+    a dict {path in the bag: ((inode, size, mtime, ctime), checksums)}.
+
+    Any change of a file changes its ctime, so a file with the same status
+    later still has these checksums.
+    """
+    try:
+        bag = bagit.Bag(bag_path)
+    except bagit.BagError:
+        return {}
+    checksums = {}
+    for path, file_checksums in bag.payload_entries().items():
+        try:
+            st = os.stat(os.path.join(bag_path, path))
+        except OSError:
+            continue
+        key = (st.st_ino, st.st_size, st.st_mtime, st.st_ctime)
+        checksums[path] = (key, file_checksums)
+    return checksums
+
+
+def _write_manifests(bag, payload_checksums, processes=1):
+    """Write the payload manifests of ``bag``, reusing the checksums of the
+    files unchanged since ``payload_checksums`` (see
+    ``_get_payload_checksums``) and calculating the others with
+    ``processes`` (see ``_hash_payload_files``).
+
+    :returns: the Payload-Oxum of the bag.
+    """
+    bag_path = bag.path
+    if isinstance(bag_path, six.binary_type):
+        bag_path = bag_path.decode("utf-8")
+    entries = OrderedDict()
+    changed = []
+    total_bytes = 0
+    # Same order as bagit
+    for dirpath, dirnames, filenames in os.walk(os.path.join(bag_path, "data")):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            full_path = os.path.join(dirpath, filename)
+            path = os.path.relpath(full_path, bag_path).replace(os.path.sep, "/")
+            st = os.stat(full_path)
+            total_bytes += st.st_size
+            key = (st.st_ino, st.st_size, st.st_mtime, st.st_ctime)
+            old_key, checksums = payload_checksums.get(path, (None, {}))
+            if old_key == key and all(alg in checksums for alg in bag.algorithms):
+                entries[path] = checksums
+            else:
+                entries[path] = None
+                changed.append(path)
+
+    LOGGER.info(
+        "Calculating the checksums of %s of the %s payload files of %s",
+        len(changed),
+        len(entries),
+        bag_path,
+    )
+    for path, checksums in zip(
+        changed, _hash_payload_files(bag_path, changed, bag.algorithms, processes)
+    ):
+        entries[path] = checksums
+
+    _write_manifest_files(bag_path, bag, entries)
+    return "{}.{}".format(total_bytes, len(entries))
+
+
+def _hash_file(path, algorithms):
+    """Return the checksums of the file at ``path`` as a dict
+    {algorithm: hex digest}, reading it once."""
+    hashers = [hashlib.new(alg) for alg in algorithms]
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(bagit.HASH_BLOCK_SIZE), b""):
+            for hasher in hashers:
+                hasher.update(block)
+    return dict(zip(algorithms, (hasher.hexdigest() for hasher in hashers)))
+
+
+def _hash_bag_entry(entry):
+    """Return the path in its bag and the checksums of the file of the bag
+    manifest ``entry`` (see ``_validate_bag``), with its size. The checksums of
+    a file that can't be read are the error message, as bagit reports them.
+    """
+    path, full_path, algorithms = entry
+    try:
+        return path, _hash_file(full_path, algorithms), os.path.getsize(full_path)
+    except EnvironmentError as err:
+        message = "Could not read {}: {}".format(full_path, err)
+        return path, {alg: message for alg in algorithms}, 0
+
+
+def _validate_bag(bag, processes=1):
+    """Validate ``bag`` like ``bagit.Bag.validate`` with ``processes``
+    processes, but report the progress of the task (see ``common.progress``)
+    after each file, so that it can be cancelled while validating.
+
+    :raises bagit.BagValidationError: if the bag is not valid.
+    :returns: True.
+    """
+    bag.validate(completeness_only=True)
+    entries = [
+        (
+            path,
+            os.path.join(bag.path, bag.normalized_filesystem_names.get(path, path)),
+            [alg for alg in hashes if alg in bag.algorithms],
+        )
+        for path, hashes in bag.entries.items()
+    ]
+    errors = []
+    with closing(
+        utils.imap_in_processes(_hash_bag_entry, entries, processes)
+    ) as results:
+        for path, checksums, size in results:
+            for alg, checksum in checksums.items():
+                expected = bag.entries[path][alg].lower()
+                if checksum != expected:
+                    error = bagit.ChecksumMismatch(path, alg, expected, checksum)
+                    LOGGER.warning(six.text_type(error))
+                    errors.append(error)
+            progress.advance(size)
+    if errors:
+        raise bagit.BagValidationError(_("Bag validation failed"), errors)
+    return True
+
+
+def _hash_payload_files(bag_path, paths, algorithms, processes=1):
+    """Return the checksums (see ``_hash_file``) of the files at ``paths`` in
+    the bag at ``bag_path``, calculated by ``processes`` processes if more
+    than one, by ``settings.REINGEST_MAX_WORKERS`` threads otherwise.
+    """
+    full_paths = [os.path.join(bag_path, path) for path in paths]
+    hash_file = functools.partial(_hash_file, algorithms=algorithms)
+    if processes > 1:
+        return utils.map_in_processes(hash_file, full_paths, processes)
+    return utils.map_concurrently(hash_file, full_paths, settings.REINGEST_MAX_WORKERS)
+
+
+def _write_manifest_files(bag_path, bag, entries):
+    """Write the payload manifests of ``bag`` from ``entries``, a dict
+    {path in the bag: checksums}."""
+    for alg in bag.algorithms:
+        with codecs.open(
+            os.path.join(bag_path, "manifest-{}.txt".format(alg)),
+            "w",
+            encoding=bag.encoding,
+        ) as manifest:
+            for path, checksums in entries.items():
+                manifest.write(
+                    "{}  {}\n".format(
+                        checksums[alg], path.replace("\r", "%0D").replace("\n", "%0A")
+                    )
+                )
+
+
+def _update_bag_files(bag_path, updated_files, old_sizes=None, processes=1):
+    """Replace or add payload files in the bag at ``bag_path`` and update its
+    manifests, Payload-Oxum and tag manifests, hashing these files only.
+
+    The new files and tag files are first written to a temporary directory in
+    the bag, and only moved into place once they are all ready, the tag
+    manifests last: the bag is left untouched if this fails before.
+
+    :param updated_files: dict {path in the bag: path of the new file}.
+    :param old_sizes: dict {path in the bag: size} of the files replaced, if
+        they are not in the bag at ``bag_path`` (e.g. it only holds the tag
+        files of an archived bag). Otherwise they are read from the bag.
+    :param processes: number of processes hashing the files (see
+        ``_hash_payload_files``).
+    """
+    if old_sizes is None:
+        old_sizes = {}
+        for path in updated_files:
+            try:
+                old_sizes[path] = os.path.getsize(os.path.join(bag_path, path))
+            except OSError:
+                pass
+    stage_dir = tempfile.mkdtemp(prefix=".update-", dir=bag_path)
+    try:
+        payload_dir = os.path.join(stage_dir, "payload")
+        for path, source_path in updated_files.items():
+            staged_path = os.path.join(payload_dir, path)
+            if not os.path.isdir(os.path.dirname(staged_path)):
+                os.makedirs(os.path.dirname(staged_path))
+            shutil.copyfile(source_path, staged_path)
+
+        bag = bagit.Bag(bag_path)
+        paths = list(updated_files)
+        checksums = _hash_payload_files(payload_dir, paths, bag.algorithms, processes)
+        entries = bag.payload_entries()
+        added_bytes = added_files = 0
+        for path, file_checksums in zip(paths, checksums):
+            entries[path] = file_checksums
+            added_bytes += os.path.getsize(os.path.join(payload_dir, path))
+            if path in old_sizes:
+                added_bytes -= old_sizes[path]
+            else:
+                added_files += 1
+
+        # Update a copy of the tag files
+        tag_dir = os.path.join(stage_dir, "tags")
+        os.mkdir(tag_dir)
+        for name in os.listdir(bag_path):
+            if name == "data" or os.path.join(bag_path, name) == stage_dir:
+                continue
+            if os.path.isdir(os.path.join(bag_path, name)):
+                shutil.copytree(
+                    os.path.join(bag_path, name), os.path.join(tag_dir, name)
+                )
+            else:
+                shutil.copy2(os.path.join(bag_path, name), tag_dir)
+        tag_bag = bagit.Bag(tag_dir)
+        _write_manifest_files(tag_dir, tag_bag, OrderedDict(sorted(entries.items())))
+        if "Payload-Oxum" in tag_bag.info:
+            oxum_bytes, oxum_files = tag_bag.info["Payload-Oxum"].split(".")
+            tag_bag.info["Payload-Oxum"] = "{}.{}".format(
+                int(oxum_bytes) + added_bytes, int(oxum_files) + added_files
+            )
+        # Write bag-info.txt and the tag manifests
+        tag_bag.save()
+
+        for path in paths:
+            dest_path = os.path.join(bag_path, path)
+            if not os.path.isdir(os.path.dirname(dest_path)):
+                os.makedirs(os.path.dirname(dest_path))
+            os.rename(os.path.join(payload_dir, path), dest_path)
+        tag_files = ["manifest-{}.txt".format(alg) for alg in bag.algorithms]
+        tag_files.append(tag_bag.tag_file_name)
+        tag_files.extend("tagmanifest-{}.txt".format(alg) for alg in bag.algorithms)
+        for name in tag_files:
+            os.rename(os.path.join(tag_dir, name), os.path.join(bag_path, name))
+    finally:
+        shutil.rmtree(stage_dir, ignore_errors=True)
+
+
+def _get_reingested_metadata_files(rein_aip_internal_path, aip_uuid):
+    """Return the METS file and the files of the metadata directory of the
+    reingested AIP at ``rein_aip_internal_path``, i.e. what a metadata-only
+    reingest updates, as a dict {path in the bag: full path}."""
+    files = OrderedDict()
+    mets_path = "data/METS.{}.xml".format(aip_uuid)
+    files[mets_path] = os.path.join(rein_aip_internal_path, mets_path)
+    metadata_dir = os.path.join(rein_aip_internal_path, "data", "objects", "metadata")
+    for dirpath, dirnames, filenames in os.walk(metadata_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            full_path = os.path.join(dirpath, filename)
+            path = os.path.relpath(full_path, rein_aip_internal_path)
+            files[path.replace(os.path.sep, "/")] = full_path
+    return files
+
+
+def _update_bag_payload_and_verify(
+    old_aip_internal_path, payload_checksums=None, processes=1
+):
+    """Create a new bag from the AIP at ``old_aip_internal_path`` and check
+    that it is complete. The checksums of the files unchanged since
+    ``payload_checksums`` were gathered (see ``_get_payload_checksums``) are
+    not calculated again.
+
+    The manifests are written from the checksums just calculated, or recorded
+    for the unchanged files, so only the new and changed files are read. The
+    unchanged files are not checked against their recorded checksums: the bag
+    is only checked to have every file of its manifests and its Payload-Oxum,
+    and corrupted files are left to be found by fixity checks (see
+    ``Package.check_fixity``).
+    """
     # Use BagIt v0.97 to ensure that optional tag manifests are updated too.
     with codecs.open(
         os.path.join(old_aip_internal_path, "bagit.txt"),
@@ -2906,12 +4279,14 @@ def _update_bag_payload_and_verify(old_aip_internal_path):
     ) as bagit_file:
         bagit_file.write("BagIt-Version: 0.97\nTag-File-Character-Encoding: UTF-8\n")
     bag = bagit.Bag(old_aip_internal_path)
-    bag.save(manifests=True)
+    bag.info["Payload-Oxum"] = _write_manifests(bag, payload_checksums or {}, processes)
+    # Write bag-info.txt and the tag manifests
+    bag.save()
     # Workaround for bug
     # https://github.com/LibraryOfCongress/bagit-python/pull/63
     bag = bagit.Bag(old_aip_internal_path)
     # Raises exception in case of problem
-    bag.validate(processes=settings.BAG_VALIDATION_NO_PROCESSES)
+    bag.validate(completeness_only=True)
 
 
 def _replace_old_metdata_with_reingested(rein_aip_internal_path, old_aip_internal_path):
@@ -3000,14 +4375,59 @@ def _get_checksum_report(
 
 def write_pointer_file(pointer_file, pointer_file_path):
     """Write the pointer file to disk. creating intermediate directories as
-    necessary.
-    :param metsrw.METSDocument pointer_file:
+    necessary. The file is replaced atomically: readers see either the old or
+    the new pointer file, never a partly written one.
+    :param pointer_file: ``metsrw.METSDocument`` or lxml tree or element.
     :param str pointer_file_path:
+    :returns: the root element written.
     """
     pointer_dir_path = os.path.dirname(pointer_file_path)
     if not os.path.isdir(pointer_dir_path):
         os.makedirs(pointer_dir_path)
-    pointer_file.write(pointer_file_path, pretty_print=True)
+    if isinstance(pointer_file, metsrw.METSDocument):
+        root = pointer_file.serialize()
+    elif isinstance(pointer_file, etree._ElementTree):
+        root = pointer_file.getroot()
+    else:
+        root = pointer_file
+    temp_path = "{}.{}.tmp".format(pointer_file_path, uuid4())
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(
+                etree.tostring(
+                    root, pretty_print=True, xml_declaration=True, encoding="UTF-8"
+                )
+            )
+        os.rename(temp_path, pointer_file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return root
+
+
+def _file_key(path):
+    """Return what changes when the file at ``path`` is modified, or None if
+    it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime, st.st_ctime)
+
+
+@contextmanager
+def _locked_directory(path):
+    """Hold an exclusive ``flock`` on the directory ``path``, if it exists."""
+    if fcntl is None or not os.path.isdir(path):
+        yield
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
 
 
 def _is_bagit(path):
@@ -0,0 +1,269 @@
+from __future__ import absolute_import
+
+# stdlib, alphabetical
+from collections import OrderedDict
+from datetime import timedelta
+import logging
+import os
+
+# Core Django, alphabetical
+from django.conf import settings
+from django.db import models
+from django.utils import six, timezone
+from django.utils.translation import ugettext_lazy as _
+
+# Third party dependencies, alphabetical
+
+# This project, alphabetical
+from common import utils
+
+# This module, alphabetical
+from .location import Location
+from .package import Package
+from .space import resumable_transfers
+
+__all__ = ("ReplicationTask",)
+
+LOGGER = logging.getLogger(__name__)
+
+
+@six.python_2_unicode_compatible
+class ReplicationTask(models.Model):
+    """Replication of a package to a replicator location, queued to be done
+    in the background.
+
+    Tasks are created by ``enqueue`` when a package is stored and
+    ``settings.REPLICATION_QUEUE_ENABLED`` is set, and processed by the
+    ``process_replication_queue`` management command. A failed task is retried
+    with an exponential backoff, resuming the copy into the replica left behind
+    by the previous attempt.
+    """
+
+    package = models.ForeignKey(
+        "Package", to_field="uuid", related_name="replication_tasks"
+    )
+    location = models.ForeignKey(
+        "Location", to_field="uuid", related_name="replication_tasks"
+    )
+    replica = models.ForeignKey(
+        "Package", to_field="uuid", null=True, blank=True, related_name="+"
+    )
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (PENDING, _("Pending")),
+        (RUNNING, _("Running")),
+        (DONE, _("Done")),
+        (FAILED, _("Failed")),
+    )
+    OUTSTANDING = (PENDING, RUNNING)
+    status = models.CharField(
+        max_length=8,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+        db_index=True,
+        verbose_name=_("Status"),
+    )
+    attempts = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_("Attempts"),
+        help_text=_("Number of times this replication has been attempted."),
+    )
+    last_error = models.TextField(blank=True, verbose_name=_("Last error"))
+    bytes_copied = models.BigIntegerField(
+        default=0,
+        verbose_name=_("Bytes copied"),
+        help_text=_("Bytes of the package found in the replicator location."),
+    )
+
+    created_time = models.DateTimeField(auto_now_add=True)
+    updated_time = models.DateTimeField(auto_now=True)
+    next_attempt_time = models.DateTimeField(default=timezone.now, db_index=True)
+    started_time = models.DateTimeField(null=True, blank=True)
+    completed_time = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = _("Replication task")
+        app_label = "locations"
+
+    def __str__(self):
+        return _("Replication of %(package)s to %(location)s") % {
+            "package": self.package_id,
+            "location": self.location_id,
+        }
+
+    @classmethod
+    def enqueue(cls, package):
+        """Queue the replication of ``package`` to the replicator locations of
+        its current location, unless already queued.
+
+        :returns: list of the new tasks.
+        """
+        queued = set(
+            cls.objects.filter(package=package, status__in=cls.OUTSTANDING).values_list(
+                "location_id", flat=True
+            )
+        )
+        tasks = []
+        for location in package.current_location.replicators.all():
+            if location.uuid in queued:
+                continue
+            tasks.append(cls.objects.create(package=package, location=location))
+            LOGGER.info(
+                "Queued replication of package %s to location %s",
+                package.uuid,
+                location.uuid,
+            )
+        return tasks
+
+    @classmethod
+    def claim(cls):
+        """Mark the pending task that is due first as running and return it,
+        or return None if no task is due.
+
+        The status is changed with a conditional update so that several
+        workers can process the queue at the same time.
+        """
+        while True:
+            now = timezone.now()
+            task = (
+                cls.objects.filter(status=cls.PENDING, next_attempt_time__lte=now)
+                .order_by("next_attempt_time", "pk")
+                .first()
+            )
+            if task is None:
+                return None
+            claimed = cls.objects.filter(pk=task.pk, status=cls.PENDING).update(
+                status=cls.RUNNING,
+                attempts=models.F("attempts") + 1,
+                started_time=now,
+                updated_time=now,
+            )
+            if claimed:
+                return cls.objects.get(pk=task.pk)
+
+    @classmethod
+    def requeue_stale(cls, max_age):
+        """Put back in the queue the tasks that have been running for longer
+        than ``max_age`` seconds, e.g. because their worker was killed.
+
+        :returns: number of tasks requeued.
+        """
+        now = timezone.now()
+        return cls.objects.filter(
+            status=cls.RUNNING, started_time__lte=now - timedelta(seconds=max_age)
+        ).update(status=cls.PENDING, next_attempt_time=now, updated_time=now)
+
+    def run(self):
+        """Replicate the package, resuming the replica of a previous failed
+        attempt if there is one. On failure the task is rescheduled, or marked
+        as failed once ``settings.REPLICATION_MAX_ATTEMPTS`` is reached.
+
+        :returns: True if the replication succeeded.
+        """
+        LOGGER.info("Running %s (attempt %s)", self, self.attempts)
+        try:
+            with resumable_transfers():
+                replica, __ = self.package.replicate(
+                    self.location, replica_package=self._failed_replica()
+                )
+        except Exception as err:
+            self.replica = self._failed_replica()
+            self.bytes_copied = _bytes_at(self.replica)
+            self.last_error = six.text_type(err)
+            if self.attempts >= settings.REPLICATION_MAX_ATTEMPTS:
+                LOGGER.error("%s failed, giving up: %s", self, err)
+                self.status = self.FAILED
+                self.completed_time = timezone.now()
+            else:
+                delay = min(
+                    settings.REPLICATION_RETRY_DELAY * 2 ** (self.attempts - 1),
+                    settings.REPLICATION_RETRY_MAX_DELAY,
+                )
+                LOGGER.warning(
+                    "%s failed, retrying in %s seconds: %s", self, delay, err
+                )
+                self.status = self.PENDING
+                self.next_attempt_time = timezone.now() + timedelta(seconds=delay)
+            self.save()
+            return False
+        self.replica = replica
+        self.bytes_copied = replica.size
+        self.last_error = ""
+        self.status = self.DONE
+        self.completed_time = timezone.now()
+        self.save()
+        return True
+
+    def _failed_replica(self):
+        """Return the most recent failed replica of the package in this
+        task's location, or None."""
+        return (
+            self.package.replicas.filter(
+                current_location=self.location, status=Package.FAIL
+            )
+            .order_by("-pk")
+            .first()
+        )
+
+    @classmethod
+    def lag(cls):
+        """Summarize the outstanding replications of every replicator
+        location.
+
+        :returns: list of dicts with the location UUID, the number of pending,
+            running and failed tasks, the total size in bytes of the packages
+            still to be replicated, the creation time of the oldest outstanding
+            task and its age in seconds.
+        """
+        now = timezone.now()
+        lag = OrderedDict()
+        for location in Location.objects.filter(purpose=Location.REPLICATOR).order_by(
+            "pk"
+        ):
+            lag[location.uuid] = {
+                "location": location.uuid,
+                "pending": 0,
+                "running": 0,
+                "failed": 0,
+                "bytes_pending": 0,
+                "oldest": None,
+                "lag_seconds": 0,
+            }
+        rows = (
+            cls.objects.exclude(status=cls.DONE)
+            .values("location_id", "status")
+            .annotate(
+                count=models.Count("pk"),
+                size=models.Sum("package__size"),
+                oldest=models.Min("created_time"),
+            )
+        )
+        for row in rows:
+            entry = lag.get(row["location_id"])
+            if entry is None:
+                continue
+            entry[row["status"]] = row["count"]
+            if row["status"] not in cls.OUTSTANDING:
+                continue
+            entry["bytes_pending"] += row["size"] or 0
+            if entry["oldest"] is None or row["oldest"] < entry["oldest"]:
+                entry["oldest"] = row["oldest"]
+                entry["lag_seconds"] = int((now - row["oldest"]).total_seconds())
+        return list(lag.values())
+
+
+def _bytes_at(package):
+    """Bytes of ``package`` found at its path, if that is locally accessible."""
+    if package is None:
+        return 0
+    try:
+        path = package.full_path
+        if not os.path.exists(path):
+            return 0
+        return utils.recalculate_size(path)
+    except EnvironmentError:
+        return 0
@@ -0,0 +1,228 @@
+from __future__ import absolute_import
+
+# stdlib, alphabetical
+from contextlib import contextmanager
+import logging
+import os
+import platform
+import time
+
+# Core Django, alphabetical
+from django.conf import settings
+from django.db import models
+from django.db.models import Q
+from django.utils import six
+from django.utils.translation import ugettext_lazy as _
+
+# Third party dependencies, alphabetical
+
+# This project, alphabetical
+from common import progress, utils
+
+# This module, alphabetical
+from . import StorageException
+
+__all__ = ("InsufficientStagingSpace", "StagingReservation")
+
+LOGGER = logging.getLogger(__name__)
+
+# Interval between two checks of the free space by a task waiting for it
+WAIT_POLL_SECONDS = 5
+
+
+class InsufficientStagingSpace(StorageException):
+    """Raised when there is not enough free space to stage a package."""
+
+
+@six.python_2_unicode_compatible
+class StagingReservation(models.Model):
+    """Space reserved in a local filesystem for an operation about to write
+    a copy of a package there, e.g. in the staging directory of a space or in
+    the storage service internal location.
+
+    ``reserve`` admits an operation if the free space of the filesystem, less
+    ``settings.STAGING_FREE_SPACE_MARGIN``, holds its footprint and the
+    footprints of the operations admitted before it, and releases the
+    reservation when the operation is done. The reservations are kept in the
+    database so that every worker sees them; among the waiting operations
+    that fit, the earlier reservation wins, so that concurrent workers don't
+    need to lock. An operation waiting for more space than is free doesn't
+    hold back the later ones that fit. The bytes a running operation already
+    wrote at its path are no longer free, so they are deducted from its
+    footprint. Filesystems are identified by host and device: a filesystem
+    shared by several hosts is accounted for separately by each of them.
+    """
+
+    # Footprint of the operations, as a multiple of the size of the package.
+    # Extracted packages are bigger than compressed ones.
+    FOOTPRINT_MULTIPLIERS = {
+        "staging": 1.0,
+        "fetch": 1.0,
+        "extract": 2.0,
+        "compress": 1.0,
+    }
+
+    filesystem = models.CharField(
+        max_length=300,
+        db_index=True,
+        verbose_name=_("Filesystem"),
+        help_text=_("Host and device ID of the filesystem."),
+    )
+    path = models.TextField(verbose_name=_("Path"))
+    purpose = models.CharField(max_length=64, verbose_name=_("Purpose"))
+    size = models.BigIntegerField(
+        verbose_name=_("Size"), help_text=_("Bytes reserved.")
+    )
+    task = models.IntegerField(
+        null=True,
+        blank=True,
+        verbose_name=_("Task"),
+        help_text=_("ID of the asynchronous task holding the reservation, if any."),
+    )
+    pid = models.IntegerField(verbose_name=_("Process ID"))
+    admitted = models.BooleanField(
+        default=False,
+        verbose_name=_("Admitted"),
+        help_text=_("Whether the operation stopped waiting for the space."),
+    )
+    created_time = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _("Staging reservation")
+        app_label = "locations"
+
+    def __str__(self):
+        return _("%(size)s bytes for %(purpose)s in %(path)s") % {
+            "size": self.size,
+            "purpose": self.purpose,
+            "path": self.path,
+        }
+
+    @classmethod
+    @contextmanager
+    def reserve(cls, path, package_size, purpose, timeout=None):
+        """Reserve space in the filesystem of ``path`` for the block, an
+        operation writing a copy of a package of ``package_size`` bytes at
+        ``path`` (a file or a directory used by this operation only) for
+        ``purpose`` (a key of ``FOOTPRINT_MULTIPLIERS``).
+
+        Wait up to ``timeout`` seconds for the space to be free; by default,
+        ``settings.STAGING_WAIT_TIMEOUT`` in an asynchronous task and not at
+        all elsewhere, e.g. in a request.
+
+        :raises InsufficientStagingSpace: if there is not enough space.
+        """
+        size = int((package_size or 0) * cls.FOOTPRINT_MULTIPLIERS[purpose])
+        if not settings.STAGING_RESERVATIONS_ENABLED or size <= 0:
+            yield
+            return
+        if timeout is None:
+            timeout = settings.STAGING_WAIT_TIMEOUT if progress.current_task() else 0
+        reservation = cls._admit(path, size, purpose, timeout)
+        try:
+            yield
+        finally:
+            reservation.delete()
+
+    @classmethod
+    def _admit(cls, path, size, purpose, timeout):
+        existing = _existing_parent(path)
+        filesystem = "{}:{}".format(platform.node(), os.stat(existing).st_dev)
+        margin = settings.STAGING_FREE_SPACE_MARGIN
+        stats = os.statvfs(existing)
+        if size > stats.f_blocks * stats.f_frsize - margin:
+            raise InsufficientStagingSpace(
+                _("%(size)s bytes will never fit in %(path)s")
+                % {"size": size, "path": path}
+            )
+
+        reservation = cls.objects.create(
+            filesystem=filesystem,
+            path=path,
+            purpose=purpose,
+            size=size,
+            task=progress.current_task(),
+            pid=os.getpid(),
+        )
+        deadline = time.time() + timeout
+        waiting = False
+        try:
+            while True:
+                cls._delete_orphans(filesystem)
+                stats = os.statvfs(existing)
+                free = stats.f_bavail * stats.f_frsize - margin
+                ahead = cls._reserved_ahead(reservation, free)
+                if ahead + size <= free:
+                    reservation.admitted = True
+                    reservation.save(update_fields=["admitted"])
+                    return reservation
+                if time.time() >= deadline:
+                    raise InsufficientStagingSpace(
+                        _(
+                            "Not enough space in %(path)s: %(size)s bytes needed, "
+                            "%(free)s bytes free and %(reserved)s bytes reserved"
+                        )
+                        % {
+                            "path": path,
+                            "size": size,
+                            "free": max(free, 0),
+                            "reserved": ahead,
+                        }
+                    )
+                if not waiting:
+                    LOGGER.info("Waiting for %s bytes in %s", size, path)
+                    progress.stage("waiting_for_space")
+                    waiting = True
+                time.sleep(min(WAIT_POLL_SECONDS, max(deadline - time.time(), 0)))
+                progress.checkpoint()
+        except Exception:
+            reservation.delete()
+            raise
+
+    @classmethod
+    def _reserved_ahead(cls, reservation, free):
+        """Return the bytes reserved ahead of ``reservation`` with ``free``
+        bytes free: those the admitted operations have yet to write, and those
+        of the earlier waiting operations that fit with them, as they are
+        admitted first."""
+        others = (
+            cls.objects.filter(filesystem=reservation.filesystem)
+            .filter(Q(admitted=True) | Q(id__lt=reservation.id))
+            .order_by("-admitted", "id")
+            .values_list("admitted", "size", "path")
+        )
+        reserved = 0
+        for admitted, size, path in others:
+            if admitted:
+                reserved += size - min(_written(path), size)
+            elif reserved + size <= free:
+                reserved += size
+        return reserved
+
+    @classmethod
+    def _delete_orphans(cls, filesystem):
+        """Delete the reservations of the dead processes of this host in
+        ``filesystem``."""
+        pids = set(
+            cls.objects.filter(filesystem=filesystem).values_list("pid", flat=True)
+        )
+        dead = [pid for pid in pids if not utils.process_exists(pid)]
+        if dead:
+            cls.objects.filter(filesystem=filesystem, pid__in=dead).delete()
+
+
+def _written(path):
+    """Return the bytes written at ``path`` so far."""
+    try:
+        return utils.recalculate_size(path)
+    except OSError:
+        # Not written yet, or files removed while the path was measured
+        return 0
+
+
+def _existing_parent(path):
+    """Return ``path`` or its closest parent that exists."""
+    path = os.path.abspath(path)
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return path
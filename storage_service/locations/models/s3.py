@@ -18,10 +18,12 @@ import re
 import scandir
 
 # This project, alphabetical
+from common import progress
 
 # This module, alphabetical
 from . import StorageException
 from .location import Location
+from .space import PosixMoveUnsupportedError, Space
 
 LOGGER = logging.getLogger(__name__)
 
@@ -214,7 +216,9 @@ class S3(models.Model):
             dest_file = objectSummary.key.replace(src_path, dest_path, 1)
             self.space.create_local_directory(dest_file)
             if not os.path.isdir(dest_file):
-                bucket.download_file(objectSummary.key, dest_file)
+                bucket.download_file(
+                    objectSummary.key, dest_file, Callback=progress.callback()
+                )
 
     def move_from_storage_service(self, src_path, dest_path, package=None):
         self._ensure_bucket_exists()
@@ -234,17 +238,68 @@ class S3(models.Model):
                     dest = entry.replace(src_path, dest_path, 1)
 
                     with open(entry, "rb") as data:
-                        bucket.upload_fileobj(data, dest)
+                        bucket.upload_fileobj(data, dest, Callback=progress.callback())
 
         elif os.path.isfile(src_path):
             # strip leading slash on dest_path
             dest_path = dest_path.lstrip("/")
 
             with open(src_path, "rb") as data:
-                bucket.upload_fileobj(data, dest_path)
+                bucket.upload_fileobj(data, dest_path, Callback=progress.callback())
 
         else:
             raise StorageException(
                 _("%(path)s is neither a file nor a directory, may not exist")
                 % {"path": src_path}
             )
+
+    @boto_exception
+    def copy_from_space(self, source_space, src_path, dest_path, package=None):
+        """Copy src_path in source_space to dest_path in this space without
+        staging. Objects in another S3 space behind the same endpoint are
+        copied server-side (large objects using multipart upload_part_copy),
+        files in a local filesystem space are uploaded directly.
+        """
+        if source_space.access_protocol in Space.LOCAL_POSIX:
+            return self.move_from_storage_service(src_path, dest_path, package)
+        if source_space.access_protocol != Space.S3:
+            raise PosixMoveUnsupportedError()
+        source = source_space.get_child_space()
+        if source.endpoint_url != self.endpoint_url:
+            raise PosixMoveUnsupportedError()
+
+        self._ensure_bucket_exists()
+        bucket = self.resource.Bucket(self.bucket_name)
+
+        src_path = src_path.lstrip("/").rstrip(".")
+        dest_path = dest_path.lstrip("/").rstrip(".")
+
+        objects = source.resource.Bucket(source.bucket_name).objects.filter(
+            Prefix=src_path
+        )
+        copied = False
+        for objectSummary in objects:
+            # Listed by prefix, so only the prefix is replaced
+            assert objectSummary.key.startswith(src_path)
+            dest_key = dest_path + objectSummary.key[len(src_path) :]
+            LOGGER.debug(
+                "Copying s3://%s/%s to s3://%s/%s",
+                source.bucket_name,
+                objectSummary.key,
+                self.bucket_name,
+                dest_key,
+            )
+            try:
+                bucket.copy(
+                    {"Bucket": source.bucket_name, "Key": objectSummary.key}, dest_key
+                )
+            except botocore.exceptions.ClientError as err:
+                # E.g. this space's credentials cannot read the source bucket
+                LOGGER.info("Server-side copy failed, using staging: %s", err)
+                raise PosixMoveUnsupportedError()
+            copied = True
+        if not copied:
+            raise StorageException(
+                _("%(path)s is neither a file nor a directory, may not exist")
+                % {"path": src_path}
+            )
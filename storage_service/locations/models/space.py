@@ -1,5 +1,6 @@
 # stdlib, alphabetical
 from __future__ import absolute_import
+from contextlib import contextmanager
 import datetime
 import errno
 import logging
@@ -9,8 +10,10 @@ import shutil
 import stat
 import subprocess
 import tempfile
+import threading
 
 # Core Django, alphabetical
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
@@ -21,7 +24,7 @@ import scandir
 from django_extensions.db.fields import UUIDField
 
 # This project, alphabetical
-from common import utils
+from common import fastcopy, metrics, progress, tracing, utils
 
 LOGGER = logging.getLogger(__name__)
 
@@ -31,6 +34,27 @@ from . import StorageException  # noqa: E402
 __all__ = ("Space", "PosixMoveUnsupportedError")
 
 
+# Directory, relative to the destination, where rsync keeps the files it
+# could not transfer entirely in the blocks of ``resumable_transfers``
+RSYNC_PARTIAL_DIR = ".rsync-partial"
+
+_transfers = threading.local()
+
+
+@contextmanager
+def resumable_transfers():
+    """Keep the files partially transferred by rsync in the block (see
+    ``Space.move_rsync``) in ``RSYNC_PARTIAL_DIR``, so that transferring them
+    again, e.g. when a replication is retried, resumes them. Other transfers
+    leave nothing behind them on failure."""
+    previous = getattr(_transfers, "resumable", False)
+    _transfers.resumable = True
+    try:
+        yield
+    finally:
+        _transfers.resumable = previous
+
+
 def validate_space_path(path):
     """ Validation for path in Space.  Must be absolute. """
     if path[0] != "/":
@@ -150,6 +174,9 @@ class Space(models.Model):
     # These will not be displayed in the Space Create GUI (see locations/forms.py)
     BETA_PROTOCOLS = {}
     OBJECT_STORAGE = {DATAVERSE, DSPACE, DSPACE_REST, DURACLOUD, SWIFT, S3}
+    # Spaces whose path is mounted on the storage service and stores packages
+    # as they are (unlike GPG)
+    LOCAL_POSIX = {LOCAL_FILESYSTEM, NFS}
     ACCESS_PROTOCOL_CHOICES = (
         (ARKIVUM, _("Arkivum")),
         (DATAVERSE, _("Dataverse")),
@@ -194,6 +221,14 @@ class Space(models.Model):
             "Absolute path to a staging area.  Must be UNIX filesystem compatible, preferably on the same filesystem as the path."
         ),
     )
+    bag_validation_processes = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name=_("Bag validation processes"),
+        help_text=_(
+            "Number of processes validating the bags of packages stored in this space, e.g. more for network storage or 1 for a single spinning disk (see the benchmark_bag_validation command). Leave empty to use the default (SS_BAG_VALIDATION_NO_PROCESSES)."
+        ),
+    )
     verified = models.BooleanField(
         default=False,
         verbose_name=_("Verified"),
@@ -225,16 +260,36 @@ class Space(models.Model):
                 raise ValidationError(_("Path is required"))
             validate_space_path(self.path)
 
+    def __init__(self, *args, **kwargs):
+        super(Space, self).__init__(*args, **kwargs)
+        # Protocol-specific space of each thread, cached by get_child_space
+        self._child_spaces = threading.local()
+
+    def save(self, *args, **kwargs):
+        super(Space, self).save(*args, **kwargs)
+        # The protocol may have changed
+        self._child_spaces = threading.local()
+
     def get_child_space(self):
-        """ Returns the protocol-specific space object. """
+        """ Returns the protocol-specific space object.
+
+        It is only queried the first time in each thread, so that the
+        operations on this space in a thread share it and the clients it
+        caches (e.g. S3 or Swift connections), which are not thread-safe,
+        until the space is saved. """
         # Importing PROTOCOL here because importing locations.constants at the
         # top of the file causes a circular dependency
         from ..constants import PROTOCOL
 
         protocol_model = PROTOCOL[self.access_protocol]["model"]
-        protocol_space = protocol_model.objects.get(space=self)
+        child_space = getattr(self._child_spaces, "space", None)
+        if type(child_space) is not protocol_model:
+            child_space = protocol_model.objects.get(space=self)
+            # Share this instance, instead of querying it again
+            child_space.space = self
+            self._child_spaces.space = child_space
         # TODO try-catch AttributeError if remote_user or remote_name not exist?
-        return protocol_space
+        return child_space
 
     def browse(self, path, *args, **kwargs):
         """
@@ -297,11 +352,15 @@ class Space(models.Model):
         except AttributeError:
             return self._delete_path_local(delete_path)
 
+    @tracing.traced("space.posix_move")
     def posix_move(
         self, source_path, destination_path, destination_space, package=None
     ):
         """
         Move self.path/source_path direct to destination_space.path/destination_path bypassing staging.
+
+        If the spaces are not both POSIX filesystems, tries a direct copy (see
+        copy_direct) before raising PosixMoveUnsupportedError.
         """
         if not hasattr(self.get_child_space(), "posix_move") or not hasattr(
             destination_space.get_child_space(), "posix_move"
@@ -311,7 +370,9 @@ class Space(models.Model):
                 type(self.get_child_space()),
                 type(destination_space.get_child_space()),
             )
-            raise PosixMoveUnsupportedError()
+            return self.copy_direct(
+                source_path, destination_path, destination_space, package
+            )
 
         LOGGER.debug("posix_move: source_path: %s", source_path)
         LOGGER.debug("posix_move: destination_path: %s", destination_path)
@@ -324,10 +385,45 @@ class Space(models.Model):
 
         abs_destination_path = os.path.join(destination_space.path, destination_path)
 
+        progress.stage("posix_move", _moved_size(source_path, package))
         return self.get_child_space().posix_move(
             source_path, abs_destination_path, destination_space, package
         )
 
+    def copy_direct(
+        self, source_path, destination_path, destination_space, package=None
+    ):
+        """
+        Copy self.path/source_path to destination_space.path/destination_path without staging.
+
+        Implemented by destination child spaces that can read from this space
+        directly, e.g. server-side copies between S3 buckets or Swift
+        containers, or uploads straight from a local filesystem space. The
+        source is left in place.
+
+        :raises PosixMoveUnsupportedError: if the destination space cannot copy
+            from this space directly; the caller should copy via staging.
+        """
+        destination_child = destination_space.get_child_space()
+        if not hasattr(destination_child, "copy_from_space"):
+            raise PosixMoveUnsupportedError()
+
+        source_path = os.path.join(self.path, source_path)
+        if os.path.isabs(destination_path):
+            destination_path = destination_path.lstrip(os.sep)
+        abs_destination_path = os.path.join(destination_space.path, destination_path)
+
+        LOGGER.debug(
+            "copy_direct: %s (%s) to %s (%s)",
+            source_path,
+            self.access_protocol,
+            abs_destination_path,
+            destination_space.access_protocol,
+        )
+        return destination_child.copy_from_space(
+            self, source_path, abs_destination_path, package
+        )
+
     def move_to_storage_service(
         self, source_path, destination_path, destination_space, *args, **kwargs
     ):
@@ -339,6 +435,9 @@ class Space(models.Model):
         destination_path must be relative and destination_space.staging_path
         MUST be locally accessible to the storage service.
 
+        The optional package keyword argument is the package being moved, whose
+        size is reported instead of measuring the moved files.
+
         This is implemented by the child protocol spaces.
         """
         LOGGER.debug("TO: src: %s", source_path)
@@ -357,17 +456,36 @@ class Space(models.Model):
             destination_space.staging_path, destination_path
         )
 
-        try:
-            self.get_child_space().move_to_storage_service(
-                source_path, destination_path, destination_space, *args, **kwargs
-            )
-        except AttributeError:
-            raise NotImplementedError(
-                _("%(protocol)s space has not implemented %(method)s")
-                % {
-                    "protocol": self.get_access_protocol_display(),
-                    "method": "move_to_storage_service",
-                }
+        package = kwargs.pop("package", None)
+        labels = {
+            "protocol": self.access_protocol,
+            "operation": "move_to_storage_service",
+        }
+        attributes = {
+            "space.protocol": self.access_protocol,
+            "destination.protocol": destination_space.access_protocol,
+        }
+        progress.stage(
+            "move_to_storage_service", _moved_size(source_path, package, missing=None)
+        )
+        with tracing.span("space.move_to_storage_service", attributes), metrics.measure(
+            metrics.space_move_duration, metrics.space_move_errors, **labels
+        ):
+            try:
+                self.get_child_space().move_to_storage_service(
+                    source_path, destination_path, destination_space, *args, **kwargs
+                )
+            except AttributeError:
+                raise NotImplementedError(
+                    _("%(protocol)s space has not implemented %(method)s")
+                    % {
+                        "protocol": self.get_access_protocol_display(),
+                        "method": "move_to_storage_service",
+                    }
+                )
+        if settings.PROMETHEUS_ENABLED:
+            metrics.space_move_bytes.labels(**labels).inc(
+                _moved_size(destination_path, package)()
             )
 
     def post_move_to_storage_service(self, *args, **kwargs):
@@ -425,11 +543,7 @@ class Space(models.Model):
             source_path, destination_path
         )
         child_space = self.get_child_space()
-        if hasattr(child_space, "move_from_storage_service"):
-            return child_space.move_from_storage_service(
-                source_path, destination_path, *args, **kwargs
-            )
-        else:
+        if not hasattr(child_space, "move_from_storage_service"):
             raise NotImplementedError(
                 _("%(protocol)s space has not implemented %(method)s")
                 % {
@@ -437,6 +551,30 @@ class Space(models.Model):
                     "method": "move_from_storage_service",
                 }
             )
+        labels = {
+            "protocol": self.access_protocol,
+            "operation": "move_from_storage_service",
+        }
+        package = kwargs.get("package", args[0] if args else None)
+        size = _moved_size(source_path, package)
+        if settings.PROMETHEUS_ENABLED:
+            # Measure the staged copy before it is moved away
+            size()
+        attributes = {"space.protocol": self.access_protocol}
+        if package is not None and package.size:
+            attributes["bytes"] = package.size
+        progress.stage("move_from_storage_service", size)
+        with tracing.span(
+            "space.move_from_storage_service", attributes
+        ), metrics.measure(
+            metrics.space_move_duration, metrics.space_move_errors, **labels
+        ):
+            result = child_space.move_from_storage_service(
+                source_path, destination_path, *args, **kwargs
+            )
+        if settings.PROMETHEUS_ENABLED:
+            metrics.space_move_bytes.labels(**labels).inc(size())
+        return result
 
     def post_move_from_storage_service(
         self, staging_path, destination_path, package=None, *args, **kwargs
@@ -495,6 +633,22 @@ class Space(models.Model):
             }
             return (None, message)
 
+    def update_packages_status(self, packages, max_workers=1):
+        """
+        Check and update the status of `packages`, all stored in this Space.
+
+        Spaces that can check several packages at once do so, using up to
+        `max_workers` concurrent requests, others check them one by one.
+
+        :returns: dict of (status, error) tuples, by package UUID.
+        """
+        child = self.get_child_space()
+        if hasattr(child, "update_packages_status"):
+            return child.update_packages_status(packages, max_workers=max_workers)
+        return {
+            package.uuid: self.update_package_status(package) for package in packages
+        }
+
     def check_package_fixity(self, package):
         """
         Check and return the fixity status of `package` stored in this space.
@@ -539,6 +693,10 @@ class Space(models.Model):
         If try_mv_local is True, will attempt to use os.rename, which only works on the same device.
         This will not leave a copy at the source.
 
+        If both source and destination are local, a reflink, copy_file_range
+        or sendfile copy is attempted before falling back to rsync (see
+        common.fastcopy).
+
         :param source: Path to source file or directory. May have user@host: at beginning.
         :param destination: Path to destination file or directory. May have user@host: at the beginning.
         :param bool try_mv_local: If true, try moving/renaming instead of copying.  Should be False if source or destination specify a user@host.  Warning: this will not leave a copy at the source.
@@ -576,8 +734,22 @@ class Space(models.Model):
                     dest_norm,
                 )
 
+        if (
+            not assume_rsync_daemon
+            and fastcopy.is_local_path(source)
+            and fastcopy.is_local_path(destination)
+            and os.path.exists(source)
+        ):
+            try:
+                strategies = fastcopy.copy_path(source, destination)
+                LOGGER.info(
+                    "Copied using %s", ", ".join(sorted(strategies)) or "nothing"
+                )
+                return
+            except (fastcopy.FastCopyUnsupported, EnvironmentError) as err:
+                LOGGER.debug("Fast copy failed, falling back to rsync: %s", err)
+
         # Rsync file over
-        # TODO Do this asyncronously, with restarting failed attempts
         command = [
             "rsync",
             "-t",
@@ -589,12 +761,21 @@ class Space(models.Model):
             source,
             destination,
         ]
+        if getattr(_transfers, "resumable", False):
+            # Only remote transfers resume within a file: local ones copy
+            # whole files
+            command.insert(3, "--partial-dir=" + RSYNC_PARTIAL_DIR)
         LOGGER.info("rsync command: %s", command)
-        kwargs = {"stdout": subprocess.PIPE, "stderr": subprocess.STDOUT}
+        # The output goes to a file rather than a pipe so that waiting for
+        # rsync can be interrupted (see progress.wait) without filling it
+        kwargs = {"stderr": subprocess.STDOUT}
         if assume_rsync_daemon:
             kwargs["env"] = {"RSYNC_PASSWORD": rsync_password}
-        p = subprocess.Popen(command, **kwargs)
-        stdout, _ = p.communicate()
+        with tracing.command_span(command), tempfile.TemporaryFile() as output:
+            p = subprocess.Popen(command, stdout=output, **kwargs)
+            progress.wait(p)
+            output.seek(0)
+            stdout = output.read()
         if p.returncode != 0:
             s = "Rsync failed with status {}: {}".format(p.returncode, stdout)
             LOGGER.warning(s)
@@ -676,7 +857,8 @@ class Space(models.Model):
             ]
             LOGGER.info("rsync path creation command: %s", cmd)
             try:
-                subprocess.check_call(cmd)
+                with tracing.command_span(cmd):
+                    subprocess.check_call(cmd)
             except subprocess.CalledProcessError as e:
                 shutil.rmtree(temp_dir)
                 LOGGER.warning("rsync path creation failed: %s", e)
@@ -739,7 +921,8 @@ class Space(models.Model):
             env = os.environ.copy()
             if assume_rsync_daemon:
                 env["RSYNC_PASSWORD"] = rsync_password
-            output = subprocess.check_output(command, env=env)
+            with tracing.command_span(command):
+                output = subprocess.check_output(command, env=env)
         except Exception as error:
             LOGGER.warning("rsync list failed: %s", error, exc_info=True)
             entries = []
@@ -801,6 +984,27 @@ class PosixMoveUnsupportedError(Exception):
     pass
 
 
+def _moved_size(path, package=None, missing=0):
+    """Return a function returning the bytes of ``package`` moved from or to
+    the local ``path``: the recorded size of the package if known, else the
+    size of ``path``, measured once when first asked, or ``missing`` if there
+    is nothing at ``path`` (e.g. the staging path of a remote space)."""
+    sizes = []
+
+    def size():
+        if not sizes:
+            if package is not None and package.size:
+                sizes.append(package.size)
+            else:
+                try:
+                    sizes.append(utils.recalculate_size(path))
+                except OSError:
+                    sizes.append(missing)
+        return sizes[0]
+
+    return size
+
+
 def _scandir_public(path):
     """Generate all directory entries, excluding hidden files.
     """
@@ -18,6 +18,7 @@ from common import utils
 # This module, alphabetical
 from . import StorageException
 from .location import Location
+from .space import PosixMoveUnsupportedError, Space
 
 LOGGER = logging.getLogger(__name__)
 
@@ -243,3 +244,49 @@ class Swift(models.Model):
                 _("%(path)s is neither a file nor a directory, may not exist")
                 % {"path": source_path}
             )
+
+    def copy_from_space(self, source_space, src_path, dest_path, package=None):
+        """Copy src_path in source_space to dest_path in this space without
+        staging. Objects in another Swift space on the same account are
+        copied server-side, files in a local filesystem space are uploaded
+        directly.
+        """
+        if source_space.access_protocol in Space.LOCAL_POSIX:
+            return self.move_from_storage_service(src_path, dest_path, package)
+        if source_space.access_protocol != Space.SWIFT:
+            raise PosixMoveUnsupportedError()
+        source = source_space.get_child_space()
+        if (source.auth_url, source.username, source.tenant) != (
+            self.auth_url,
+            self.username,
+            self.tenant,
+        ):
+            raise PosixMoveUnsupportedError()
+
+        try:
+            self.connection.head_object(source.container, src_path)
+            to_copy = [src_path]
+        except swiftclient.exceptions.ClientException:
+            # Swift only stores objects and fakes having folders, so copy all
+            # items with that prefix.
+            src_path = os.path.join(src_path, "")
+            dest_path = os.path.join(dest_path, "")
+            _, content = self.connection.get_container(
+                source.container, prefix=src_path
+            )
+            to_copy = [x["name"] for x in content if x.get("name")]
+        if not to_copy:
+            raise StorageException(
+                _("%(path)s is neither a file nor a directory, may not exist")
+                % {"path": src_path}
+            )
+        for entry in to_copy:
+            dest = entry.replace(src_path, dest_path, 1)
+            LOGGER.debug(
+                "Copying %s/%s to %s/%s", source.container, entry, self.container, dest
+            )
+            self.connection.copy_object(
+                source.container,
+                entry,
+                destination="/{}/{}".format(self.container, dest),
+            )
@@ -0,0 +1,186 @@
+from __future__ import absolute_import
+
+# stdlib, alphabetical
+from datetime import timedelta
+import logging
+import os
+import platform
+import shutil
+import tempfile
+
+# Core Django, alphabetical
+from django.db import models
+from django.utils import six, timezone
+from django.utils.translation import ugettext_lazy as _
+
+# Third party dependencies, alphabetical
+
+# This project, alphabetical
+from common import metrics, progress, utils
+
+# This module, alphabetical
+from .async import Async  # noqa
+
+__all__ = ("Workspace",)
+
+LOGGER = logging.getLogger(__name__)
+
+
+@six.python_2_unicode_compatible
+class Workspace(models.Model):
+    """Temporary directory holding copies of packages while they are fetched,
+    extracted, compressed or downloaded.
+
+    Workspaces are created by ``create`` and removed by ``remove`` once used,
+    but a failure or a restart can leave them behind, often with gigabytes of
+    data in the storage service internal location. ``sweep`` removes the
+    workspaces of the host that nobody uses any more: those of the
+    asynchronous tasks that are finished or gone and those of the processes
+    that are dead.
+    """
+
+    path = models.TextField(
+        verbose_name=_("Path"), help_text=_("Absolute path of the directory.")
+    )
+    purpose = models.CharField(
+        max_length=64,
+        verbose_name=_("Purpose"),
+        help_text=_("Operation the directory was created for."),
+    )
+    task = models.IntegerField(
+        null=True,
+        blank=True,
+        verbose_name=_("Task"),
+        help_text=_("ID of the asynchronous task using the directory, if any."),
+    )
+    hostname = models.CharField(max_length=255, verbose_name=_("Host"))
+    pid = models.IntegerField(verbose_name=_("Process ID"))
+    size = models.BigIntegerField(
+        null=True,
+        blank=True,
+        verbose_name=_("Size"),
+        help_text=_("Size in bytes of the directory when last swept."),
+    )
+
+    created_time = models.DateTimeField(auto_now_add=True)
+    swept_time = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = _("Workspace")
+        app_label = "locations"
+
+    def __str__(self):
+        return _("%(purpose)s workspace %(path)s") % {
+            "purpose": self.purpose,
+            "path": self.path,
+        }
+
+    @classmethod
+    def create(cls, purpose, dir=None):
+        """Create a temporary directory in ``dir`` (by default, the system
+        temporary directory) for ``purpose``, owned by the current task or
+        process, and return its path."""
+        path = tempfile.mkdtemp(dir=dir)
+        cls.objects.create(
+            path=path,
+            purpose=purpose,
+            task=progress.current_task(),
+            hostname=platform.node(),
+            pid=os.getpid(),
+        )
+        return path
+
+    @classmethod
+    def remove(cls, path):
+        """Delete the temporary directory at ``path`` and its registration."""
+        shutil.rmtree(utils.coerce_str(path), ignore_errors=True)
+        cls.objects.filter(path=path).delete()
+
+    @classmethod
+    def sweep(cls, max_age, dry_run=False):
+        """Delete the abandoned workspaces of this host (see ``is_abandoned``)
+        and record the size of those of this process.
+
+        Every process of the host may be sweeping: each one measures its own
+        workspaces only, and an abandoned workspace is measured and removed
+        by the process that claims it first.
+
+        :param int max_age: seconds after which a workspace that is not used
+            by a task is abandoned, if its process can't be checked.
+        :param bool dry_run: if True, only report the abandoned workspaces.
+        :returns: list of the abandoned workspaces, with their sizes.
+        """
+        now = timezone.now()
+        workspaces = list(cls.objects.filter(hostname=platform.node()))
+        tasks = {
+            task.id: task
+            for task in Async.objects.filter(
+                id__in=[w.task for w in workspaces if w.task is not None]
+            )
+        }
+        abandoned = []
+        total = 0
+        for workspace in workspaces:
+            if not os.path.exists(workspace.path):
+                # Removed without being unregistered
+                if not dry_run:
+                    workspace.delete()
+                continue
+            if not workspace.is_abandoned(tasks.get(workspace.task), max_age, now):
+                if workspace.pid != os.getpid():
+                    continue
+                workspace.size = workspace._measure()
+                total += workspace.size or 0
+                if not dry_run:
+                    cls.objects.filter(pk=workspace.pk).update(
+                        size=workspace.size, swept_time=now
+                    )
+                continue
+            # The process updating the sweep time first removes the workspace
+            if not dry_run and not cls.objects.filter(
+                pk=workspace.pk, swept_time=workspace.swept_time
+            ).update(swept_time=now):
+                continue
+            workspace.size = workspace._measure()
+            abandoned.append(workspace)
+            if dry_run:
+                continue
+            LOGGER.info(
+                "Removing abandoned workspace %s (%s bytes)", workspace, workspace.size
+            )
+            cls.remove(workspace.path)
+            metrics.workspaces_reclaimed.labels(purpose=workspace.purpose).inc()
+            metrics.workspace_reclaimed_bytes.labels(purpose=workspace.purpose).inc(
+                workspace.size or 0
+            )
+        if not dry_run:
+            metrics.workspace_bytes.set(total)
+        return abandoned
+
+    def _measure(self):
+        """Return the size in bytes of this workspace, None if unknown."""
+        try:
+            return utils.recalculate_size(self.path)
+        except OSError:
+            # Files removed while the directory was measured
+            return None
+
+    def is_abandoned(self, task, max_age, now=None):
+        """Return True if this workspace is not used any more.
+
+        :param task: Async model of the task of this workspace, None if it has
+            none or if it was deleted.
+        :param int max_age: seconds after which a workspace that is not used
+            by a task is abandoned, if its process can't be checked.
+        """
+        if self.hostname == platform.node():
+            if not utils.process_exists(self.pid):
+                return True
+            if self.task is None:
+                # Used by its process, e.g. for a request
+                return False
+        if self.task is not None:
+            # Tasks interrupted by a restart are deleted once expired
+            return task is None or task.completed
+        now = now or timezone.now()
+        return self.created_time < now - timedelta(seconds=max_age)
@@ -10,6 +10,7 @@ from django.contrib.auth.models import User
 from django.test import TestCase
 from django.utils.six.moves.urllib.parse import urlparse
 
+from common import utils
 from locations import models
 from locations.api.sword.views import _parse_name_and_content_urls_from_mets_file
 from . import TempDirMixin
@@ -252,6 +253,7 @@ class TestPackageAPI(TempDirMixin, TestCase):
         del self.client.defaults["HTTP_AUTHORIZATION"]
         urls = [
             "/api/v2/file/metadata/",
+            "/api/v2/file/export/",
             "/api/v2/file/e0a41934-c1d7-45ba-9a95-a7531c063ed1/contents/",
             "/api/v2/file/6aebdb24-1b6b-41ab-b4a3-df9a73726a34/download/",
             "/api/v2/file/0d4e739b-bf60-4b87-bc20-67a379b28cea/extract_file/",
@@ -261,6 +263,125 @@ class TestPackageAPI(TempDirMixin, TestCase):
             response = self.client.get(url)
             assert response.status_code == 401
 
+    def test_list_fields(self):
+        response = self.client.get(
+            "/api/v2/file/", {"fields": "uuid,current_path,encrypted"}
+        )
+
+        assert response.status_code == 200
+        objects = json.loads(response.content.decode("utf8"))["objects"]
+        assert objects
+        for package in objects:
+            assert sorted(package) == ["current_path", "encrypted", "uuid"]
+
+    def test_pointer_metadata_fields_are_readonly(self):
+        response = self.client.get("/api/v2/file/schema/")
+
+        assert response.status_code == 200
+        schema = json.loads(response.content.decode("utf8"))["fields"]
+        for field in (
+            "compression",
+            "format_registry_key",
+            "message_digest_algorithm",
+            "message_digest",
+        ):
+            assert schema[field]["readonly"]
+
+    def test_list_filter_by_compression(self):
+        package = models.Package.objects.all()[0]
+        package.compression = utils.COMPRESSION_7Z_BZIP
+        package.save()
+
+        response = self.client.get(
+            "/api/v2/file/",
+            {"compression": utils.COMPRESSION_7Z_BZIP, "fields": "uuid,compression"},
+        )
+
+        assert response.status_code == 200
+        objects = json.loads(response.content.decode("utf8"))["objects"]
+        assert objects == [
+            {"uuid": package.uuid, "compression": utils.COMPRESSION_7Z_BZIP}
+        ]
+
+    def test_list_cursor(self):
+        uuids = list(
+            models.Package.objects.order_by("pk").values_list("uuid", flat=True)
+        )
+
+        response = self.client.get(
+            "/api/v2/file/", {"cursor": 0, "limit": 2, "fields": "uuid"}
+        )
+        assert response.status_code == 200
+        content = json.loads(response.content.decode("utf8"))
+        assert [p["uuid"] for p in content["objects"]] == uuids[:2]
+        assert "total_count" not in content["meta"]
+
+        response = self.client.get(content["meta"]["next"])
+        content = json.loads(response.content.decode("utf8"))
+        assert [p["uuid"] for p in content["objects"]] == uuids[2:4]
+
+        response = self.client.get("/api/v2/file/", {"cursor": "last"})
+        assert response.status_code == 400
+
+    def test_export(self):
+        response = self.client.get(
+            "/api/v2/file/export/", {"package_type": "AIP", "fields": "uuid"}
+        )
+
+        assert response.status_code == 200
+        assert response["Content-Type"] == "application/x-ndjson"
+        lines = b"".join(response.streaming_content).decode("utf8").splitlines()
+        assert [json.loads(line) for line in lines] == [
+            {"uuid": uuid}
+            for uuid in models.Package.objects.filter(package_type="AIP")
+            .order_by("pk")
+            .values_list("uuid", flat=True)
+        ]
+
+    def test_package_progress(self):
+        package = models.Package.objects.filter(origin_pipeline__isnull=False)[0]
+        url = "/api/v2/file/{}/".format(package.uuid)
+        response = self.client.get(url)
+        assert json.loads(response.content.decode("utf8"))["progress"] is None
+
+        task = models.Async.objects.create(
+            package=package,
+            stage="move_from_storage_service",
+            bytes_done=100,
+            bytes_total=300,
+            bytes_per_second=50.0,
+        )
+        progress = {
+            "stage": "move_from_storage_service",
+            "stage_started_time": None,
+            "bytes_done": 100,
+            "bytes_total": 300,
+            "bytes_per_second": 50.0,
+            "eta_seconds": 4.0,
+        }
+
+        response = self.client.get(url)
+        assert json.loads(response.content.decode("utf8"))["progress"] == dict(
+            progress, async_id=task.id
+        )
+        response = self.client.get("/api/v2/async/{}/".format(task.id))
+        assert json.loads(response.content.decode("utf8"))["progress"] == progress
+
+    def test_cancel_async_task(self):
+        task = models.Async.objects.create()
+        url = "/api/v2/async/{}/cancel/".format(task.id)
+
+        response = self.client.post(url)
+        assert response.status_code == 202
+        task.refresh_from_db()
+        assert task.cancel_requested
+
+        models.Async.objects.filter(id=task.id).update(completed=True)
+        response = self.client.post(url)
+        assert response.status_code == 400
+        response = self.client.post("/api/v2/async/{}/cancel/".format(task.id + 1))
+        assert response.status_code == 404
+
     def test_file_data_returns_metadata_given_relative_path(self):
         path = "test_sip/objects/file.txt"
         response = self.client.get("/api/v2/file/metadata/", {"relative_path": path})
@@ -1,9 +1,11 @@
 from __future__ import absolute_import
+import mock
 import os
 import requests
 import shutil
 import vcr
 
+from django.db.models.signals import post_save
 from django.test import TestCase
 
 from locations import models
@@ -176,6 +178,40 @@ class TestArkivum(TempDirMixin, TestCase):
         self.arkivum_object.update_package_status(self.package)
         # Verify what?
 
+    def test_update_packages_status(self):
+        self.package.misc_attributes.update(
+            {"arkivum_identifier": "2e75c8ad-cded-4f7e-8ac7-85627a116e39"}
+        )
+        self.package.save()
+        response = mock.Mock(status_code=200, text="")
+        response.json.return_value = {"fileInformation": {"replicationState": "green"}}
+
+        saved = []
+
+        def package_saved(sender, instance, **kwargs):
+            saved.append(instance.uuid)
+
+        post_save.connect(package_saved, sender=models.Package)
+        try:
+            with mock.patch(
+                "locations.models.arkivum.requests.get", return_value=response
+            ) as get:
+                results = self.arkivum_object.space.update_packages_status(
+                    [self.package], max_workers=4
+                )
+        finally:
+            post_save.disconnect(package_saved, sender=models.Package)
+
+        assert get.call_count == 1
+        assert saved == [self.package.uuid]
+        assert results == {
+            self.package.uuid: (models.Package.UPLOADED, "Replication status: green")
+        }
+        assert (
+            models.Package.objects.get(uuid=self.package.uuid).status
+            == models.Package.UPLOADED
+        )
+
     @vcr.use_cassette(
         os.path.join(
             FIXTURES_DIR,
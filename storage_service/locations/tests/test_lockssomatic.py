@@ -3,6 +3,7 @@ from __future__ import absolute_import
 import os
 
 from django.test import TestCase
+import mock
 import vcr
 
 from locations import models
@@ -27,3 +28,36 @@ class TestLockssomatic(TestCase):
         assert self.lom_object.au_size == 0
         assert self.lom_object.collection_iri is None
         assert self.lom_object.checksum_type is None
+
+    def test_update_packages_status_skips_unchanged_statements(self):
+        location = models.Location.objects.create(
+            space=self.lom_object.space, purpose=models.Location.AIP_STORAGE
+        )
+        package = models.Package.objects.create(
+            current_location=location,
+            current_path="aip.7z",
+            package_type=models.Package.AIP,
+            status=models.Package.STAGING,
+            misc_attributes={
+                "state_iri": "http://localhost:9000/state",
+                "edit_iri": "http://localhost:9000/edit",
+                "state_etag": '"1"',
+            },
+        )
+        self.lom_object.sword_connection = mock.Mock()
+
+        with mock.patch(
+            "locations.models.lockssomatic.requests.get",
+            return_value=mock.Mock(status_code=304),
+        ) as get:
+            results = self.lom_object.update_packages_status([package])
+
+        assert get.call_args[1]["headers"]["If-None-Match"] == '"1"'
+        assert get.call_args[1]["timeout"] == models.lockssomatic.STATEMENT_TIMEOUT
+        assert results[package.uuid] == (
+            models.Package.STAGING,
+            "SWORD statement unchanged since the last poll",
+        )
+        assert models.Package.objects.get(pk=package.pk).status == (
+            models.Package.STAGING
+        )
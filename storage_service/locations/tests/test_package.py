@@ -1,17 +1,23 @@
 from __future__ import absolute_import
+import errno
 import os
 import pytest
 import shutil
+import subprocess
 import tempfile
+import threading
 import vcr
 
 import mock
+from lxml import etree
+import metsrw
+from prometheus_client import REGISTRY
 
 from django.contrib.messages import get_messages
 from django.core.urlresolvers import reverse
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
-from common import utils
+from common import progress, utils
 from locations import models
 
 import bagit
@@ -179,6 +185,42 @@ class TestPackage(TestCase):
         assert message == "Bag validation failed"
         assert timestamp is None
 
+    def test_validate_bag_checksum_mismatch(self):
+        bag_path = os.path.join(self.tmp_dir, "working_bag")
+        shutil.copytree(os.path.join(FIXTURES_DIR, "working_bag"), bag_path)
+        test_path = os.path.join(bag_path, "data", "test.txt")
+        with open(test_path) as f:
+            content = f.read()
+        with open(test_path, "w") as f:
+            f.write(content.upper())
+
+        with pytest.raises(bagit.BagValidationError) as excinfo:
+            models.package._validate_bag(bagit.Bag(bag_path), processes=2)
+
+        assert [(e.path, e.algorithm) for e in excinfo.value.details] == [
+            ("data/test.txt", "md5")
+        ]
+
+    def test_validate_bag_can_be_cancelled(self):
+        bag_path = os.path.join(self.tmp_dir, "working_bag")
+        shutil.copytree(os.path.join(FIXTURES_DIR, "working_bag"), bag_path)
+        cancelled = threading.Event()
+        hashed = []
+        hash_bag_entry_ = models.package._hash_bag_entry
+
+        def hash_bag_entry(entry):
+            hashed.append(entry[0])
+            cancelled.set()
+            return hash_bag_entry_(entry)
+
+        with mock.patch.object(
+            models.package, "_hash_bag_entry", side_effect=hash_bag_entry
+        ), progress.tracking(lambda fields: None, cancelled=cancelled, task_id=1):
+            with pytest.raises(progress.TaskCancelled):
+                models.package._validate_bag(bagit.Bag(bag_path))
+
+        assert len(hashed) == 1
+
     def test_fixity_package_type(self):
         """ It should only fixity bags. """
         package = models.Package.objects.get(
@@ -287,6 +329,474 @@ class TestPackage(TestCase):
         assert message == ""
         assert timestamp is None
 
+    def test_is_compressed_uses_recorded_shape(self):
+        package = models.Package.objects.get(
+            uuid="0d4e739b-bf60-4b87-bc20-67a379b28cea"
+        )
+        package.compressed = True
+        package.base_directory = "recorded"
+        with mock.patch.object(models.Package, "fetch_local_path") as fetch:
+            assert package.is_compressed
+            assert package.get_base_directory() == "recorded"
+        assert not fetch.called
+
+    def test_is_compressed_records_shape(self):
+        package = models.Package.objects.get(
+            uuid="0d4e739b-bf60-4b87-bc20-67a379b28cea"
+        )
+        assert package.compressed is None
+
+        assert not package.is_compressed
+        assert package.get_base_directory() == "working_bag"
+
+        package = models.Package.objects.get(pk=package.pk)
+        assert package.compressed is False
+        assert package.base_directory == "working_bag"
+
+    def test_record_shape_of_tar_archives(self):
+        package = models.Package.objects.get(
+            uuid="0d4e739b-bf60-4b87-bc20-67a379b28cea"
+        )
+        for option, extension, compression in (
+            ("-z", ".tar.gz", utils.COMPRESSION_TAR_GZIP),
+            ("-j", ".tar.bz2", utils.COMPRESSION_TAR_BZIP2),
+            ("--use-compress-program=zstd", ".tar.zst", utils.COMPRESSION_TAR_ZSTD),
+        ):
+            archive_path = os.path.join(self.tmp_dir, "working_bag" + extension)
+            subprocess.check_call(
+                ["tar", "cf", archive_path, option, "-C", FIXTURES_DIR, "working_bag"]
+            )
+
+            package._record_shape(archive_path, package.current_location.space)
+
+            assert package.compressed is True
+            assert package.compression == compression
+            assert package.base_directory == "working_bag"
+
+    def test_backfill_shape(self):
+        package = models.Package.objects.get(
+            uuid="0d4e739b-bf60-4b87-bc20-67a379b28cea"
+        )
+
+        assert package.backfill_shape()
+
+        package = models.Package.objects.get(pk=package.pk)
+        assert package.compressed is False
+        assert package.compression == ""
+        assert package.base_directory == "working_bag"
+        assert package.encrypted is False
+
+    def test_backfill_shape_requires_fetch(self):
+        package = models.Package.objects.get(
+            uuid="e0a41934-c1d7-45ba-9a95-a7531c063ed1"
+        )
+        with mock.patch.object(models.Package, "fetch_local_path") as fetch:
+            assert not package.backfill_shape()
+        assert not fetch.called
+        assert models.Package.objects.get(pk=package.pk).compressed is None
+
+    @override_settings(PACKAGE_CACHE_SIZE=100)
+    def test_fetch_local_path_uses_package_cache(self):
+        models.Location.objects.filter(purpose="SS").update(
+            relative_path=self.tmp_dir[1:]
+        )
+
+        def fetch(package, ss_internal, int_path):
+            with open(int_path, "w") as f:
+                f.write("package")
+
+        paths = []
+        with mock.patch.object(
+            models.Package, "_fetch_to_internal", side_effect=fetch, autospec=True
+        ) as fetch_to_internal:
+            for __ in range(2):
+                package = models.Package.objects.get(
+                    uuid="e0a41934-c1d7-45ba-9a95-a7531c063ed1"
+                )
+                package.size = 7
+                package.current_path = "images-transfer.7z"
+                paths.append(package.fetch_local_path())
+                package.remove_local_copy(paths[-1])
+
+        assert fetch_to_internal.call_count == 1
+        assert paths[0] == paths[1]
+        assert paths[0].startswith(
+            os.path.join(self.tmp_dir, models.package.PACKAGE_CACHE_DIRECTORY)
+        )
+        assert os.path.exists(paths[0])
+
+    @override_settings(PACKAGE_CACHE_SIZE=100)
+    def test_copy_from_package_cache(self):
+        models.Location.objects.filter(purpose="SS").update(
+            relative_path=self.tmp_dir[1:]
+        )
+
+        def fetch(package, ss_internal, int_path):
+            os.makedirs(int_path)
+            with open(os.path.join(int_path, "file"), "w") as f:
+                f.write("package")
+
+        package = models.Package.objects.get(
+            uuid="e0a41934-c1d7-45ba-9a95-a7531c063ed1"
+        )
+        package.size = 7
+        package.current_path = "images-transfer"
+        with mock.patch.object(
+            models.Package, "_fetch_to_internal", side_effect=fetch, autospec=True
+        ):
+            cached_path = package.fetch_local_path()
+        temp_dir = package._copy_from_cache(cached_path)
+
+        assert package._cache_pin is None
+        assert package.local_path == os.path.join(temp_dir, "images-transfer")
+        assert os.path.isfile(os.path.join(package.local_path, "file"))
+        package.remove_local_copy(package.local_path)
+        assert not os.path.exists(temp_dir)
+        assert os.path.isfile(os.path.join(cached_path, "file"))
+
+    @override_settings(PACKAGE_CACHE_SIZE=100)
+    def test_is_compressed_releases_package_cache_copy(self):
+        models.Location.objects.filter(purpose="SS").update(
+            relative_path=self.tmp_dir[1:]
+        )
+
+        def fetch(package, ss_internal, int_path):
+            with open(int_path, "w") as f:
+                f.write("package")
+
+        package = models.Package.objects.get(
+            uuid="e0a41934-c1d7-45ba-9a95-a7531c063ed1"
+        )
+        package.size = 7
+        package.current_path = "images-transfer.7z"
+        package.compressed = None
+        with mock.patch.object(
+            models.Package, "_fetch_to_internal", side_effect=fetch, autospec=True
+        ):
+            assert package.is_compressed
+
+        assert package._cache_pin is None
+        assert package.local_path is None
+
+    def _package_with_pointer_copy(self):
+        """Return a package whose pointer file is a copy in ``self.tmp_dir``."""
+        models.Location.objects.filter(purpose="SS").update(
+            relative_path=self.tmp_dir[1:]
+        )
+        package = models.Package.objects.get(
+            uuid="c0f8498f-b92e-4a8b-8941-1b34ba062ed8"
+        )
+        package.pointer_file_path = "pointer.xml"
+        shutil.copy(
+            os.path.join(
+                FIXTURES_DIR, "pointer.c0f8498f-b92e-4a8b-8941-1b34ba062ed8.xml"
+            ),
+            package.full_pointer_file_path,
+        )
+        return package
+
+    def test_pointer_file_is_parsed_once(self):
+        package = self._package_with_pointer_copy()
+
+        with mock.patch(
+            "locations.models.package.etree.parse", wraps=etree.parse
+        ) as parse:
+            tree = package._pointer_tree()
+            mets = package._get_pointer_document()
+            assert package._pointer_tree() is tree
+            assert package._get_pointer_document() is mets
+            # Callers get a copy they can modify
+            tree_copy = package.get_pointer_tree()
+            assert tree_copy is not tree
+            assert etree.tostring(tree_copy) == etree.tostring(tree)
+            package.save_pointer_file(mets)
+            saved_mets = package._get_pointer_document()
+
+        assert parse.call_count == 1
+        assert saved_mets is not mets
+        assert saved_mets.get_file(type="Archival Information Package").path == (
+            mets.get_file(type="Archival Information Package").path
+        )
+        assert os.listdir(self.tmp_dir) == ["pointer.xml"]
+
+    def test_record_pointer_metadata(self):
+        package = self._package_with_pointer_copy()
+
+        package.record_pointer_metadata()
+
+        package = models.Package.objects.get(uuid=package.uuid)
+        assert package.compression == utils.COMPRESSION_7Z_BZIP
+        assert package.format_registry_key == "fmt/484"
+        assert package.message_digest_algorithm == "sha256"
+        assert package.message_digest == (
+            "da327de1fd6e7a5ec3a69a282a01d0e08deb9ee3ccc3d00984e31d013d135f6c"
+        )
+        assert package.composition_level == 1
+        assert package.inhibitor_type == ""
+        assert models.Package.objects.filter(
+            current_location=package.current_location,
+            compression=utils.COMPRESSION_7Z_BZIP,
+        ).exists()
+
+    def test_pointer_file_is_parsed_again_when_modified(self):
+        package = self._package_with_pointer_copy()
+        tree = package._pointer_tree()
+
+        models.package.write_pointer_file(
+            etree.parse(package.full_pointer_file_path), package.full_pointer_file_path
+        )
+
+        assert package._pointer_tree() is not tree
+
+    def test_updating_pointer_file_is_written_once_done(self):
+        package = self._package_with_pointer_copy()
+
+        with package.updating_pointer_file() as mets:
+            mets.get_file(type="Archival Information Package").path = "new/path.7z"
+
+        mets = metsrw.METSDocument.fromfile(package.full_pointer_file_path)
+        assert mets.get_file(type="Archival Information Package").path == "new/path.7z"
+
+    def test_updating_pointer_file_is_discarded_on_error(self):
+        package = self._package_with_pointer_copy()
+        with open(package.full_pointer_file_path) as f:
+            pointer = f.read()
+
+        with pytest.raises(ValueError):
+            with package.updating_pointer_file() as mets:
+                mets.get_file(type="Archival Information Package").path = "new/path.7z"
+                raise ValueError()
+
+        with open(package.full_pointer_file_path) as f:
+            assert f.read() == pointer
+        mets = package._get_pointer_document()
+        assert mets.get_file(type="Archival Information Package").path != "new/path.7z"
+
+    def test_update_bag_payload_only_hashes_changed_files(self):
+        bag_path = os.path.join(self.tmp_dir, "aip")
+        os.makedirs(os.path.join(bag_path, "objects"))
+        for name in ("unchanged.txt", "changed.txt", "removed.txt"):
+            with open(os.path.join(bag_path, "objects", name), "w") as f:
+                f.write(name)
+        bagit.make_bag(bag_path, checksums=["sha256"])
+        payload_checksums = models.package._get_payload_checksums(bag_path)
+        with open(os.path.join(bag_path, "data", "objects", "changed.txt"), "w") as f:
+            f.write("new content")
+        os.remove(os.path.join(bag_path, "data", "objects", "removed.txt"))
+        with open(os.path.join(bag_path, "data", "objects", "added.txt"), "w") as f:
+            f.write("added")
+
+        with mock.patch(
+            "locations.models.package._hash_payload_files",
+            wraps=models.package._hash_payload_files,
+        ) as hash_payload_files:
+            models.package._update_bag_payload_and_verify(bag_path, payload_checksums)
+
+        assert hash_payload_files.call_args[0][1] == [
+            "data/objects/added.txt",
+            "data/objects/changed.txt",
+        ]
+        bag = bagit.Bag(bag_path)
+        assert sorted(bag.payload_entries()) == [
+            "data/objects/added.txt",
+            "data/objects/changed.txt",
+            "data/objects/unchanged.txt",
+        ]
+        assert bag.info["Payload-Oxum"] == "29.3"
+        bag.validate()
+
+    def test_update_bag_payload_hashes_in_processes(self):
+        bag_path = os.path.join(self.tmp_dir, "aip")
+        os.makedirs(bag_path)
+        for name in ("a.txt", "b.txt"):
+            with open(os.path.join(bag_path, name), "w") as f:
+                f.write(name)
+        bagit.make_bag(bag_path, checksums=["md5", "sha256"])
+
+        with mock.patch(
+            "locations.models.package.utils.map_in_processes",
+            wraps=utils.map_in_processes,
+        ) as map_in_processes:
+            models.package._update_bag_payload_and_verify(bag_path, processes=2)
+
+        assert map_in_processes.call_count == 1
+        bagit.Bag(bag_path).validate()
+
+    def test_update_bag_files_only_hashes_reingested_metadata(self):
+        aip_uuid = "00000000-0000-0000-0000-000000000000"
+        bag_path = os.path.join(self.tmp_dir, "aip")
+        rein_path = os.path.join(self.tmp_dir, "rein")
+        for path, content in (
+            (os.path.join(bag_path, "METS.{}.xml".format(aip_uuid)), "mets"),
+            (os.path.join(bag_path, "objects", "object.txt"), "object"),
+            (os.path.join(bag_path, "objects", "metadata", "old.csv"), "old"),
+            (os.path.join(rein_path, "data", "METS.{}.xml".format(aip_uuid)), "new"),
+            (
+                os.path.join(rein_path, "data", "objects", "metadata", "new.csv"),
+                "added",
+            ),
+        ):
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, "w") as f:
+                f.write(content)
+        bagit.make_bag(bag_path, checksums=["sha256"])
+        updated_files = models.package._get_reingested_metadata_files(
+            rein_path, aip_uuid
+        )
+
+        with mock.patch(
+            "locations.models.package._hash_payload_files",
+            wraps=models.package._hash_payload_files,
+        ) as hash_payload_files:
+            models.package._update_bag_files(bag_path, updated_files)
+
+        assert hash_payload_files.call_args[0][1] == [
+            "data/METS.{}.xml".format(aip_uuid),
+            "data/objects/metadata/new.csv",
+        ]
+        bag = bagit.Bag(bag_path)
+        assert sorted(bag.payload_entries()) == [
+            "data/METS.{}.xml".format(aip_uuid),
+            "data/objects/metadata/new.csv",
+            "data/objects/metadata/old.csv",
+            "data/objects/object.txt",
+        ]
+        assert bag.info["Payload-Oxum"] == "17.4"
+        bag.validate()
+
+    @override_settings(REINGEST_MAX_WORKERS=2)
+    def test_finish_reingest_fetches_while_extracting(self):
+        space = models.Space.objects.create(
+            access_protocol=models.Space.LOCAL_FILESYSTEM,
+            path="/",
+            staging_path=tempfile.mkdtemp(dir=self.tmp_dir),
+        )
+        models.Location.objects.filter(purpose="SS").update(
+            space=space, relative_path=tempfile.mkdtemp(dir=self.tmp_dir)[1:]
+        )
+        aip_storage, currently_processing = [
+            models.Location.objects.create(
+                space=space,
+                relative_path=tempfile.mkdtemp(dir=self.tmp_dir)[1:],
+                purpose=purpose,
+            )
+            for purpose in (
+                models.Location.AIP_STORAGE,
+                models.Location.CURRENTLY_PROCESSING,
+            )
+        ]
+        pipeline = models.Pipeline.objects.create()
+        aip = models.Package.objects.create(
+            current_location=aip_storage,
+            current_path="aip",
+            package_type=models.Package.AIP,
+            origin_pipeline=pipeline,
+            status=models.Package.UPLOADED,
+            misc_attributes={
+                "reingest_pipeline": pipeline.uuid,
+                "reingest_type": models.Package.FULL,
+            },
+        )
+        mets_path = os.path.join("data", "METS.{}.xml".format(aip.uuid))
+        for bag_path, mets in (
+            (aip.full_path, "old"),
+            (os.path.join(currently_processing.full_path, "aip"), "new"),
+        ):
+            os.makedirs(os.path.join(bag_path, "objects"))
+            with open(os.path.join(bag_path, "objects", "object.txt"), "w") as f:
+                f.write("object")
+            with open(os.path.join(bag_path, os.path.basename(mets_path)), "w") as f:
+                f.write(mets)
+            bagit.make_bag(bag_path, checksums=["sha256"])
+
+        # The fetching thread would not see the test transaction
+        with mock.patch.object(
+            models.Space,
+            "get_child_space",
+            lambda space: models.LocalFilesystem(space=space),
+        ):
+            aip.finish_reingest(currently_processing, "aip/", aip_storage, "aip")
+
+        aip = models.Package.objects.get(uuid=aip.uuid)
+        assert set(aip.misc_attributes["reingest_timings"]) >= {"fetch", "extract"}
+        with open(os.path.join(aip.full_path, mets_path)) as f:
+            assert f.read() == "new"
+        bagit.Bag(aip.full_path).validate()
+
+    def test_update_bag_files_leaves_bag_untouched_on_failure(self):
+        bag_path = os.path.join(self.tmp_dir, "aip")
+        os.makedirs(bag_path)
+        with open(os.path.join(bag_path, "METS.xml"), "w") as f:
+            f.write("mets")
+        bagit.make_bag(bag_path, checksums=["sha256"])
+        new_mets = os.path.join(self.tmp_dir, "METS.xml")
+        with open(new_mets, "w") as f:
+            f.write("new")
+        before = sorted(os.listdir(bag_path))
+
+        with mock.patch.object(
+            bagit.Bag, "save", side_effect=bagit.BagError("No space left")
+        ), pytest.raises(bagit.BagError):
+            models.package._update_bag_files(bag_path, {"data/METS.xml": new_mets})
+
+        assert sorted(os.listdir(bag_path)) == before
+        with open(os.path.join(bag_path, "data", "METS.xml")) as f:
+            assert f.read() == "mets"
+        bagit.Bag(bag_path).validate()
+
+    def test_replace_old_pres_ders_with_reingested(self):
+        old_uuid = "11111111-1111-1111-1111-111111111111"
+        new_uuid = "22222222-2222-2222-2222-222222222222"
+        old_objects = os.path.join(self.tmp_dir, "old", "data", "objects")
+        rein_objects = os.path.join(self.tmp_dir, "rein", "data", "objects")
+        for path in (
+            os.path.join(old_objects, "img.png"),
+            os.path.join(old_objects, "img-{}.tif".format(old_uuid)),
+            os.path.join(old_objects, "doc-{}.pdf".format(old_uuid)),
+            os.path.join(rein_objects, "img-{}.tif".format(new_uuid)),
+            os.path.join(rein_objects, "sub", "new-{}.tif".format(new_uuid)),
+        ):
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, "w") as f:
+                f.write(os.path.basename(path))
+
+        removed = models.package._replace_old_pres_ders_with_reingested(
+            os.path.join(self.tmp_dir, "rein"), os.path.join(self.tmp_dir, "old")
+        )
+
+        assert removed == [os.path.join(old_objects, "img-{}.tif".format(old_uuid))]
+        assert sorted(os.listdir(old_objects)) == [
+            "doc-{}.pdf".format(old_uuid),
+            "img-{}.tif".format(new_uuid),
+            "img.png",
+            "sub",
+        ]
+        assert os.listdir(os.path.join(old_objects, "sub")) == [
+            "new-{}.tif".format(new_uuid)
+        ]
+        assert not os.path.exists(
+            os.path.join(rein_objects, "img-{}.tif".format(new_uuid))
+        )
+
+    def test_move_local_copies_across_filesystems(self):
+        src = os.path.join(self.tmp_dir, "src.txt")
+        dst = os.path.join(self.tmp_dir, "dst.txt")
+        for path in (src, dst):
+            with open(path, "w") as f:
+                f.write(os.path.basename(path))
+
+        with mock.patch(
+            "locations.models.package.os.rename",
+            side_effect=OSError(errno.EXDEV, "Invalid cross-device link"),
+        ):
+            models.package._move_local(src, dst)
+
+        assert not os.path.exists(src)
+        with open(dst) as f:
+            assert f.read() == "src.txt"
+
     def test_extract_file_aip_from_uncompressed_aip(self):
         """ It should return an aip """
         package = models.Package.objects.get(
@@ -297,6 +807,26 @@ class TestPackage(TestCase):
         assert output_path == os.path.join(self.tmp_dir, basedir)
         assert os.path.join(output_path, "manifest-md5.txt")
 
+    def test_extract_file_records_metrics(self):
+        package = models.Package.objects.get(
+            uuid="0d4e739b-bf60-4b87-bc20-67a379b28cea"
+        )
+        labels = {
+            "protocol": package.current_location.space.access_protocol,
+            "operation": "extract_file",
+        }
+
+        def sample(name):
+            return REGISTRY.get_sample_value(name, labels) or 0
+
+        count = sample("ss_package_operation_duration_seconds_count")
+        size = sample("ss_package_operation_bytes_total")
+
+        package.extract_file(extract_path=self.tmp_dir)
+
+        assert sample("ss_package_operation_duration_seconds_count") == count + 1
+        assert sample("ss_package_operation_bytes_total") == size + package.size
+
     def test_extract_file_file_from_uncompressed_aip(self):
         """ It should return a single file from an uncompressed aip """
         package = models.Package.objects.get(
@@ -309,6 +839,18 @@ class TestPackage(TestCase):
         assert output_path == os.path.join(self.tmp_dir, basedir, "manifest-md5.txt")
         assert os.path.isfile(output_path)
 
+    def test_extract_file_payload_file_from_uncompressed_aip(self):
+        """ It should create the directories of the file it extracts """
+        package = models.Package.objects.get(
+            uuid="0d4e739b-bf60-4b87-bc20-67a379b28cea"
+        )
+        basedir = package.get_base_directory()
+        output_path, extract_path = package.extract_file(
+            relative_path="working_bag/data/test.txt", extract_path=self.tmp_dir
+        )
+        assert output_path == os.path.join(self.tmp_dir, basedir, "data", "test.txt")
+        assert os.path.isfile(output_path)
+
     def test_extract_file_file_from_compressed_aip(self):
         """ It should return a single file from a 7zip compressed aip """
         package = models.Package.objects.get(
@@ -343,6 +885,42 @@ class TestPackage(TestCase):
         assert output_path == os.path.join(self.tmp_dir, basedir)
         assert os.path.join(output_path, "manifest-md5.txt")
 
+    def test_extract_file_from_zstd_aip(self):
+        subprocess.check_call(
+            [
+                "tar",
+                "cf",
+                os.path.join(self.tmp_dir, "working_bag.tar.zst"),
+                "--use-compress-program=zstd",
+                "-C",
+                FIXTURES_DIR,
+                "working_bag",
+            ]
+        )
+        package = models.Package.objects.get(
+            uuid="88deec53-c7dc-4828-865c-7356386e9399"
+        )
+        package.current_location.relative_path = self.tmp_dir[1:]
+        package.current_path = "working_bag.tar.zst"
+        package.compressed = True
+        package.compression = utils.COMPRESSION_TAR_ZSTD
+        package.base_directory = ""
+
+        assert package.get_base_directory() == "working_bag"
+        output_path, extract_path = package.extract_file(
+            "working_bag/data/test.txt", extract_path=self.tmp_dir
+        )
+        assert output_path == os.path.join(
+            self.tmp_dir, "working_bag", "data", "test.txt"
+        )
+        assert os.path.isfile(output_path)
+        shutil.rmtree(os.path.join(self.tmp_dir, "working_bag"))
+        output_path, extract_path = package.extract_file(extract_path=self.tmp_dir)
+        assert output_path == os.path.join(self.tmp_dir, "working_bag")
+        assert os.path.isfile(os.path.join(output_path, "manifest-md5.txt"))
+        package.local_path = None
+        assert package.check_fixity()[0]
+
     def test_run_post_store_callbacks_aip(self):
         uuid = "473a9398-0024-4804-81da-38946040c8af"
         aip = models.Package.objects.get(uuid=uuid)
@@ -491,6 +1069,108 @@ class TestPackage(TestCase):
         assert mock_encrypt.call_args_list == [mock.call(replica.full_path, u"")]
         self._test_bagit_structure(replica, replication_dir)
 
+    def test_update_quotas_concurrently(self):
+        aip = models.Package.objects.get(uuid="0d4e739b-bf60-4b87-bc20-67a379b28cea")
+        used = aip.current_location.space.used
+        # Two replications to the same location, loaded at the same time
+        locations = [
+            models.Location.objects.get(pk=aip.current_location.pk) for _ in range(2)
+        ]
+        for location, size in zip(locations, (10, 20)):
+            models.Package(size=size)._update_quotas(location.space, location)
+
+        location = models.Location.objects.get(pk=aip.current_location.pk)
+        assert location.space.used == used + 30
+        assert location.used == 30
+
+    def test_store_aip_then_replicate(self):
+        space = models.Space.objects.create(
+            access_protocol=models.Space.LOCAL_FILESYSTEM,
+            path="/",
+            staging_path=tempfile.mkdtemp(dir=self.tmp_dir),
+        )
+        models.LocalFilesystem.objects.create(space=space)
+        origin = models.Location.objects.create(
+            space=space,
+            relative_path=tempfile.mkdtemp(dir=self.tmp_dir)[1:],
+            purpose=models.Location.AIP_STORAGE,
+        )
+        shutil.copytree(
+            os.path.join(FIXTURES_DIR, "working_bag"),
+            os.path.join(origin.full_path, "working_bag"),
+        )
+        aip_storage = models.Location.objects.create(
+            space=space,
+            relative_path=tempfile.mkdtemp(dir=self.tmp_dir)[1:],
+            purpose=models.Location.AIP_STORAGE,
+        )
+        aip = models.Package.objects.create(
+            current_location=aip_storage,
+            current_path="working_bag",
+            package_type=models.Package.AIP,
+            size=utils.recalculate_size(os.path.join(origin.full_path, "working_bag")),
+            status=models.Package.STAGING,
+        )
+        aip.store_aip(origin, "working_bag")
+        replicator = aip_storage.replicators.create(
+            space=space,
+            relative_path=tempfile.mkdtemp(dir=self.tmp_dir)[1:],
+            purpose=models.Location.REPLICATOR,
+        )
+        # The protocol-specific space may hold objects that can't be copied,
+        # like the connections of S3 or Swift spaces
+        aip.current_location.space.get_child_space().connection = threading.Lock()
+
+        aip.create_replicas()
+
+        assert aip.status == models.Package.UPLOADED
+        replica = aip.replicas.get()
+        assert replica.uuid != aip.uuid
+        assert replica.current_location == replicator
+        assert os.path.isfile(os.path.join(replica.full_path, "data", "test.txt"))
+
+    @override_settings(REPLICATION_MAX_WORKERS=3)
+    def test_create_replicas_concurrently(self):
+        aip = models.Package.objects.get(uuid="0d4e739b-bf60-4b87-bc20-67a379b28cea")
+        replicators = [
+            aip.current_location.replicators.create(
+                space=aip.current_location.space,
+                relative_path=tempfile.mkdtemp(dir=self.tmp_dir),
+                purpose=models.Location.REPLICATOR,
+            )
+            for _ in range(3)
+        ]
+        source = models.package.ReplicationSource(
+            aip.full_path, None, "sha256", "abc", "abc"
+        )
+
+        def replicate(package, replicator_location, replication_source):
+            assert replication_source is source
+            # Each thread replicates its own instance of the AIP
+            assert package is not aip
+            assert package.current_location is not aip.current_location
+            if replicator_location == replicators[1]:
+                raise models.StorageException("Replicator is down")
+            index = replicators.index(replicator_location)
+            return mock.Mock(pk=index), "event-{}".format(index)
+
+        with mock.patch.object(
+            models.Package, "_get_replication_source", return_value=source
+        ) as get_source, mock.patch.object(
+            models.Package, "replicate", side_effect=replicate, autospec=True
+        ) as replicate_mock, mock.patch.object(
+            models.Package, "_record_replication"
+        ) as record:
+            with pytest.raises(models.StorageException) as excinfo:
+                aip.create_replicas()
+
+        # The AIP is hashed once and every replicator is tried
+        assert get_source.call_count == 1
+        assert replicate_mock.call_count == 3
+        assert replicators[1].uuid in str(excinfo.value)
+        # The master pointer file records the successful replications in order
+        assert [c[0][1] for c in record.call_args_list] == ["event-0", "event-2"]
+
 
 class TestTransferPackage(TestCase):
     """Test integration of transfer reading and indexing.
@@ -0,0 +1,158 @@
+from __future__ import absolute_import
+import base64
+import json
+import os
+import shutil
+import tempfile
+
+import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from locations import models
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.abspath(os.path.join(THIS_DIR, "..", "fixtures", ""))
+
+AIP_UUID = "0d4e739b-bf60-4b87-bc20-67a379b28cea"
+
+
+class TestReplicationTask(TestCase):
+
+    fixtures = ["base.json", "package.json"]
+
+    def setUp(self):
+        models.Location.objects.filter(
+            uuid="615103f0-0ee0-4a12-ba17-43192d1143ea"
+        ).update(relative_path=FIXTURES_DIR[1:])
+        models.Location.objects.filter(purpose="SS").update(
+            relative_path=FIXTURES_DIR[1:]
+        )
+        self.tmp_dir = tempfile.mkdtemp()
+        self.aip = models.Package.objects.get(uuid=AIP_UUID)
+        self.aip.current_location.space.staging_path = tempfile.mkdtemp(
+            dir=self.tmp_dir
+        )
+        self.aip.current_location.space.save()
+        self.replicator = self.aip.current_location.replicators.create(
+            space=self.aip.current_location.space,
+            relative_path=tempfile.mkdtemp(dir=self.tmp_dir),
+            purpose=models.Location.REPLICATOR,
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_enqueue(self):
+        tasks = models.ReplicationTask.enqueue(self.aip)
+
+        assert [task.location for task in tasks] == [self.replicator]
+        assert tasks[0].status == models.ReplicationTask.PENDING
+        # Outstanding replications are not queued twice
+        assert models.ReplicationTask.enqueue(self.aip) == []
+
+    @override_settings(REPLICATION_QUEUE_ENABLED=True)
+    def test_store_aip_queues_replication(self):
+        with mock.patch.object(
+            models.Package, "_store_aip_to_pending"
+        ), mock.patch.object(
+            models.Package, "_store_aip_to_uploaded", return_value=(None, None)
+        ), mock.patch.object(
+            models.Package, "_store_aip_ensure_pointer_file"
+        ), mock.patch.object(
+            models.Package, "create_replicas"
+        ) as create_replicas:
+            self.aip.store_aip(None, None)
+
+        assert not create_replicas.called
+        assert self.aip.replication_tasks.get().location == self.replicator
+
+    def test_failed_replication_is_retried_and_resumed(self):
+        task = models.ReplicationTask.enqueue(self.aip)[0]
+
+        assert models.ReplicationTask.claim() == task
+        with mock.patch.object(
+            models.Package,
+            "_replicate_to",
+            side_effect=models.StorageException("Replicator is down"),
+        ):
+            assert not models.ReplicationTask.objects.get(pk=task.pk).run()
+
+        task = models.ReplicationTask.objects.get(pk=task.pk)
+        assert task.status == models.ReplicationTask.PENDING
+        assert task.attempts == 1
+        assert task.last_error == "Replicator is down"
+        assert task.next_attempt_time > timezone.now()
+        assert task.replica.status == models.Package.FAIL
+        failed_replica = task.replica
+        # Not due yet
+        assert models.ReplicationTask.claim() is None
+
+        task.next_attempt_time = timezone.now()
+        task.save()
+        task = models.ReplicationTask.claim()
+        assert task.attempts == 2
+        assert task.run()
+
+        task = models.ReplicationTask.objects.get(pk=task.pk)
+        assert task.status == models.ReplicationTask.DONE
+        assert task.last_error == ""
+        # The replica of the failed attempt is reused
+        assert self.aip.replicas.get() == failed_replica
+        assert task.replica.status == models.Package.UPLOADED
+        assert os.path.exists(task.replica.full_path)
+
+    @override_settings(REPLICATION_MAX_ATTEMPTS=1)
+    def test_replication_is_given_up(self):
+        models.ReplicationTask.enqueue(self.aip)
+        task = models.ReplicationTask.claim()
+        with mock.patch.object(
+            models.Package,
+            "_replicate_to",
+            side_effect=models.StorageException("Replicator is down"),
+        ):
+            assert not task.run()
+
+        task = models.ReplicationTask.objects.get(pk=task.pk)
+        assert task.status == models.ReplicationTask.FAILED
+        assert task.completed_time is not None
+        assert models.ReplicationTask.claim() is None
+
+    def test_requeue_stale(self):
+        models.ReplicationTask.enqueue(self.aip)
+        task = models.ReplicationTask.claim()
+
+        assert models.ReplicationTask.requeue_stale(60) == 0
+        models.ReplicationTask.objects.filter(pk=task.pk).update(
+            started_time=timezone.now() - timezone.timedelta(seconds=120)
+        )
+        assert models.ReplicationTask.requeue_stale(60) == 1
+        assert models.ReplicationTask.claim() == task
+
+    def test_lag(self):
+        models.ReplicationTask.enqueue(self.aip)
+
+        lag = {entry["location"]: entry for entry in models.ReplicationTask.lag()}
+
+        entry = lag[self.replicator.uuid]
+        assert entry["pending"] == 1
+        assert entry["running"] == 0
+        assert entry["failed"] == 0
+        assert entry["bytes_pending"] == self.aip.size
+        assert entry["oldest"] is not None
+
+    def test_lag_api(self):
+        User.objects.get(username="test").set_password("test")
+        self.client.defaults["HTTP_AUTHORIZATION"] = "Basic " + base64.b64encode(
+            b"test:test"
+        ).decode("utf8")
+        models.ReplicationTask.enqueue(self.aip)
+
+        response = self.client.get("/api/v2/replication/lag/")
+
+        assert response.status_code == 200
+        objects = json.loads(response.content.decode("utf8"))["objects"]
+        entry = [e for e in objects if e["location"] == self.replicator.uuid][0]
+        assert entry["pending"] == 1
@@ -0,0 +1,142 @@
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+import threading
+
+from django.test import TestCase
+import mock
+import pytest
+
+from common import progress
+from locations import models
+
+
+def _statvfs(free, total=10 ** 12, block_size=4096):
+    return mock.Mock(
+        f_bavail=free // block_size, f_blocks=total // block_size, f_frsize=block_size
+    )
+
+
+class TestStagingReservation(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filesystem = "{}:{}".format(
+            models.reservation.platform.node(), os.stat(self.tmp_dir).st_dev
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_reserve(self):
+        path = os.path.join(self.tmp_dir, "missing", "staging")
+        with mock.patch("os.statvfs", return_value=_statvfs(4096 * 10)):
+            with models.StagingReservation.reserve(path, 4096 * 5, "extract"):
+                reservation = models.StagingReservation.objects.get()
+                assert reservation.filesystem == self.filesystem
+                assert reservation.size == 4096 * 10
+                assert reservation.pid == os.getpid()
+        assert not models.StagingReservation.objects.exists()
+
+    def test_reserve_counts_earlier_reservations(self):
+        models.StagingReservation.objects.create(
+            filesystem=self.filesystem,
+            path=self.tmp_dir,
+            purpose="staging",
+            size=4096 * 6,
+            pid=os.getpid(),
+        )
+        # Reservations of dead processes are ignored
+        models.StagingReservation.objects.create(
+            filesystem=self.filesystem,
+            path=self.tmp_dir,
+            purpose="staging",
+            size=4096 * 6,
+            pid=2 ** 22 + 1,
+        )
+        with mock.patch("os.statvfs", return_value=_statvfs(4096 * 10)):
+            with models.StagingReservation.reserve(self.tmp_dir, 4096 * 4, "staging"):
+                pass
+            with pytest.raises(models.InsufficientStagingSpace):
+                with models.StagingReservation.reserve(
+                    self.tmp_dir, 4096 * 5, "staging"
+                ):
+                    pass
+        assert models.StagingReservation.objects.count() == 1
+
+    def test_waiting_reservations_dont_block_smaller_ones(self):
+        models.StagingReservation.objects.create(
+            filesystem=self.filesystem,
+            path=self.tmp_dir,
+            purpose="staging",
+            size=4096 * 3,
+            pid=os.getpid(),
+            admitted=True,
+        )
+        # Waiting for more than the free space
+        models.StagingReservation.objects.create(
+            filesystem=self.filesystem,
+            path=self.tmp_dir,
+            purpose="staging",
+            size=4096 * 8,
+            pid=os.getpid(),
+        )
+        with mock.patch("os.statvfs", return_value=_statvfs(4096 * 10)):
+            with models.StagingReservation.reserve(self.tmp_dir, 4096 * 7, "staging"):
+                assert models.StagingReservation.objects.get(size=4096 * 7).admitted
+            with pytest.raises(models.InsufficientStagingSpace):
+                with models.StagingReservation.reserve(
+                    self.tmp_dir, 4096 * 8, "staging"
+                ):
+                    pass
+
+    def test_bytes_written_by_admitted_operations_are_not_counted_twice(self):
+        copy_path = os.path.join(self.tmp_dir, "copy")
+        with open(copy_path, "wb") as f:
+            f.write(b"x" * 4096 * 4)
+        models.StagingReservation.objects.create(
+            filesystem=self.filesystem,
+            path=copy_path,
+            purpose="staging",
+            size=4096 * 6,
+            pid=os.getpid(),
+            admitted=True,
+        )
+        # The free space already excludes the bytes written in the copy
+        with mock.patch("os.statvfs", return_value=_statvfs(4096 * 10)):
+            with models.StagingReservation.reserve(
+                os.path.join(self.tmp_dir, "other"), 4096 * 8, "staging"
+            ):
+                pass
+            with pytest.raises(models.InsufficientStagingSpace):
+                with models.StagingReservation.reserve(
+                    os.path.join(self.tmp_dir, "other"), 4096 * 9, "staging"
+                ):
+                    pass
+
+    def test_reserve_never_fitting(self):
+        with mock.patch(
+            "os.statvfs", return_value=_statvfs(4096 * 10, total=4096 * 10)
+        ), pytest.raises(models.InsufficientStagingSpace):
+            with models.StagingReservation.reserve(
+                self.tmp_dir, 4096 * 11, "staging", timeout=60
+            ):
+                pass
+
+    def test_tasks_wait_for_space(self):
+        cancelled = threading.Event()
+        threading.Timer(0.1, cancelled.set).start()
+        with mock.patch("os.statvfs", return_value=_statvfs(0)), mock.patch.object(
+            models.reservation, "WAIT_POLL_SECONDS", 0.01
+        ), progress.tracking(lambda fields: None, cancelled=cancelled, task_id=1):
+            with pytest.raises(progress.TaskCancelled):
+                with models.StagingReservation.reserve(self.tmp_dir, 4096, "staging"):
+                    pass
+        assert not models.StagingReservation.objects.exists()
+
+    def test_reserve_disabled(self):
+        with self.settings(STAGING_RESERVATIONS_ENABLED=False), mock.patch(
+            "os.statvfs", return_value=_statvfs(0)
+        ):
+            with models.StagingReservation.reserve(self.tmp_dir, 4096, "staging"):
+                pass
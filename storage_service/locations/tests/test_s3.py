@@ -91,3 +91,48 @@ class TestS3Storage(TestCase):
         assert "timestamp" in properties
         assert properties["e_tag"] == '"e917f867114dedf9bdb430e838da647d"'
         assert properties["size"] == 1564
+
+    def test_copy_from_space_server_side(self):
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="test-bucket")
+        client.upload_file(
+            os.path.join(FIXTURES_DIR, "working_bag.zip"),
+            "test-bucket",
+            "archivematica/aips/bag.zip",
+        )
+
+        self.s3_object.copy_from_space(
+            self.s3_object.space,
+            "/archivematica/aips/bag.zip",
+            "/archivematica/replicas/bag.zip",
+        )
+
+        resp = client.head_object(
+            Bucket="test-bucket", Key="archivematica/replicas/bag.zip"
+        )
+        assert resp["ContentLength"] == 1564
+        # The source is left in place
+        client.head_object(Bucket="test-bucket", Key="archivematica/aips/bag.zip")
+
+    def test_copy_from_space_uploads_from_local_filesystem(self):
+        client = boto3.client("s3", region_name="us-east-1")
+        local_space = models.Space.objects.get(
+            access_protocol=models.Space.LOCAL_FILESYSTEM
+        )
+
+        self.s3_object.copy_from_space(
+            local_space,
+            os.path.join(FIXTURES_DIR, "working_bag.zip"),
+            "/archivematica/aips/bag.zip",
+        )
+
+        resp = client.head_object(
+            Bucket="test-bucket", Key="archivematica/aips/bag.zip"
+        )
+        assert resp["ContentLength"] == 1564
+
+    def test_copy_from_space_unsupported(self):
+        other_space = models.Space(access_protocol=models.Space.SWIFT)
+
+        with pytest.raises(models.PosixMoveUnsupportedError):
+            self.s3_object.copy_from_space(other_space, "/a", "/b")
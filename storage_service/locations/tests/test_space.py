@@ -1,7 +1,13 @@
 from __future__ import absolute_import
+import threading
+
+import mock
 import pytest
 from scandir import scandir
 
+from django.test import TestCase
+
+from locations import models
 from locations.models.space import path2browse_dict
 
 
@@ -130,3 +136,100 @@ def test_path2browse_dict_object_counting_ignores_read_protected_directories(
             "tree_a.txt": {"size": 6},
         },
     }
+
+
+class TestSpace(TestCase):
+
+    fixtures = ["base.json"]
+
+    def test_get_child_space_is_cached(self):
+        space = models.Space.objects.get(access_protocol=models.Space.LOCAL_FILESYSTEM)
+
+        with self.assertNumQueries(1):
+            child_space = space.get_child_space()
+            assert space.get_child_space() is child_space
+            assert child_space.space is space
+
+        space.save()
+        with self.assertNumQueries(1):
+            assert space.get_child_space() is not child_space
+
+    def test_get_child_space_is_not_shared_between_threads(self):
+        space = models.Space.objects.get(access_protocol=models.Space.LOCAL_FILESYSTEM)
+        child_space = space.get_child_space()
+        child_spaces = []
+
+        # Threads would not see the test transaction
+        with mock.patch.object(
+            models.LocalFilesystem.objects,
+            "get",
+            side_effect=lambda space: models.LocalFilesystem(space=space),
+        ):
+            thread = threading.Thread(
+                target=lambda: child_spaces.append(space.get_child_space())
+            )
+            thread.start()
+            thread.join()
+
+        assert child_spaces[0] is not child_space
+        assert child_spaces[0].space is space
+        assert space.get_child_space() is child_space
+
+    def test_move_rsync_keeps_partial_files_of_resumable_transfers(self):
+        space = models.Space.objects.get(access_protocol=models.Space.LOCAL_FILESYSTEM)
+        commands = []
+
+        def popen(command, stdout, **kwargs):
+            commands.append(command)
+            return mock.Mock(returncode=0, poll=mock.Mock(return_value=0))
+
+        with mock.patch(
+            "locations.models.space.subprocess.Popen", side_effect=popen
+        ), mock.patch("locations.models.space.progress.wait"):
+            space.move_rsync("user@host:/src", "/dest")
+            with models.space.resumable_transfers():
+                space.move_rsync("user@host:/src", "/dest")
+
+        assert not any(arg.startswith("--partial") for arg in commands[0])
+        assert "--partial-dir=.rsync-partial" in commands[1]
+
+    def test_moves_report_the_progress_of_packages_with_their_size(self):
+        space = models.Space.objects.get(access_protocol=models.Space.LOCAL_FILESYSTEM)
+        package = models.Package(size=1024)
+        stages = []
+        child_space = mock.Mock()
+
+        with mock.patch.object(
+            models.Space, "get_child_space", return_value=child_space
+        ), mock.patch(
+            "locations.models.space.progress.stage",
+            side_effect=lambda name, total: stages.append((name, total())),
+        ):
+            space.move_to_storage_service("src", "dest", space, package=package)
+            space.move_from_storage_service("dest", "dest", package=package)
+
+        assert stages == [
+            ("move_to_storage_service", 1024),
+            ("move_from_storage_service", 1024),
+        ]
+        child_space.move_to_storage_service.assert_called_once_with(
+            mock.ANY, mock.ANY, space
+        )
+
+    def test_moves_are_only_measured_for_metrics_if_enabled(self):
+        space = models.Space.objects.get(access_protocol=models.Space.LOCAL_FILESYSTEM)
+
+        with mock.patch.object(
+            models.Space, "get_child_space", return_value=mock.Mock()
+        ), mock.patch(
+            "locations.models.space.utils.recalculate_size", return_value=10
+        ) as recalculate_size:
+            with self.settings(PROMETHEUS_ENABLED=False):
+                space.move_to_storage_service("src", "dest", space)
+                space.move_from_storage_service("dest", "dest", package=None)
+            assert not recalculate_size.called
+
+            with self.settings(PROMETHEUS_ENABLED=True):
+                space.move_to_storage_service("src", "dest", space)
+                space.move_from_storage_service("dest", "dest", package=None)
+            assert recalculate_size.call_count == 2
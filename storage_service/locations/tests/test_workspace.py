@@ -0,0 +1,88 @@
+from __future__ import absolute_import
+import datetime
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+from django.utils import timezone
+
+from common import progress
+from locations import models
+
+
+class TestWorkspace(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _create(self, purpose, size=0):
+        path = models.Workspace.create(purpose, dir=self.tmp_dir)
+        with open(os.path.join(path, "file"), "wb") as f:
+            f.write(b"x" * size)
+        return path
+
+    def test_create_and_remove(self):
+        task = models.Async.objects.create()
+        with progress.tracking(lambda fields: None, task_id=task.id):
+            path = models.Workspace.create("extract", dir=self.tmp_dir)
+
+        workspace = models.Workspace.objects.get(path=path)
+        assert os.path.isdir(path)
+        assert workspace.task == task.id
+        assert workspace.pid == os.getpid()
+
+        models.Workspace.remove(path)
+        assert not os.path.exists(path)
+        assert not models.Workspace.objects.filter(path=path).exists()
+
+    def test_sweep(self):
+        running = models.Async.objects.create()
+        completed = models.Async.objects.create(completed=True)
+        deleted = models.Async.objects.create()
+        with progress.tracking(lambda fields: None, task_id=running.id):
+            in_use = self._create("fetch", 10)
+        with progress.tracking(lambda fields: None, task_id=completed.id):
+            left_by_task = self._create("extract", 20)
+        with progress.tracking(lambda fields: None, task_id=deleted.id):
+            left_by_restart = self._create("compress", 30)
+        deleted.delete()
+        recent = self._create("compress", 40)
+        old = self._create("fetch", 50)
+        models.Workspace.objects.filter(path=old).update(
+            created_time=timezone.now() - datetime.timedelta(days=3)
+        )
+        other_process = self._create("fetch", 70)
+        models.Workspace.objects.filter(path=other_process).update(pid=os.getppid())
+        dead_process = self._create("fetch", 60)
+        models.Workspace.objects.filter(path=dead_process).update(pid=2 ** 22 + 1)
+        gone = self._create("extract")
+        shutil.rmtree(gone)
+        other_host = self._create("extract")
+        shutil.rmtree(other_host)
+        models.Workspace.objects.filter(path=other_host).update(hostname="other")
+
+        abandoned = models.Workspace.sweep(max_age=24 * 60 * 60, dry_run=True)
+        assert sorted((w.path, w.size) for w in abandoned) == sorted(
+            [(left_by_task, 20), (left_by_restart, 30), (dead_process, 60)]
+        )
+        assert os.path.exists(dead_process)
+
+        models.Workspace.sweep(max_age=24 * 60 * 60)
+        # Only the workspaces of this process are measured, and those of other
+        # hosts are left to them
+        assert sorted(models.Workspace.objects.values_list("path", "size")) == sorted(
+            [
+                (in_use, 10),
+                (recent, 40),
+                (old, 50),
+                (other_process, None),
+                (other_host, None),
+            ]
+        )
+        for path in (left_by_task, left_by_restart, dead_process):
+            assert not os.path.exists(path)
+        assert os.path.exists(in_use)
+        assert os.path.exists(old)
@@ -259,11 +259,14 @@ LOGGING_CONFIG_FILE = "/etc/archivematica/storageService.logging.json"
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
-    "filters": {"require_debug_false": {"()": "django.utils.log.RequireDebugFalse"}},
+    "filters": {
+        "require_debug_false": {"()": "django.utils.log.RequireDebugFalse"},
+        "trace_id": {"()": "common.tracing.TraceIdFilter"},
+    },
     "formatters": {
         "simple": {"format": "%(levelname)-8s  %(name)s.%(funcName)s:  %(message)s"},
         "detailed": {
-            "format": "%(levelname)-8s  %(asctime)s  %(name)s:%(module)s:%(funcName)s:%(lineno)d:  %(message)s",
+            "format": "%(levelname)-8s  %(asctime)s  %(trace_id)s  %(name)s:%(module)s:%(funcName)s:%(lineno)d:  %(message)s",
             "datefmt": "%Y-%m-%d %H:%M:%S",
         },
     },
@@ -273,6 +276,7 @@ LOGGING = {
             "level": "DEBUG",
             "class": "logging.StreamHandler",
             "formatter": "detailed",
+            "filters": ["trace_id"],
         },
         "mail_admins": {
             "level": "ERROR",
@@ -467,16 +471,127 @@ if SHIBBOLETH_AUTHENTICATION:
 
     ALLOW_USER_EDITS = False
 
-# WARNING: if Gunicorn is being used to serve the Storage Service and its
-# worker class is set to `gevent`, then BagIt validation must use 1 process.
-# Otherwise, calls to `validate` will hang because of the incompatibility
-# between gevent and multiprocessing (BagIt) concurrency strategies. See
+# Number of processes validating bags, unless set for their space (e.g.
+# measured by the benchmark_bag_validation command): 0 uses one per CPU,
+# which only speeds up storage that serves parallel reads well. If Gunicorn
+# is being used to serve the Storage Service and its worker class is set to
+# `gevent`, BagIt validation always uses 1 process since calls to `validate`
+# would hang because of the incompatibility between gevent and
+# multiprocessing (BagIt) concurrency strategies. See
 # https://github.com/artefactual/archivematica/issues/708
 try:
     BAG_VALIDATION_NO_PROCESSES = int(environ.get("SS_BAG_VALIDATION_NO_PROCESSES", 1))
 except ValueError:
     BAG_VALIDATION_NO_PROCESSES = 1
 
+# Number of replicator locations a package is copied to concurrently. Each
+# copy runs in a thread of the process storing the package.
+try:
+    REPLICATION_MAX_WORKERS = int(environ.get("SS_REPLICATION_MAX_WORKERS", 4))
+except ValueError:
+    REPLICATION_MAX_WORKERS = 4
+
+# Number of threads used to finish the reingest of a package: the reingested
+# package is fetched while the current one is extracted, and the payload files
+# changed by the reingest are hashed concurrently.
+try:
+    REINGEST_MAX_WORKERS = int(environ.get("SS_REINGEST_MAX_WORKERS", 2))
+except ValueError:
+    REINGEST_MAX_WORKERS = 2
+
+# If enabled, storing a package only queues its replication (see
+# locations.models.ReplicationTask) and the replicas are created by the
+# process_replication_queue management command.
+REPLICATION_QUEUE_ENABLED = is_true(environ.get("SS_REPLICATION_QUEUE_ENABLED", ""))
+
+# Number of times a queued replication is attempted before it is given up on,
+# and delay in seconds before the first retry; the delay doubles after every
+# failed attempt, up to REPLICATION_RETRY_MAX_DELAY.
+try:
+    REPLICATION_MAX_ATTEMPTS = int(environ.get("SS_REPLICATION_MAX_ATTEMPTS", 10))
+except ValueError:
+    REPLICATION_MAX_ATTEMPTS = 10
+try:
+    REPLICATION_RETRY_DELAY = int(environ.get("SS_REPLICATION_RETRY_DELAY", 60))
+except ValueError:
+    REPLICATION_RETRY_DELAY = 60
+try:
+    REPLICATION_RETRY_MAX_DELAY = int(
+        environ.get("SS_REPLICATION_RETRY_MAX_DELAY", 6 * 60 * 60)
+    )
+except ValueError:
+    REPLICATION_RETRY_MAX_DELAY = 6 * 60 * 60
+
+# Number of threads used to compress and decompress packages: 0 lets the
+# compression programs use all CPUs, 1 disables the multi-threaded programs
+# (lbzip2, pbzip2, pigz) tar would otherwise use if installed.
+try:
+    COMPRESSION_THREADS = int(environ.get("SS_COMPRESSION_THREADS", 0))
+except ValueError:
+    COMPRESSION_THREADS = 0
+
+# Number of LOCKSS chunks of a package written at once when splitting it
+try:
+    LOCKSS_SPLIT_MAX_WORKERS = int(environ.get("SS_LOCKSS_SPLIT_MAX_WORKERS", 1))
+except ValueError:
+    LOCKSS_SPLIT_MAX_WORKERS = 1
+
+# Maximum size in bytes of the cache of the packages copied to the internal
+# location because they are not locally accessible (see
+# common.package_cache), 0 disables the cache.
+try:
+    PACKAGE_CACHE_SIZE = int(environ.get("SS_PACKAGE_CACHE_SIZE", 10 * 1024 ** 3))
+except ValueError:
+    PACKAGE_CACHE_SIZE = 10 * 1024 ** 3
+
+# Exporter of the spans of the storage operations (see common.tracing):
+# "none" drops them, "json" appends them to TRACING_FILE.
+TRACING_EXPORTER = environ.get("SS_TRACING_EXPORTER", "none")
+TRACING_FILE = environ.get(
+    "SS_TRACING_FILE", "/var/log/archivematica/storage-service/traces.json"
+)
+
+# Seconds a worker shutting down waits for its asynchronous tasks to finish
+# before cancelling them (see locations.models.async_manager). Must be less
+# than the graceful timeout of gunicorn, after which the worker is killed.
+try:
+    ASYNC_DRAIN_TIMEOUT = int(environ.get("SS_ASYNC_DRAIN_TIMEOUT", 60))
+except ValueError:
+    ASYNC_DRAIN_TIMEOUT = 60
+
+# If enabled, operations writing copies of packages to local staging or
+# temporary directories first reserve the space they need (see
+# locations.models.StagingReservation), keeping STAGING_FREE_SPACE_MARGIN bytes
+# free. Asynchronous tasks wait up to STAGING_WAIT_TIMEOUT seconds for the
+# space, requests fail at once.
+STAGING_RESERVATIONS_ENABLED = is_true(
+    environ.get("SS_STAGING_RESERVATIONS_ENABLED", "true")
+)
+try:
+    STAGING_FREE_SPACE_MARGIN = int(environ.get("SS_STAGING_FREE_SPACE_MARGIN", 0))
+except ValueError:
+    STAGING_FREE_SPACE_MARGIN = 0
+try:
+    STAGING_WAIT_TIMEOUT = int(environ.get("SS_STAGING_WAIT_TIMEOUT", 60 * 60))
+except ValueError:
+    STAGING_WAIT_TIMEOUT = 60 * 60
+
+# Seconds between two sweeps of the abandoned temporary workspaces (see
+# locations.models.Workspace) by each worker, 0 disables them, and seconds
+# after which a workspace not used by an asynchronous task is abandoned if
+# its process, on another host, can't be checked, the gunicorn timeout by
+# default.
+try:
+    WORKSPACE_SWEEP_INTERVAL = int(environ.get("SS_WORKSPACE_SWEEP_INTERVAL", 600))
+except ValueError:
+    WORKSPACE_SWEEP_INTERVAL = 600
+try:
+    WORKSPACE_MAX_AGE = int(
+        environ.get("SS_WORKSPACE_MAX_AGE", environ.get("SS_GUNICORN_TIMEOUT", 172800))
+    )
+except ValueError:
+    WORKSPACE_MAX_AGE = 172800
+
 GNUPG_HOME_PATH = environ.get("SS_GNUPG_HOME_PATH", None)
 
 # SS uses a Python HTTP library called requests. If this setting is set to True,
@@ -36,6 +36,16 @@ LOGGING = {
     "root": {"handlers": ["console"], "level": "WARNING"},
 }
 
+# Validate bags in the test process
+BAG_VALIDATION_NO_PROCESSES = 1
+
+# Replicate inline: threads would not see the test transaction
+REPLICATION_MAX_WORKERS = 1
+REINGEST_MAX_WORKERS = 1
+
+# Do not cache fetched packages in the fixtures
+PACKAGE_CACHE_SIZE = 0
+
 # Disable whitenoise
 STATICFILES_STORAGE = None
 if MIDDLEWARE_CLASSES[0] == "whitenoise.middleware.WhiteNoiseMiddleware":